@@ -1,5 +1,6 @@
 from django.contrib import admin
-from .models import Conductor, Lugar
+from django.utils import timezone
+from .models import Conductor, Geocodificacion, Lugar, Tarea, TareaPeriodica
 
 
 @admin.register(Conductor)
@@ -41,3 +42,54 @@ class LugarAdmin(admin.ModelAdmin):
         }),
     )
     readonly_fields = ('creado_en',)
+
+
+@admin.register(Tarea)
+class TareaAdmin(admin.ModelAdmin):
+    list_display = ('funcion', 'estado', 'prioridad', 'ejecutar_en', 'intentos', 'max_intentos', 'trabajador', 'terminada_en')
+    list_filter = ('estado', 'funcion')
+    search_fields = ('funcion', 'error')
+    date_hierarchy = 'creada_en'
+    actions = ['reintentar']
+    fieldsets = (
+        ('Tarea', {
+            'fields': ('funcion', 'parametros', 'prioridad', 'ejecutar_en', 'max_intentos', 'periodica')
+        }),
+        ('Ejecución', {
+            'fields': ('estado', 'intentos', 'trabajador', 'bloqueada_hasta', 'iniciada_en', 'terminada_en', 'resultado', 'error')
+        }),
+        ('Metadatos', {
+            'fields': ('creada_en',),
+            'classes': ('collapse',)
+        }),
+    )
+    readonly_fields = ('estado', 'intentos', 'trabajador', 'bloqueada_hasta', 'iniciada_en', 'terminada_en', 'resultado', 'error', 'creada_en')
+
+    @admin.action(description='Reintentar las tareas fallidas seleccionadas')
+    def reintentar(self, request, queryset):
+        total = queryset.filter(estado='fallida').update(
+            estado='pendiente', intentos=0, ejecutar_en=timezone.now(), terminada_en=None,
+        )
+        self.message_user(request, f'{total} tareas vueltas a encolar.')
+
+
+@admin.register(TareaPeriodica)
+class TareaPeriodicaAdmin(admin.ModelAdmin):
+    list_display = ('nombre', 'funcion', 'intervalo', 'prioridad', 'activa', 'ultima_ejecucion', 'proxima_ejecucion')
+    list_filter = ('activa',)
+    search_fields = ('nombre', 'funcion')
+    readonly_fields = ('ultima_ejecucion',)
+
+
+@admin.register(Geocodificacion)
+class GeocodificacionAdmin(admin.ModelAdmin):
+    """
+    Borrar una fila obliga a volver a consultar el servicio la próxima vez.
+    """
+    list_display = ('clave', 'tipo', 'usos', 'actualizada_en')
+    list_filter = ('tipo',)
+    search_fields = ('clave',)
+    readonly_fields = ('clave', 'tipo', 'respuesta', 'usos', 'creada_en', 'actualizada_en')
+
+    def has_add_permission(self, request):
+        return False
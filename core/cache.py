@@ -0,0 +1,128 @@
+"""
+Caché de páginas con claves versionadas por modelo.
+
+Cada modelo tiene un número de versión en la caché. Las páginas se guardan
+bajo una clave que incluye las versiones de los modelos de los que dependen,
+así que al guardar o borrar un registro (ver core.signals) basta con subir la
+versión de su modelo: las páginas antiguas dejan de encontrarse y caducan
+solas, sin tener que buscarlas ni borrarlas. Las versiones tienen que vivir
+en una caché compartida por todos los procesos ('file' o 'redis').
+"""
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.contrib import messages
+from django.core.cache import caches
+from django.db import transaction
+from django.utils import timezone
+from django.utils.connection import ConnectionProxy
+
+DURACION_PAGINAS = getattr(settings, 'CACHE_PAGINAS_SEGUNDOS', 60 * 15)
+# Alias de CACHES para las claves versionadas. Sin una caché compartida entre
+# procesos es DummyCache (ver settings): la versión solo subiría en el proceso
+# que edita y los demás servirían páginas viejas.
+cache_versionada = ConnectionProxy(caches, 'versionada')
+
+
+def _clave_version(modelo):
+    return f'version:{modelo._meta.label_lower}'
+
+
+def versiones(modelos):
+    """
+    Versión actual de cada modelo, en una sola lectura a la caché. Si una
+    versión no existe (primer uso o expulsada por la caché) se crea a partir
+    del reloj, para no repetir nunca una versión anterior.
+    """
+    claves = [_clave_version(modelo) for modelo in modelos]
+    actuales = cache_versionada.get_many(claves)
+    for clave in claves:
+        if clave not in actuales:
+            cache_versionada.add(clave, time.time_ns(), None)
+            actuales[clave] = cache_versionada.get(clave)
+    return [actuales[clave] for clave in claves]
+
+
+def _subir_versiones(modelos):
+    for modelo in modelos:
+        clave = _clave_version(modelo)
+        try:
+            cache_versionada.incr(clave)
+        except ValueError:
+            cache_versionada.set(clave, time.time_ns(), None)
+
+
+def invalidar_modelos(*modelos):
+    """
+    Descarta todo lo cacheado que dependa de los modelos indicados.
+
+    La versión se sube de inmediato y otra vez al confirmar la transacción:
+    una lectura concurrente que vuelva a cachear los datos antiguos antes del
+    commit queda bajo una versión que ya no se usa.
+    """
+    _subir_versiones(modelos)
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(lambda: _subir_versiones(modelos))
+
+
+def clave_versionada(nombre, modelos, *partes):
+    valores = [str(v) for v in versiones(modelos)] + [str(p) for p in partes]
+    resumen = hashlib.md5('|'.join(valores).encode()).hexdigest()
+    return f'{nombre}:{resumen}'
+
+
+def _cacheable(request):
+    # Los mensajes flash se muestran una sola vez y no deben quedar en la caché
+    return request.method in ('GET', 'HEAD') and not len(messages.get_messages(request))
+
+
+def cache_por_modelos(*modelos, duracion=None):
+    """
+    Decorador de vistas: cachea la respuesta renderizada bajo una clave que
+    incluye la ruta completa (con parámetros), la fecha del día y la versión
+    de los modelos indicados.
+    """
+    def decorador(vista):
+        clase = getattr(vista, 'view_class', vista)
+        nombre = f'{clase.__module__}.{clase.__qualname__}'
+
+        @wraps(vista)
+        def envoltura(request, *args, **kwargs):
+            if not _cacheable(request):
+                return vista(request, *args, **kwargs)
+            clave = clave_versionada(
+                f'pagina:{nombre}', modelos,
+                request.get_full_path(), timezone.localdate(),
+            )
+            respuesta = cache_versionada.get(clave)
+            if respuesta is not None:
+                return respuesta
+
+            respuesta = vista(request, *args, **kwargs)
+
+            def guardar(respuesta):
+                # Una página con token CSRF pertenece a la sesión que la pidió
+                if respuesta.status_code == 200 and not request.META.get('CSRF_COOKIE_NEEDS_UPDATE'):
+                    cache_versionada.set(clave, respuesta, DURACION_PAGINAS if duracion is None else duracion)
+
+            if hasattr(respuesta, 'render') and callable(respuesta.render) and not respuesta.is_rendered:
+                respuesta.add_post_render_callback(guardar)
+            else:
+                guardar(respuesta)
+            return respuesta
+        return envoltura
+    return decorador
+
+
+class CacheModelosMixin:
+    """
+    Mixin para vistas basadas en clases; los modelos van en modelos_cache.
+    """
+    modelos_cache = ()
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        vista = super().as_view(**initkwargs)
+        return cache_por_modelos(*cls.modelos_cache)(vista)
@@ -0,0 +1,139 @@
+"""
+Indicadores del panel de inicio.
+
+Se calculan con una consulta agregada por bloque y se guardan en caché bajo
+una clave versionada por los modelos de los que dependen (ver core.cache):
+cualquier save/delete de esos modelos la invalida. Con la caché caliente el
+panel no consulta la base de datos.
+"""
+from datetime import datetime, time, timedelta
+
+from django.apps import apps
+from django.db.models import Count, Q, Sum
+from django.utils import timezone
+
+from .cache import cache_versionada, clave_versionada
+
+DIAS_POR_VENCER = 30
+DOCUMENTOS_A_MOSTRAR = 10
+MANTENIMIENTOS_A_MOSTRAR = 10
+# Las versiones cambian con cada edición; la clave incluye el día
+DURACION_CACHE = 60 * 60 * 24
+MODELOS_DASHBOARD = (
+    ('flota', 'Bus'),
+    ('flota', 'DocumentoVehiculo'),
+    ('flota', 'PronosticoMantenimiento'),
+    ('viajes', 'Viaje'),
+    ('viajes', 'ViajePasajero'),
+    ('costos', 'ResumenCosto'),
+)
+
+
+def obtener_indicadores():
+    """
+    Devuelve los indicadores del día desde la caché o, si no están, los
+    calcula y los guarda.
+    """
+    hoy = timezone.localdate()
+    modelos = [apps.get_model(app_label, nombre) for app_label, nombre in MODELOS_DASHBOARD]
+    clave = clave_versionada('dashboard', modelos, hoy)
+    datos = cache_versionada.get(clave)
+    if datos is None:
+        datos = calcular_indicadores(hoy)
+        cache_versionada.set(clave, datos, DURACION_CACHE)
+    return datos
+
+
+def calcular_indicadores(hoy):
+    Bus = apps.get_model('flota', 'Bus')
+    DocumentoVehiculo = apps.get_model('flota', 'DocumentoVehiculo')
+    PronosticoMantenimiento = apps.get_model('flota', 'PronosticoMantenimiento')
+    Viaje = apps.get_model('viajes', 'Viaje')
+    ResumenCosto = apps.get_model('costos', 'ResumenCosto')
+
+    buses = {
+        fila['estado']: fila['total']
+        for fila in Bus.objects.order_by().values('estado').annotate(total=Count('id'))
+    }
+
+    inicio_dia = timezone.make_aware(datetime.combine(hoy, time.min))
+    viajes_hoy = list(
+        Viaje.objects
+        .filter(fecha_salida__gte=inicio_dia, fecha_salida__lt=inicio_dia + timedelta(days=1))
+        .order_by()
+        .values('estado')
+        .annotate(
+            total=Count('id'),
+            vendidos=Sum('pasajeros_confirmados'),
+            capacidad=Sum('bus__capacidad_pasajeros'),
+        )
+    )
+    estados_viaje = dict(Viaje.ESTADO_VIAJE)
+    activos = [fila for fila in viajes_hoy if fila['estado'] != 'cancelado']
+    asientos_vendidos = sum(fila['vendidos'] or 0 for fila in activos)
+    asientos_totales = sum(fila['capacidad'] or 0 for fila in activos)
+
+    limite = hoy + timedelta(days=DIAS_POR_VENCER)
+    documentos = DocumentoVehiculo.objects.aggregate(
+        por_vencer=Count('id', filter=Q(fecha_vencimiento__gte=hoy, fecha_vencimiento__lte=limite)),
+        vencidos=Count('id', filter=Q(fecha_vencimiento__lt=hoy)),
+    )
+    proximos = [
+        {
+            'bus': documento.bus.placa,
+            'tipo': documento.get_tipo_display(),
+            'fecha_vencimiento': documento.fecha_vencimiento,
+            'dias': (documento.fecha_vencimiento - hoy).days,
+        }
+        for documento in DocumentoVehiculo.objects
+        .filter(fecha_vencimiento__gte=hoy, fecha_vencimiento__lte=limite)
+        .select_related('bus')
+        .only('tipo', 'fecha_vencimiento', 'bus__placa')
+        .order_by('fecha_vencimiento')[:DOCUMENTOS_A_MOSTRAR]
+    ]
+
+    # Pronósticos de flota/pronostico.py; los atrasados también cuentan
+    pronosticos = PronosticoMantenimiento.objects.filter(fecha_proxima__lte=limite)
+    mantenimientos_proximos = [
+        {
+            'bus': pronostico.bus.placa,
+            'fecha_proxima': pronostico.fecha_proxima,
+            'km_proximo': pronostico.km_proximo,
+            'costo_esperado': pronostico.costo_esperado,
+            'dias': (pronostico.fecha_proxima - hoy).days,
+        }
+        for pronostico in pronosticos
+        .select_related('bus')
+        .only('fecha_proxima', 'km_proximo', 'costo_esperado', 'bus__placa')
+        .order_by('fecha_proxima')[:MANTENIMIENTOS_A_MOSTRAR]
+    ]
+
+    gasto = ResumenCosto.objects.filter(mes=hoy.replace(day=1)).aggregate(
+        viajes=Sum('costo_viajes'),
+        mantenimiento=Sum('mantenimiento_flota'),
+    )
+
+    return {
+        'fecha': hoy,
+        'buses': [
+            {'estado': estado, 'nombre': nombre, 'total': buses.get(estado, 0)}
+            for estado, nombre in Bus.ESTADO_CHOICES
+        ],
+        'total_buses': sum(buses.values()),
+        'viajes_hoy': [
+            {'estado': fila['estado'], 'nombre': estados_viaje.get(fila['estado'], fila['estado']), 'total': fila['total']}
+            for fila in viajes_hoy
+        ],
+        'total_viajes_hoy': sum(fila['total'] for fila in viajes_hoy),
+        'asientos_vendidos': asientos_vendidos,
+        'asientos_totales': asientos_totales,
+        'ocupacion': round(100 * asientos_vendidos / asientos_totales) if asientos_totales else 0,
+        'documentos_por_vencer': documentos['por_vencer'],
+        'documentos_vencidos': documentos['vencidos'],
+        'documentos_proximos': proximos,
+        'mantenimientos_por_realizar': pronosticos.count(),
+        'mantenimientos_proximos': mantenimientos_proximos,
+        'gasto_viajes': gasto['viajes'] or 0,
+        'gasto_mantenimiento': gasto['mantenimiento'] or 0,
+        'gasto_mes': (gasto['viajes'] or 0) + (gasto['mantenimiento'] or 0),
+    }
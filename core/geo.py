@@ -0,0 +1,166 @@
+"""
+Distancias geográficas y búsquedas por cercanía sobre Lugar.
+
+distancia_km / distancias_km calculan la distancia de círculo máximo
+(haversine) de un par o, vectorizada, de muchos pares a la vez.
+
+Cada lugar guarda la celda de una grilla de TAMANO_CELDA grados
+(celda_lat, celda_lon) con un índice compuesto. Una búsqueda por radio lee
+solo las celdas que cubren el rectángulo que contiene al círculo
+(celda_lat IN (...) AND celda_lon BETWEEN ...), que el índice resuelve sin
+recorrer la tabla, y calcula la distancia exacta solo para esos candidatos.
+
+Los n más cercanos se buscan con radios que se duplican hasta juntar n
+lugares dentro del radio buscado (un lugar fuera del círculo puede no ser
+el siguiente más cercano) o hasta RADIO_MAXIMO_KM.
+
+La grilla no cruza el antimeridiano (longitud ±180): suficiente para una
+flota que opera en un mismo país.
+"""
+import math
+from decimal import Decimal
+
+from django.apps import apps as django_apps
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+RADIO_TIERRA_KM = 6371.0088
+KM_POR_GRADO = math.pi * RADIO_TIERRA_KM / 180
+# ~5,5 km por lado en el ecuador
+TAMANO_CELDA = 0.05
+# Más filas de celdas que esto se consultan como rango
+MAX_CELDAS_IN = 64
+RADIO_MAXIMO_KM = 2000
+
+
+def haversine_km(latitud_origen, longitud_origen, latitud_destino, longitud_destino):
+    """
+    Distancia de círculo máximo entre dos puntos, en km.
+    """
+    fi1, fi2 = math.radians(float(latitud_origen)), math.radians(float(latitud_destino))
+    delta_fi = fi2 - fi1
+    delta_lambda = math.radians(float(longitud_destino) - float(longitud_origen))
+    a = math.sin(delta_fi / 2) ** 2 + math.cos(fi1) * math.cos(fi2) * math.sin(delta_lambda / 2) ** 2
+    return 2 * RADIO_TIERRA_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def _decimal(km):
+    return Decimal(str(round(km, 2)))
+
+
+def distancia_km(latitud_origen, longitud_origen, latitud_destino, longitud_destino):
+    """
+    Distancia de haversine en km con dos decimales, como se guarda en la
+    base de datos. None si falta alguna coordenada.
+    """
+    if None in (latitud_origen, longitud_origen, latitud_destino, longitud_destino):
+        return None
+    return _decimal(haversine_km(latitud_origen, longitud_origen, latitud_destino, longitud_destino))
+
+
+def distancias_km(latitud_origen, longitud_origen, latitud_destino, longitud_destino):
+    """
+    Versión vectorizada de distancia_km: recibe cuatro secuencias alineadas
+    (None donde falta la coordenada) y devuelve la lista de distancias. Usa
+    NumPy si está instalado.
+    """
+    if np is None:
+        return [distancia_km(*fila) for fila in zip(latitud_origen, longitud_origen, latitud_destino, longitud_destino)]
+    lat1, lon1, lat2, lon2 = (
+        np.radians(np.array(valores, dtype=float))
+        for valores in (latitud_origen, longitud_origen, latitud_destino, longitud_destino)
+    )
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    km = 2 * RADIO_TIERRA_KM * np.arcsin(np.minimum(1.0, np.sqrt(a)))
+    return [None if math.isnan(valor) else _decimal(valor) for valor in km.tolist()]
+
+
+def celda(latitud, longitud):
+    """
+    Celda de la grilla que contiene el punto; (None, None) sin coordenadas.
+    """
+    if latitud is None or longitud is None:
+        return None, None
+    return math.floor(float(latitud) / TAMANO_CELDA), math.floor(float(longitud) / TAMANO_CELDA)
+
+
+def _candidatos(queryset, latitud, longitud, radio_km):
+    delta_lat = radio_km / KM_POR_GRADO
+    coseno = max(math.cos(math.radians(latitud)), 0.01)
+    delta_lon = min(radio_km / (KM_POR_GRADO * coseno), 180)
+    lat_min, lon_min = celda(latitud - delta_lat, longitud - delta_lon)
+    lat_max, lon_max = celda(latitud + delta_lat, longitud + delta_lon)
+    if lat_max - lat_min < MAX_CELDAS_IN:
+        queryset = queryset.filter(celda_lat__in=range(lat_min, lat_max + 1))
+    else:
+        queryset = queryset.filter(celda_lat__range=(lat_min, lat_max))
+    filas = queryset.filter(celda_lon__range=(lon_min, lon_max)).values_list('pk', 'latitud', 'longitud')
+    return sorted(
+        (distancia, pk)
+        for pk, lat, lon in filas
+        for distancia in [haversine_km(latitud, longitud, lat, lon)]
+        if distancia <= radio_km
+    )
+
+
+def _lugares(distancias):
+    Lugar = django_apps.get_model('core', 'Lugar')
+    lugares = Lugar.objects.in_bulk([pk for _, pk in distancias])
+    resultado = []
+    for distancia, pk in distancias:
+        lugar = lugares[pk]
+        lugar.distancia_km = round(distancia, 2)
+        resultado.append(lugar)
+    return resultado
+
+
+def en_radio(latitud, longitud, radio_km, limite=None, queryset=None):
+    """
+    Lugares a no más de radio_km del punto, del más cercano al más lejano,
+    con el atributo distancia_km.
+    """
+    Lugar = django_apps.get_model('core', 'Lugar')
+    queryset = Lugar.objects.all() if queryset is None else queryset
+    distancias = _candidatos(queryset, float(latitud), float(longitud), radio_km)
+    return _lugares(distancias[:limite])
+
+
+def mas_cercanos(latitud, longitud, n=5, queryset=None, radio_maximo_km=RADIO_MAXIMO_KM):
+    """
+    Los n lugares más cercanos al punto (hasta radio_maximo_km), con el
+    atributo distancia_km.
+    """
+    Lugar = django_apps.get_model('core', 'Lugar')
+    queryset = Lugar.objects.all() if queryset is None else queryset
+    latitud, longitud = float(latitud), float(longitud)
+    radio = TAMANO_CELDA * KM_POR_GRADO
+    while True:
+        radio = min(radio, radio_maximo_km)
+        distancias = _candidatos(queryset, latitud, longitud, radio)
+        if len(distancias) >= n or radio >= radio_maximo_km:
+            return _lugares(distancias[:n])
+        radio *= 2
+
+
+def reconstruir_celdas(apps=None, tamano_lote=1000):
+    """
+    Recalcula la celda de todos los lugares por lotes. Recibe el registro de
+    apps para poder usarse desde una migración.
+    """
+    Lugar = (apps or django_apps).get_model('core', 'Lugar')
+    lote = []
+    total = 0
+    for pk, latitud, longitud in Lugar.objects.order_by('pk').values_list('pk', 'latitud', 'longitud').iterator(chunk_size=tamano_lote):
+        celda_lat, celda_lon = celda(latitud, longitud)
+        lote.append(Lugar(pk=pk, celda_lat=celda_lat, celda_lon=celda_lon))
+        if len(lote) >= tamano_lote:
+            Lugar.objects.bulk_update(lote, ['celda_lat', 'celda_lon'])
+            total += len(lote)
+            lote = []
+    if lote:
+        Lugar.objects.bulk_update(lote, ['celda_lat', 'celda_lon'])
+        total += len(lote)
+    return total
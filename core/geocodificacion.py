@@ -0,0 +1,214 @@
+"""
+Geocodificación (búsqueda de direcciones e inversa) a través del servidor.
+
+El formulario de lugares consulta los endpoints de core en lugar de llamar
+al servicio externo desde el navegador:
+
+- Caché persistente: cada respuesta se guarda en Geocodificacion bajo la
+  consulta normalizada (minúsculas, espacios colapsados) o las coordenadas
+  redondeadas a DECIMALES_COORDENADAS (~11 m). Una consulta repetida se
+  responde desde la base de datos, sin salir del servidor, mientras la fila
+  tenga menos de GEOCODIFICACION_DIAS días.
+- Consultas en curso: si varias peticiones del mismo proceso piden la misma
+  clave a la vez, solo una consulta el servicio y las demás esperan su
+  resultado.
+- Límite de salida compartido: como máximo una consulta al servicio cada
+  GEOCODIFICACION_INTERVALO segundos. Los turnos se reservan en una fila de
+  TurnoServicio bloqueada con select_for_update, así que el límite vale para
+  todos los procesos que usan la misma base de datos (la caché de Django no
+  sirve: locmem es de cada proceso y el motor 'file' no reserva claves de
+  forma atómica). Si no hay turno libre en GEOCODIFICACION_ESPERA_MAXIMA
+  segundos se lanza LimiteExcedido.
+- Proveedor intercambiable: GEOCODIFICACION_PROVEEDOR es la ruta de una
+  clase con buscar(consulta, pais, limite) e inversa(latitud, longitud); por
+  defecto Nominatim (OpenStreetMap).
+"""
+import json
+import re
+import threading
+import time
+import unicodedata
+from concurrent.futures import Future
+from datetime import timedelta
+from urllib.error import URLError
+from urllib.parse import urlencode
+from urllib.request import Request, urlopen
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import Geocodificacion, TurnoServicio
+
+DECIMALES_COORDENADAS = 4
+LARGO_MAXIMO_CONSULTA = 200
+LIMITE_RESULTADOS = 8
+SERVICIO = 'geocodificacion'
+
+_en_curso = {}
+_en_curso_lock = threading.Lock()
+
+
+class LimiteExcedido(Exception):
+    """
+    No hubo turno libre para consultar el servicio dentro de la espera
+    máxima.
+    """
+    def __init__(self, espera):
+        super().__init__('Demasiadas consultas de geocodificación; intente de nuevo en unos segundos.')
+        self.espera = espera
+
+
+class ServicioNoDisponible(Exception):
+    """
+    El servicio de geocodificación falló o devolvió una respuesta inválida.
+    """
+
+
+# Proveedores
+class Nominatim:
+    """
+    API pública de Nominatim. Su política de uso pide como máximo una
+    consulta por segundo y un User-Agent que identifique a la aplicación.
+    """
+    URL = 'https://nominatim.openstreetmap.org'
+
+    def __init__(self):
+        self.url = getattr(settings, 'GEOCODIFICACION_URL', self.URL)
+        self.user_agent = getattr(settings, 'GEOCODIFICACION_USER_AGENT', 'sistema-flota')
+        self.timeout = getattr(settings, 'GEOCODIFICACION_TIMEOUT', 10)
+
+    def _get(self, ruta, parametros):
+        peticion = Request(
+            f'{self.url}/{ruta}?{urlencode(parametros)}',
+            headers={'User-Agent': self.user_agent, 'Accept-Language': 'es'},
+        )
+        with urlopen(peticion, timeout=self.timeout) as respuesta:
+            return json.load(respuesta)
+
+    def buscar(self, consulta, pais=None, limite=LIMITE_RESULTADOS):
+        parametros = {'format': 'json', 'q': consulta, 'limit': limite, 'addressdetails': 1}
+        if pais:
+            parametros['countrycodes'] = pais
+        return self._get('search', parametros)
+
+    def inversa(self, latitud, longitud):
+        return self._get('reverse', {
+            'format': 'json', 'lat': latitud, 'lon': longitud, 'zoom': 18, 'addressdetails': 1,
+        })
+
+
+def obtener_proveedor():
+    return import_string(getattr(settings, 'GEOCODIFICACION_PROVEEDOR', 'core.geocodificacion.Nominatim'))()
+
+
+# Límite de salida y consultas en curso
+def esperar_turno():
+    """
+    Reserva el próximo turno libre para una consulta al servicio y espera a
+    que llegue. La fila de TurnoServicio se bloquea solo mientras se reserva
+    (no durante la espera ni la consulta): dos procesos no reservan el mismo
+    turno.
+    """
+    intervalo = timedelta(seconds=getattr(settings, 'GEOCODIFICACION_INTERVALO', 1))
+    espera_maxima = getattr(settings, 'GEOCODIFICACION_ESPERA_MAXIMA', 5)
+    TurnoServicio.objects.get_or_create(servicio=SERVICIO)
+    with transaction.atomic():
+        turno = TurnoServicio.objects.select_for_update().get(servicio=SERVICIO)
+        ahora = timezone.now()
+        reservado = max(ahora, turno.siguiente)
+        espera = (reservado - ahora).total_seconds()
+        if espera > espera_maxima:
+            raise LimiteExcedido(espera)
+        turno.siguiente = reservado + intervalo
+        turno.save(update_fields=['siguiente'])
+    if espera > 0:
+        time.sleep(espera)
+
+
+def coalescer(clave, funcion):
+    """
+    Ejecuta funcion() una sola vez para todas las llamadas simultáneas con la
+    misma clave en este proceso; las demás reciben el mismo resultado (o la
+    misma excepción).
+    """
+    with _en_curso_lock:
+        futuro = _en_curso.get(clave)
+        lider = futuro is None
+        if lider:
+            futuro = _en_curso[clave] = Future()
+    if not lider:
+        return futuro.result()
+    try:
+        resultado = funcion()
+    except BaseException as e:
+        futuro.set_exception(e)
+        raise
+    else:
+        futuro.set_result(resultado)
+        return resultado
+    finally:
+        with _en_curso_lock:
+            _en_curso.pop(clave, None)
+
+
+def _llamar(metodo, *args):
+    esperar_turno()
+    try:
+        return metodo(*args)
+    except (URLError, OSError, ValueError) as e:
+        raise ServicioNoDisponible(f'{type(e).__name__}: {e}') from e
+
+
+def _consultar(clave, tipo, obtener):
+    vigencia = timezone.now() - timedelta(days=getattr(settings, 'GEOCODIFICACION_DIAS', 30))
+    guardada = Geocodificacion.objects.filter(clave=clave, actualizada_en__gte=vigencia).first()
+    if guardada is not None:
+        Geocodificacion.objects.filter(pk=guardada.pk).update(usos=F('usos') + 1)
+        return guardada.respuesta
+
+    def consultar_y_guardar():
+        respuesta = obtener()
+        Geocodificacion.objects.update_or_create(
+            clave=clave, defaults={'tipo': tipo, 'respuesta': respuesta, 'actualizada_en': timezone.now()},
+        )
+        return respuesta
+    return coalescer(clave, consultar_y_guardar)
+
+
+# Consultas
+def normalizar(consulta):
+    consulta = unicodedata.normalize('NFC', str(consulta))
+    return re.sub(r'\s+', ' ', consulta).strip().lower()[:LARGO_MAXIMO_CONSULTA]
+
+
+def buscar(consulta):
+    """
+    Resultados de una búsqueda de texto: primero en GEOCODIFICACION_PAIS y,
+    si no hay ninguno, en todo el mundo. Se guarda el resultado final.
+    """
+    consulta = normalizar(consulta)
+    pais = getattr(settings, 'GEOCODIFICACION_PAIS', 'ec')
+
+    def obtener():
+        proveedor = obtener_proveedor()
+        resultados = _llamar(proveedor.buscar, consulta, pais, LIMITE_RESULTADOS)
+        if not resultados and pais:
+            resultados = _llamar(proveedor.buscar, consulta, None, LIMITE_RESULTADOS)
+        return resultados
+    return _consultar(f'busqueda:{pais}:{consulta}', 'busqueda', obtener)
+
+
+def inversa(latitud, longitud):
+    """
+    Dirección de un punto. Las coordenadas se redondean antes de consultar,
+    así que los clics cercanos comparten la misma fila.
+    """
+    latitud = round(float(latitud), DECIMALES_COORDENADAS)
+    longitud = round(float(longitud), DECIMALES_COORDENADAS)
+
+    def obtener():
+        return _llamar(obtener_proveedor().inversa, latitud, longitud)
+    return _consultar(f'inversa:{latitud:.{DECIMALES_COORDENADAS}f},{longitud:.{DECIMALES_COORDENADAS}f}', 'inversa', obtener)
@@ -0,0 +1,22 @@
+import time
+
+from django.core.management.base import BaseCommand
+from core.matriz import TAMANO_LOTE, reconstruir, todos_los_pares
+
+
+class Command(BaseCommand):
+    help = (
+        'Reconstruye la matriz de distancias entre lugares: los pares usados en '
+        'viajes o, con --todos, todos los pares con coordenadas.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--todos', action='store_true', help='Todos los pares de lugares')
+        parser.add_argument('--lote', type=int, default=TAMANO_LOTE, help='Pares por lote')
+
+    def handle(self, *args, **options):
+        inicio = time.monotonic()
+        total = reconstruir(todos=options['todos'] or todos_los_pares(), tamano_lote=options['lote'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Matriz de distancias reconstruida: {total} pares en {time.monotonic() - inicio:.2f} s'
+        ))
@@ -0,0 +1,66 @@
+import signal
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+
+from core.tareas import (
+    ejecutar, nombre_trabajador, programar_periodicas, recuperar_bloqueadas,
+    sincronizar_periodicas, tomar_tareas,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Ejecuta las tareas en segundo plano de la cola (core.tareas). Se pueden '
+        'lanzar varios trabajadores a la vez; SIGTERM o Ctrl+C terminan la tarea '
+        'en curso antes de salir.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--intervalo', type=float, default=1.0,
+            help='Segundos de espera cuando no hay tareas (por defecto 1)',
+        )
+        parser.add_argument(
+            '--lote', type=int, default=1,
+            help='Tareas que se toman en cada consulta (por defecto 1)',
+        )
+        parser.add_argument(
+            '--una-vez', action='store_true',
+            help='Ejecutar las tareas listas y salir en lugar de quedarse esperando',
+        )
+        parser.add_argument('--nombre', help='Nombre del trabajador (por defecto host:pid)')
+
+    def handle(self, *args, **options):
+        self.detener = False
+        trabajador = options['nombre'] or nombre_trabajador()
+        if not options['una_vez']:
+            signal.signal(signal.SIGTERM, self.pedir_detencion)
+            signal.signal(signal.SIGINT, self.pedir_detencion)
+
+        sincronizar_periodicas()
+        self.stdout.write(f'Trabajador {trabajador} iniciado')
+        ejecutadas = 0
+        while not self.detener:
+            if not connection.in_atomic_block:
+                # Como entre peticiones: descarta conexiones caídas o vencidas
+                close_old_connections()
+            recuperar_bloqueadas()
+            programar_periodicas()
+            tareas = tomar_tareas(trabajador, options['lote'])
+            for tarea in tareas:
+                inicio = time.monotonic()
+                estado = ejecutar(tarea)
+                ejecutadas += 1
+                self.stdout.write(
+                    f'  {tarea.funcion} #{tarea.pk}: {estado} ({time.monotonic() - inicio:.2f} s)'
+                )
+            if not tareas:
+                if options['una_vez']:
+                    break
+                time.sleep(options['intervalo'])
+        self.stdout.write(self.style.SUCCESS(f'Trabajador {trabajador} detenido: {ejecutadas} tareas ejecutadas'))
+
+    def pedir_detencion(self, signum, frame):
+        self.detener = True
@@ -0,0 +1,161 @@
+"""
+Matriz de distancias entre lugares.
+
+DistanciaLugares guarda la distancia de cada par de lugares que aparece en
+algún viaje (con MATRIZ_DISTANCIAS_TODOS, de todos los pares con
+coordenadas). Planificación, tarifas y tiempos estimados la leen con una
+consulta por el índice único (origen, destino) en lugar de calcularla. Como
+la distancia es simétrica, cada par se guarda una sola vez con
+origen < destino.
+
+- reconstruir(): rehace la matriz por lotes de pares; cada lote se calcula
+  de una vez con core.geo.distancias_km y se inserta con bulk_create.
+- recalcular_lugar(): al cambiar las coordenadas de un lugar se recalculan
+  solo su fila y su columna (los pares que lo incluyen).
+- asegurar_par(): agrega el par de un viaje nuevo si aún no está.
+"""
+from decimal import Decimal
+from itertools import combinations, islice
+
+from django.apps import apps as django_apps
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .geo import distancias_km
+
+TAMANO_LOTE = 5000
+
+
+def par(lugar_a, lugar_b):
+    return (lugar_a, lugar_b) if lugar_a < lugar_b else (lugar_b, lugar_a)
+
+
+def todos_los_pares():
+    return getattr(settings, 'MATRIZ_DISTANCIAS_TODOS', False)
+
+
+def distancia_entre(origen_id, destino_id):
+    """
+    Distancia guardada entre dos lugares (una lectura por el índice), o None
+    si el par no está en la matriz.
+    """
+    if origen_id == destino_id:
+        return Decimal('0')
+    DistanciaLugares = django_apps.get_model('core', 'DistanciaLugares')
+    a, b = par(origen_id, destino_id)
+    return DistanciaLugares.objects.filter(origen_id=a, destino_id=b).values_list('distancia_km', flat=True).first()
+
+
+def distancias_entre_lugares(lugar_ids):
+    """
+    Todas las distancias guardadas entre los lugares indicados, en una
+    consulta: {(a, b): km} con a < b.
+    """
+    DistanciaLugares = django_apps.get_model('core', 'DistanciaLugares')
+    lugar_ids = list(set(lugar_ids))
+    return {
+        (a, b): km
+        for a, b, km in DistanciaLugares.objects
+        .filter(origen_id__in=lugar_ids, destino_id__in=lugar_ids)
+        .values_list('origen_id', 'destino_id', 'distancia_km')
+    }
+
+
+def _coordenadas(Lugar, ids=None):
+    lugares = Lugar.objects.filter(latitud__isnull=False, longitud__isnull=False)
+    if ids is not None:
+        lugares = lugares.filter(pk__in=ids)
+    return {pk: (latitud, longitud) for pk, latitud, longitud in lugares.values_list('pk', 'latitud', 'longitud')}
+
+
+def _pares_de_viajes(registro, lugar_id=None):
+    Viaje = registro.get_model('viajes', 'Viaje')
+    viajes = Viaje.objects.order_by()
+    if lugar_id is not None:
+        viajes = viajes.filter(Q(lugar_origen_id=lugar_id) | Q(lugar_destino_id=lugar_id))
+    return {
+        par(origen, destino)
+        for origen, destino in viajes.values_list('lugar_origen_id', 'lugar_destino_id').distinct()
+        if origen != destino
+    }
+
+
+def _filas(modelo, pares, coordenadas, calculada_en):
+    pares = [(a, b) for a, b in pares if a in coordenadas and b in coordenadas]
+    km = distancias_km(
+        [coordenadas[a][0] for a, _ in pares], [coordenadas[a][1] for a, _ in pares],
+        [coordenadas[b][0] for _, b in pares], [coordenadas[b][1] for _, b in pares],
+    )
+    return [
+        modelo(origen_id=a, destino_id=b, distancia_km=distancia, calculada_en=calculada_en)
+        for (a, b), distancia in zip(pares, km)
+    ]
+
+
+def _lotes(iterable, tamano):
+    iterador = iter(iterable)
+    while lote := list(islice(iterador, tamano)):
+        yield lote
+
+
+def reconstruir(todos=None, apps=None, tamano_lote=TAMANO_LOTE):
+    """
+    Rehace la matriz completa. Recibe el registro de apps para poder usarse
+    desde una migración. Devuelve la cantidad de pares guardados.
+    """
+    registro = apps or django_apps
+    Lugar = registro.get_model('core', 'Lugar')
+    DistanciaLugares = registro.get_model('core', 'DistanciaLugares')
+    todos = todos_los_pares() if todos is None else todos
+
+    coordenadas = _coordenadas(Lugar)
+    pares = combinations(sorted(coordenadas), 2) if todos else sorted(_pares_de_viajes(registro))
+    calculada_en = timezone.now()
+    total = 0
+    with transaction.atomic():
+        DistanciaLugares.objects.all().delete()
+        for lote in _lotes(pares, tamano_lote):
+            filas = _filas(DistanciaLugares, lote, coordenadas, calculada_en)
+            DistanciaLugares.objects.bulk_create(filas)
+            total += len(filas)
+    return total
+
+
+def recalcular_lugar(lugar_id):
+    """
+    Recalcula la fila y la columna de un lugar: los pares ya guardados que
+    lo incluyen y los de sus viajes (o, con MATRIZ_DISTANCIAS_TODOS, sus
+    pares con todos los lugares). Sin coordenadas, sus pares se borran.
+    """
+    Lugar = django_apps.get_model('core', 'Lugar')
+    DistanciaLugares = django_apps.get_model('core', 'DistanciaLugares')
+    guardados = DistanciaLugares.objects.filter(Q(origen_id=lugar_id) | Q(destino_id=lugar_id))
+
+    if todos_los_pares():
+        coordenadas = _coordenadas(Lugar)
+        pares = {par(lugar_id, otro) for otro in coordenadas if otro != lugar_id}
+    else:
+        pares = set(guardados.values_list('origen_id', 'destino_id')) | _pares_de_viajes(django_apps, lugar_id)
+        coordenadas = _coordenadas(Lugar, {lugar for pareja in pares for lugar in pareja})
+    filas = _filas(DistanciaLugares, sorted(pares), coordenadas, timezone.now())
+    with transaction.atomic():
+        guardados.delete()
+        for lote in _lotes(filas, TAMANO_LOTE):
+            DistanciaLugares.objects.bulk_create(lote)
+    return len(filas)
+
+
+def asegurar_par(origen_id, destino_id):
+    """
+    Agrega a la matriz el par de un viaje si aún no está.
+    """
+    if origen_id == destino_id or distancia_entre(origen_id, destino_id) is not None:
+        return
+    Lugar = django_apps.get_model('core', 'Lugar')
+    DistanciaLugares = django_apps.get_model('core', 'DistanciaLugares')
+    a, b = par(origen_id, destino_id)
+    filas = _filas(DistanciaLugares, [(a, b)], _coordenadas(Lugar, (a, b)), timezone.now())
+    # Otro proceso pudo agregarlo a la vez
+    DistanciaLugares.objects.bulk_create(filas, ignore_conflicts=True)
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.8 on 2026-10-18 10:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_pasajero'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='pasajero',
+            index=models.Index(fields=['nombre_completo'], name='pasajero_nombre_idx'),
+        ),
+    ]
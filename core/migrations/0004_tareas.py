@@ -0,0 +1,62 @@
+# Generated by Django 5.2.8 on 2026-10-18 11:09
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_pasajero_nombre_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TareaPeriodica',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nombre', models.CharField(max_length=100, unique=True)),
+                ('funcion', models.CharField(max_length=200)),
+                ('parametros', models.JSONField(blank=True, default=dict)),
+                ('intervalo', models.PositiveIntegerField(help_text='Segundos entre ejecuciones')),
+                ('prioridad', models.SmallIntegerField(default=0)),
+                ('activa', models.BooleanField(default=True)),
+                ('proxima_ejecucion', models.DateTimeField(default=django.utils.timezone.now)),
+                ('ultima_ejecucion', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Tarea Periódica',
+                'verbose_name_plural': 'Tareas Periódicas',
+                'ordering': ['nombre'],
+                'indexes': [models.Index(fields=['activa', 'proxima_ejecucion'], name='tarea_periodica_proxima_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='Tarea',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('funcion', models.CharField(help_text='Ruta de la función, p. ej. costos.resumen.reconstruir', max_length=200)),
+                ('parametros', models.JSONField(blank=True, default=dict)),
+                ('prioridad', models.SmallIntegerField(default=0, help_text='Las de mayor prioridad se ejecutan primero')),
+                ('estado', models.CharField(choices=[('pendiente', 'Pendiente'), ('en_curso', 'En Curso'), ('completada', 'Completada'), ('fallida', 'Fallida')], default='pendiente', max_length=20)),
+                ('ejecutar_en', models.DateTimeField(default=django.utils.timezone.now)),
+                ('intentos', models.PositiveSmallIntegerField(default=0)),
+                ('max_intentos', models.PositiveSmallIntegerField(default=3)),
+                ('trabajador', models.CharField(blank=True, max_length=100)),
+                ('bloqueada_hasta', models.DateTimeField(blank=True, null=True)),
+                ('resultado', models.JSONField(blank=True, null=True)),
+                ('error', models.TextField(blank=True)),
+                ('creada_en', models.DateTimeField(auto_now_add=True)),
+                ('iniciada_en', models.DateTimeField(blank=True, null=True)),
+                ('terminada_en', models.DateTimeField(blank=True, null=True)),
+                ('periodica', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='tareas', to='core.tareaperiodica')),
+            ],
+            options={
+                'verbose_name': 'Tarea',
+                'verbose_name_plural': 'Tareas',
+                'ordering': ['-creada_en'],
+                'indexes': [models.Index(fields=['estado', 'prioridad', 'ejecutar_en'], name='tarea_cola_idx'), models.Index(fields=['estado', 'bloqueada_hasta'], name='tarea_bloqueo_idx')],
+            },
+        ),
+    ]
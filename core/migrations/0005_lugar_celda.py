@@ -0,0 +1,27 @@
+# Generated by Django 5.2.8 on 2026-10-18 11:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_tareas'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='lugar',
+            name='celda_lat',
+            field=models.IntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='lugar',
+            name='celda_lon',
+            field=models.IntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='lugar',
+            index=models.Index(fields=['celda_lat', 'celda_lon'], name='lugar_celda_idx'),
+        ),
+    ]
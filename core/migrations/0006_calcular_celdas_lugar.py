@@ -0,0 +1,36 @@
+import math
+
+from django.db import migrations
+
+# Copia congelada de core.geo.celda: la migración no depende del código actual
+TAMANO_CELDA = 0.05
+TAMANO_LOTE = 1000
+
+
+def calcular_celdas(apps, schema_editor):
+    Lugar = apps.get_model('core', 'Lugar')
+    lote = []
+    lugares = Lugar.objects.order_by('pk').values_list('pk', 'latitud', 'longitud')
+    for pk, latitud, longitud in lugares.iterator(chunk_size=TAMANO_LOTE):
+        if latitud is None or longitud is None:
+            celda_lat = celda_lon = None
+        else:
+            celda_lat = math.floor(float(latitud) / TAMANO_CELDA)
+            celda_lon = math.floor(float(longitud) / TAMANO_CELDA)
+        lote.append(Lugar(pk=pk, celda_lat=celda_lat, celda_lon=celda_lon))
+        if len(lote) >= TAMANO_LOTE:
+            Lugar.objects.bulk_update(lote, ['celda_lat', 'celda_lon'])
+            lote = []
+    if lote:
+        Lugar.objects.bulk_update(lote, ['celda_lat', 'celda_lon'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_lugar_celda'),
+    ]
+
+    operations = [
+        migrations.RunPython(calcular_celdas, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.8 on 2026-10-18 11:23
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_calcular_celdas_lugar'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Geocodificacion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('clave', models.CharField(max_length=255, unique=True)),
+                ('tipo', models.CharField(choices=[('busqueda', 'Búsqueda'), ('inversa', 'Inversa')], max_length=20)),
+                ('respuesta', models.JSONField(blank=True, default=list)),
+                ('usos', models.PositiveIntegerField(default=0, help_text='Consultas respondidas desde esta fila')),
+                ('creada_en', models.DateTimeField(auto_now_add=True)),
+                ('actualizada_en', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'verbose_name': 'Geocodificación',
+                'verbose_name_plural': 'Geocodificaciones',
+                'ordering': ['-actualizada_en'],
+            },
+        ),
+    ]
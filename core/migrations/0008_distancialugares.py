@@ -0,0 +1,30 @@
+# Generated by Django 5.2.8 on 2026-10-18 11:25
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_geocodificacion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DistanciaLugares',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('distancia_km', models.DecimalField(decimal_places=2, max_digits=8)),
+                ('calculada_en', models.DateTimeField(default=django.utils.timezone.now)),
+                ('destino', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='core.lugar')),
+                ('origen', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='core.lugar')),
+            ],
+            options={
+                'verbose_name': 'Distancia entre Lugares',
+                'verbose_name_plural': 'Distancias entre Lugares',
+                'constraints': [models.UniqueConstraint(fields=('origen', 'destino'), name='distancia_lugares_par_unico'), models.CheckConstraint(condition=models.Q(('origen__lt', models.F('destino'))), name='distancia_lugares_ordenado')],
+            },
+        ),
+    ]
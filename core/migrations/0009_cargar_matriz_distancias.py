@@ -0,0 +1,62 @@
+import math
+from decimal import Decimal
+from itertools import islice
+
+from django.db import migrations
+from django.utils import timezone
+
+# Copia congelada del cálculo de core.matriz / core.geo: la migración no
+# depende del código actual
+RADIO_TIERRA_KM = 6371.0088
+TAMANO_LOTE = 5000
+
+
+def haversine_km(latitud_origen, longitud_origen, latitud_destino, longitud_destino):
+    fi1, fi2 = math.radians(float(latitud_origen)), math.radians(float(latitud_destino))
+    delta_fi = fi2 - fi1
+    delta_lambda = math.radians(float(longitud_destino) - float(longitud_origen))
+    a = math.sin(delta_fi / 2) ** 2 + math.cos(fi1) * math.cos(fi2) * math.sin(delta_lambda / 2) ** 2
+    return Decimal(str(round(2 * RADIO_TIERRA_KM * math.asin(min(1.0, math.sqrt(a))), 2)))
+
+
+def cargar_matriz(apps, schema_editor):
+    """
+    Distancias de los pares de lugares que ya tienen viajes.
+    """
+    Lugar = apps.get_model('core', 'Lugar')
+    Viaje = apps.get_model('viajes', 'Viaje')
+    DistanciaLugares = apps.get_model('core', 'DistanciaLugares')
+
+    coordenadas = {
+        pk: (latitud, longitud)
+        for pk, latitud, longitud in Lugar.objects
+        .filter(latitud__isnull=False, longitud__isnull=False)
+        .values_list('pk', 'latitud', 'longitud')
+    }
+    pares = sorted({
+        (min(origen, destino), max(origen, destino))
+        for origen, destino in Viaje.objects.order_by().values_list('lugar_origen_id', 'lugar_destino_id').distinct()
+        if origen != destino and origen in coordenadas and destino in coordenadas
+    })
+    calculada_en = timezone.now()
+    iterador = iter(pares)
+    while lote := list(islice(iterador, TAMANO_LOTE)):
+        DistanciaLugares.objects.bulk_create([
+            DistanciaLugares(
+                origen_id=a, destino_id=b, calculada_en=calculada_en,
+                distancia_km=haversine_km(*coordenadas[a], *coordenadas[b]),
+            )
+            for a, b in lote
+        ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_distancialugares'),
+        ('viajes', '0010_calcular_distancias'),
+    ]
+
+    operations = [
+        migrations.RunPython(cargar_matriz, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.8 on 2026-10-18 12:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_cargar_matriz_distancias'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='conductor',
+            index=models.Index(fields=['apellido', 'nombre'], name='conductor_apellido_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='lugar',
+            index=models.Index(fields=['nombre'], name='lugar_nombre_idx'),
+        ),
+    ]
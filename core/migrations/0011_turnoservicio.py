@@ -0,0 +1,26 @@
+# Generated by Django 5.2.8 on 2026-10-18 12:22
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_buscador_filtros_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TurnoServicio',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('servicio', models.CharField(max_length=50, unique=True)),
+                ('siguiente', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'verbose_name': 'Turno de Servicio',
+                'verbose_name_plural': 'Turnos de Servicios',
+            },
+        ),
+    ]
@@ -1,4 +1,6 @@
 from django.db import models
+from django.utils import timezone
+from .geo import celda
 
 
 class Conductor(models.Model):
@@ -19,6 +21,10 @@ class Conductor(models.Model):
         ordering = ['apellido', 'nombre']
         verbose_name = 'Conductor'
         verbose_name_plural = 'Conductores'
+        indexes = [
+            # Búsqueda por prefijo de los filtros del listado de viajes
+            models.Index(fields=['apellido', 'nombre'], name='conductor_apellido_idx'),
+        ]
 
     def __str__(self):
         return f"{self.apellido}, {self.nombre}"
@@ -34,17 +40,55 @@ class Lugar(models.Model):
     pais = models.CharField(max_length=100, default='Ecuador')
     latitud = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
     longitud = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
+    # Celda de la grilla de core/geo.py para las búsquedas por cercanía
+    celda_lat = models.IntegerField(null=True, blank=True, editable=False)
+    celda_lon = models.IntegerField(null=True, blank=True, editable=False)
     creado_en = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         ordering = ['ciudad', 'nombre']
         verbose_name = 'Lugar'
         verbose_name_plural = 'Lugares'
+        indexes = [
+            models.Index(fields=['celda_lat', 'celda_lon'], name='lugar_celda_idx'),
+            # Búsqueda por prefijo de los filtros del listado de viajes
+            models.Index(fields=['nombre'], name='lugar_nombre_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        self.celda_lat, self.celda_lon = celda(self.latitud, self.longitud)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and set(update_fields) & {'latitud', 'longitud'}:
+            kwargs['update_fields'] = set(update_fields) | {'celda_lat', 'celda_lon'}
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return f"{self.nombre}, {self.ciudad}"
 
 
+class DistanciaLugares(models.Model):
+    """
+    Distancia entre dos lugares (ver core/matriz.py). La distancia es
+    simétrica: cada par se guarda una sola vez con origen < destino.
+    """
+    origen = models.ForeignKey(Lugar, on_delete=models.CASCADE, related_name='+')
+    destino = models.ForeignKey(Lugar, on_delete=models.CASCADE, related_name='+')
+    distancia_km = models.DecimalField(max_digits=8, decimal_places=2)
+    calculada_en = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        verbose_name = 'Distancia entre Lugares'
+        verbose_name_plural = 'Distancias entre Lugares'
+        constraints = [
+            # También es el índice de la búsqueda de un par
+            models.UniqueConstraint(fields=['origen', 'destino'], name='distancia_lugares_par_unico'),
+            models.CheckConstraint(condition=models.Q(origen__lt=models.F('destino')), name='distancia_lugares_ordenado'),
+        ]
+
+    def __str__(self):
+        return f"{self.origen_id} - {self.destino_id}: {self.distancia_km} km"
+
+
 class Pasajero(models.Model):
     """
     Modelo para registrar pasajeros del sistema.
@@ -60,6 +104,124 @@ class Pasajero(models.Model):
         ordering = ['nombre_completo']
         verbose_name = 'Pasajero'
         verbose_name_plural = 'Pasajeros'
+        indexes = [
+            # Búsqueda por prefijo del buscador de pasajeros (el RUT ya es único)
+            models.Index(fields=['nombre_completo'], name='pasajero_nombre_idx'),
+        ]
 
     def __str__(self):
         return self.nombre_completo
+
+
+class Tarea(models.Model):
+    """
+    Tarea en segundo plano guardada en la base de datos (ver core/tareas.py).
+    """
+    ESTADO_TAREA = [
+        ('pendiente', 'Pendiente'),
+        ('en_curso', 'En Curso'),
+        ('completada', 'Completada'),
+        ('fallida', 'Fallida'),
+    ]
+
+    funcion = models.CharField(max_length=200, help_text='Ruta de la función, p. ej. costos.resumen.reconstruir')
+    parametros = models.JSONField(default=dict, blank=True)
+    prioridad = models.SmallIntegerField(default=0, help_text='Las de mayor prioridad se ejecutan primero')
+    estado = models.CharField(max_length=20, choices=ESTADO_TAREA, default='pendiente')
+    ejecutar_en = models.DateTimeField(default=timezone.now)
+    intentos = models.PositiveSmallIntegerField(default=0)
+    max_intentos = models.PositiveSmallIntegerField(default=3)
+    trabajador = models.CharField(max_length=100, blank=True)
+    bloqueada_hasta = models.DateTimeField(null=True, blank=True)
+    resultado = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    periodica = models.ForeignKey(
+        'TareaPeriodica', on_delete=models.SET_NULL, null=True, blank=True, related_name='tareas'
+    )
+    creada_en = models.DateTimeField(auto_now_add=True)
+    iniciada_en = models.DateTimeField(null=True, blank=True)
+    terminada_en = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-creada_en']
+        verbose_name = 'Tarea'
+        verbose_name_plural = 'Tareas'
+        indexes = [
+            # Selección de la siguiente tarea: pendientes por prioridad y fecha
+            models.Index(fields=['estado', 'prioridad', 'ejecutar_en'], name='tarea_cola_idx'),
+            # Recuperación de tareas de trabajadores caídos
+            models.Index(fields=['estado', 'bloqueada_hasta'], name='tarea_bloqueo_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.funcion} ({self.get_estado_display()})"
+
+
+class TareaPeriodica(models.Model):
+    """
+    Tarea que el trabajador encola cada cierto intervalo.
+    """
+    nombre = models.CharField(max_length=100, unique=True)
+    funcion = models.CharField(max_length=200)
+    parametros = models.JSONField(default=dict, blank=True)
+    intervalo = models.PositiveIntegerField(help_text='Segundos entre ejecuciones')
+    prioridad = models.SmallIntegerField(default=0)
+    activa = models.BooleanField(default=True)
+    proxima_ejecucion = models.DateTimeField(default=timezone.now)
+    ultima_ejecucion = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['nombre']
+        verbose_name = 'Tarea Periódica'
+        verbose_name_plural = 'Tareas Periódicas'
+        indexes = [
+            models.Index(fields=['activa', 'proxima_ejecucion'], name='tarea_periodica_proxima_idx'),
+        ]
+
+    def __str__(self):
+        return self.nombre
+
+
+class Geocodificacion(models.Model):
+    """
+    Respuesta guardada del servicio de geocodificación (ver
+    core/geocodificacion.py), por consulta normalizada o coordenadas
+    redondeadas.
+    """
+    TIPO_CONSULTA = [
+        ('busqueda', 'Búsqueda'),
+        ('inversa', 'Inversa'),
+    ]
+
+    clave = models.CharField(max_length=255, unique=True)
+    tipo = models.CharField(max_length=20, choices=TIPO_CONSULTA)
+    respuesta = models.JSONField(default=list, blank=True)
+    usos = models.PositiveIntegerField(default=0, help_text='Consultas respondidas desde esta fila')
+    creada_en = models.DateTimeField(auto_now_add=True)
+    actualizada_en = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ['-actualizada_en']
+        verbose_name = 'Geocodificación'
+        verbose_name_plural = 'Geocodificaciones'
+
+    def __str__(self):
+        return self.clave
+
+
+class TurnoServicio(models.Model):
+    """
+    Próximo turno libre para consultar un servicio externo con límite de
+    frecuencia (ver core.geocodificacion.esperar_turno). La fila se bloquea
+    solo para reservar el turno, así que el límite vale para todos los
+    procesos y servidores que usan la misma base de datos.
+    """
+    servicio = models.CharField(max_length=50, unique=True)
+    siguiente = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        verbose_name = 'Turno de Servicio'
+        verbose_name_plural = 'Turnos de Servicios'
+
+    def __str__(self):
+        return f"{self.servicio}: {self.siguiente}"
@@ -0,0 +1,14 @@
+from django.db.models.signals import post_delete, post_save
+from .cache import invalidar_modelos
+
+# Aplicaciones cuyos modelos alimentan páginas cacheadas y el panel de inicio
+APPS_CACHEADAS = {'core', 'flota', 'viajes', 'costos'}
+
+
+def invalidar_cache_modelo(sender, **kwargs):
+    if sender._meta.app_label in APPS_CACHEADAS:
+        invalidar_modelos(sender)
+
+
+post_save.connect(invalidar_cache_modelo, dispatch_uid='core_cache_save')
+post_delete.connect(invalidar_cache_modelo, dispatch_uid='core_cache_delete')
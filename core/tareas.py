@@ -0,0 +1,212 @@
+"""
+Cola de tareas en segundo plano guardada en la propia base de datos.
+
+Cualquier aplicación encola una función importable con sus parámetros:
+
+    from core.tareas import encolar
+    encolar('costos.resumen.reconstruir', prioridad=5)
+
+y uno o varios procesos `manage.py worker` las ejecutan. No hace falta un
+broker externo: los trabajadores toman tareas con
+SELECT ... FOR UPDATE SKIP LOCKED, así que varios trabajadores sobre la misma
+base de datos (MySQL 8) no se bloquean entre sí ni toman la misma tarea.
+
+- Prioridad: primero las de mayor prioridad y, entre ellas, las más antiguas.
+- Reintentos: si la función lanza una excepción se vuelve a programar con
+  espera exponencial (TAREAS_ESPERA_REINTENTO * 2**(intentos - 1)) hasta
+  max_intentos; después queda como fallida con el error.
+- Programadas: ejecutar_en posterga la tarea hasta esa fecha.
+- Periódicas: TareaPeriodica (y TAREAS_PERIODICAS en settings) encola la
+  función cada `intervalo` segundos.
+
+Una tarea tomada queda bloqueada hasta bloqueada_hasta
+(TAREAS_BLOQUEO_SEGUNDOS). Si el trabajador muere sin terminarla, al vencer
+ese plazo otro trabajador la recupera y la cuenta como un intento fallido.
+"""
+import os
+import socket
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import Tarea, TareaPeriodica
+
+BLOQUEO_SEGUNDOS = getattr(settings, 'TAREAS_BLOQUEO_SEGUNDOS', 10 * 60)
+ESPERA_REINTENTO = getattr(settings, 'TAREAS_ESPERA_REINTENTO', 30)
+ESPERA_MAXIMA = 6 * 60 * 60
+
+
+def ruta_funcion(funcion):
+    if isinstance(funcion, str):
+        return funcion
+    return f'{funcion.__module__}.{funcion.__qualname__}'
+
+
+def encolar(funcion, parametros=None, prioridad=0, ejecutar_en=None, max_intentos=3):
+    """
+    Encola funcion (una función importable o su ruta) para ejecutarla con
+    **parametros, que deben poder guardarse como JSON.
+
+    Se guarda en la transacción en curso: si esta se revierte la tarea no
+    existe, y ningún trabajador la ve antes del commit.
+    """
+    ruta = ruta_funcion(funcion)
+    import_string(ruta)
+    return Tarea.objects.create(
+        funcion=ruta,
+        parametros=parametros or {},
+        prioridad=prioridad,
+        ejecutar_en=ejecutar_en or timezone.now(),
+        max_intentos=max_intentos,
+    )
+
+
+def nombre_trabajador():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def espera_reintento(intentos):
+    return timedelta(seconds=min(ESPERA_REINTENTO * 2 ** (intentos - 1), ESPERA_MAXIMA))
+
+
+def recuperar_bloqueadas(ahora=None):
+    """
+    Devuelve a la cola las tareas cuyo trabajador no terminó a tiempo; si ya
+    agotaron sus intentos se marcan como fallidas.
+    """
+    ahora = ahora or timezone.now()
+    vencidas = Tarea.objects.filter(estado='en_curso', bloqueada_hasta__lt=ahora)
+    fallidas = vencidas.filter(intentos__gte=F('max_intentos')).update(
+        estado='fallida', terminada_en=ahora, bloqueada_hasta=None,
+        error='El trabajador no terminó la tarea dentro del plazo de bloqueo.',
+    )
+    recuperadas = vencidas.update(
+        estado='pendiente', ejecutar_en=ahora, bloqueada_hasta=None,
+        error='El trabajador no terminó la tarea dentro del plazo de bloqueo.',
+    )
+    return recuperadas + fallidas
+
+
+def tomar_tareas(trabajador, cantidad=1, ahora=None):
+    """
+    Marca como en curso hasta `cantidad` tareas listas para ejecutarse y las
+    devuelve. Las filas que otro trabajador está tomando se saltan (SKIP
+    LOCKED) en lugar de esperar a que se liberen.
+    """
+    ahora = ahora or timezone.now()
+    with transaction.atomic():
+        ids = list(
+            Tarea.objects
+            .select_for_update(skip_locked=True)
+            .filter(estado='pendiente', ejecutar_en__lte=ahora)
+            .order_by('-prioridad', 'ejecutar_en', 'id')
+            .values_list('id', flat=True)[:cantidad]
+        )
+        if not ids:
+            return []
+        # La condición sobre estado protege a las bases de datos sin FOR UPDATE
+        Tarea.objects.filter(id__in=ids, estado='pendiente').update(
+            estado='en_curso',
+            trabajador=trabajador,
+            intentos=F('intentos') + 1,
+            iniciada_en=ahora,
+            bloqueada_hasta=ahora + timedelta(seconds=BLOQUEO_SEGUNDOS),
+        )
+    return list(
+        Tarea.objects
+        .filter(id__in=ids, estado='en_curso', trabajador=trabajador)
+        .order_by('-prioridad', 'ejecutar_en', 'id')
+    )
+
+
+def ejecutar(tarea):
+    """
+    Ejecuta una tarea ya tomada y guarda su resultado o programa el
+    reintento. Devuelve el estado final.
+    """
+    try:
+        resultado = import_string(tarea.funcion)(**tarea.parametros)
+    except Exception as e:
+        ahora = timezone.now()
+        campos = {'error': f'{type(e).__name__}: {e}\n\n{traceback.format_exc()}', 'bloqueada_hasta': None}
+        if tarea.intentos < tarea.max_intentos:
+            campos.update(estado='pendiente', ejecutar_en=ahora + espera_reintento(tarea.intentos))
+        else:
+            campos.update(estado='fallida', terminada_en=ahora)
+    else:
+        campos = {
+            'estado': 'completada',
+            'resultado': _serializable(resultado),
+            'error': '',
+            'terminada_en': timezone.now(),
+            'bloqueada_hasta': None,
+        }
+    # Si el bloqueo venció y otro trabajador la tomó, ese resultado manda
+    Tarea.objects.filter(pk=tarea.pk, estado='en_curso', trabajador=tarea.trabajador).update(**campos)
+    return campos['estado']
+
+
+def _serializable(valor):
+    if valor is None or isinstance(valor, (bool, int, float, str, list, dict)):
+        return valor
+    return str(valor)
+
+
+def sincronizar_periodicas():
+    """
+    Crea o actualiza las tareas periódicas declaradas en TAREAS_PERIODICAS
+    sin tocar su próxima ejecución.
+    """
+    for nombre, definicion in getattr(settings, 'TAREAS_PERIODICAS', {}).items():
+        TareaPeriodica.objects.update_or_create(
+            nombre=nombre,
+            defaults={
+                'funcion': definicion['funcion'],
+                'parametros': definicion.get('parametros', {}),
+                'intervalo': definicion['intervalo'],
+                'prioridad': definicion.get('prioridad', 0),
+            },
+        )
+
+
+def programar_periodicas(ahora=None):
+    """
+    Encola las tareas periódicas vencidas. La fila de cada una se bloquea
+    mientras se encola, así que con varios trabajadores se encola una sola
+    vez. Si estuvo parada varios intervalos se ejecuta una vez y se sigue con
+    el calendario original.
+    """
+    ahora = ahora or timezone.now()
+    encoladas = 0
+    with transaction.atomic():
+        periodicas = (
+            TareaPeriodica.objects
+            .select_for_update(skip_locked=True)
+            .filter(activa=True, proxima_ejecucion__lte=ahora)
+        )
+        for periodica in periodicas:
+            intervalos = int((ahora - periodica.proxima_ejecucion).total_seconds() // periodica.intervalo) + 1
+            # El filtro por proxima_ejecucion evita encolarla dos veces en
+            # bases de datos sin FOR UPDATE
+            movida = TareaPeriodica.objects.filter(
+                pk=periodica.pk, proxima_ejecucion=periodica.proxima_ejecucion,
+            ).update(
+                ultima_ejecucion=ahora,
+                proxima_ejecucion=periodica.proxima_ejecucion + timedelta(seconds=intervalos * periodica.intervalo),
+            )
+            if not movida:
+                continue
+            Tarea.objects.create(
+                funcion=periodica.funcion,
+                parametros=periodica.parametros,
+                prioridad=periodica.prioridad,
+                ejecutar_en=ahora,
+                periodica=periodica,
+            )
+            encoladas += 1
+    return encoladas
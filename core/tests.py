@@ -1,5 +1,33 @@
-from django.test import TestCase
-from .models import Conductor, Lugar
+import random
+from decimal import Decimal
+import threading
+import time
+from datetime import timedelta
+from io import StringIO
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from . import geo, geocodificacion, matriz
+from .cache import cache_versionada
+from .dashboard import obtener_indicadores
+from .models import Conductor, DistanciaLugares, Geocodificacion, Lugar, Pasajero, Tarea, TareaPeriodica, TurnoServicio
+from .tareas import (
+    ejecutar, encolar, programar_periodicas, recuperar_bloqueadas, sincronizar_periodicas, tomar_tareas,
+)
+from flota.models import Bus, DocumentoVehiculo
+from viajes.models import Viaje
+from viajes.reservas import reservar_asiento
+
+# La caché versionada es DummyCache con locmem; aquí se prueba como si fuera
+# compartida
+CACHES_COMPARTIDAS = dict(settings.CACHES, versionada={
+    'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'versionada',
+})
 
 
 class ConductorTestCase(TestCase):
@@ -27,3 +55,394 @@ class LugarTestCase(TestCase):
 
     def test_lugar_creation(self):
         self.assertEqual(self.lugar.nombre, 'Terminal Central')
+
+
+class LugaresCercanosTestCase(TestCase):
+    def setUp(self):
+        generador = random.Random(7)
+        Lugar.objects.bulk_create([
+            Lugar(
+                nombre=f'Parada {i}', ciudad='Quito',
+                latitud=round(generador.uniform(-1.0, 0.5), 6),
+                longitud=round(generador.uniform(-79.5, -78.0), 6),
+            )
+            for i in range(300)
+        ])
+        # bulk_create no pasa por save()
+        geo.reconstruir_celdas()
+        self.punto = (-0.2295, -78.5243)
+
+    def por_fuerza_bruta(self):
+        return sorted(
+            (geo.haversine_km(*self.punto, lugar.latitud, lugar.longitud), lugar.pk)
+            for lugar in Lugar.objects.all()
+        )
+
+    def test_igual_que_recorrer_todos(self):
+        todos = self.por_fuerza_bruta()
+        cercanos = geo.mas_cercanos(*self.punto, n=10)
+        self.assertEqual([lugar.pk for lugar in cercanos], [pk for _, pk in todos[:10]])
+        en_radio = geo.en_radio(*self.punto, 15)
+        self.assertEqual([lugar.pk for lugar in en_radio], [pk for distancia, pk in todos if distancia <= 15])
+
+    def test_celda_al_editar_coordenadas(self):
+        lugar = Lugar.objects.create(nombre='Terminal', ciudad='Quito')
+        self.assertIsNone(lugar.celda_lat)
+        lugar.latitud, lugar.longitud = -2.1894, -79.8890
+        lugar.save(update_fields=['latitud', 'longitud'])
+        lugar.refresh_from_db()
+        self.assertEqual((lugar.celda_lat, lugar.celda_lon), geo.celda(-2.1894, -79.8890))
+        self.assertEqual(geo.mas_cercanos(-2.19, -79.89, n=1)[0].pk, lugar.pk)
+
+    def test_endpoint(self):
+        url = reverse('lugar_cercanos')
+        respuesta = self.client.get(url, {'lat': self.punto[0], 'lon': self.punto[1], 'n': 3})
+        lugares = respuesta.json()['lugares']
+        self.assertEqual([l['id'] for l in lugares], [pk for _, pk in self.por_fuerza_bruta()[:3]])
+        respuesta = self.client.get(url, {
+            'lat': self.punto[0], 'lon': self.punto[1], 'radio': 20, 'excluir': lugares[0]['id'],
+        })
+        self.assertTrue(all(l['distancia_km'] <= 20 for l in respuesta.json()['lugares']))
+        self.assertNotIn(lugares[0]['id'], [l['id'] for l in respuesta.json()['lugares']])
+        self.assertEqual(self.client.get(url, {'lat': 'x', 'lon': 1}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'lat': 0, 'lon': 0, 'radio': 5000}).status_code, 400)
+
+
+class MatrizDistanciasTestCase(TestCase):
+    def setUp(self):
+        self.quito = Lugar.objects.create(nombre='Quito', ciudad='Quito', latitud=-0.1807, longitud=-78.4678)
+        self.guayaquil = Lugar.objects.create(nombre='Guayaquil', ciudad='Guayaquil', latitud=-2.1894, longitud=-79.8890)
+        self.cuenca = Lugar.objects.create(nombre='Cuenca', ciudad='Cuenca', latitud=-2.9001, longitud=-79.0059)
+        conductor = Conductor.objects.create(
+            nombre='Juan', apellido='Pérez', cedula='1', email='j@example.com',
+            telefono='1', fecha_contratacion='2024-01-01'
+        )
+        ahora = timezone.now()
+        # El par se agrega a la matriz al guardar el viaje
+        Viaje.objects.create(
+            conductor=conductor, lugar_origen=self.guayaquil, lugar_destino=self.quito,
+            fecha_salida=ahora, fecha_llegada_estimada=ahora,
+        )
+
+    def test_pares_de_viajes_y_todos(self):
+        self.assertEqual(matriz.distancia_entre(self.quito.pk, self.guayaquil.pk), Decimal('273.59'))
+        self.assertEqual(matriz.distancia_entre(self.guayaquil.pk, self.quito.pk), Decimal('273.59'))
+        self.assertIsNone(matriz.distancia_entre(self.quito.pk, self.cuenca.pk))
+
+        self.assertEqual(matriz.reconstruir(), 1)
+        self.assertEqual(matriz.reconstruir(todos=True, tamano_lote=2), 3)
+        self.assertEqual(len(matriz.distancias_entre_lugares([self.quito.pk, self.cuenca.pk])), 1)
+        salida = StringIO()
+        call_command('calcular_matriz_distancias', stdout=salida)
+        self.assertIn('1 pares', salida.getvalue())
+
+    def test_editar_coordenadas_recalcula_fila_y_columna(self):
+        matriz.reconstruir(todos=True)
+        otra = DistanciaLugares.objects.get(origen=self.guayaquil, destino=self.cuenca)
+        datos = {'nombre': 'Quito', 'ciudad': 'Quito', 'pais': 'Ecuador', 'latitud': '0', 'longitud': '-78.4678'}
+        self.client.post(reverse('lugar_update', args=[self.quito.pk]), datos)
+        self.assertEqual(matriz.distancia_entre(self.quito.pk, self.guayaquil.pk), geo.distancia_km(0, -78.4678, -2.1894, -79.8890))
+        # Los pares que no incluyen al lugar no se tocan
+        self.assertEqual(DistanciaLugares.objects.get(pk=otra.pk).calculada_en, otra.calculada_en)
+
+
+class ProveedorDePrueba:
+    llamadas = []
+
+    def buscar(self, consulta, pais=None, limite=8):
+        ProveedorDePrueba.llamadas.append(('buscar', consulta, pais))
+        if pais and consulta == 'lima':
+            return []
+        return [{'lat': '-0.2295', 'lon': '-78.5243', 'display_name': consulta.title()}]
+
+    def inversa(self, latitud, longitud):
+        ProveedorDePrueba.llamadas.append(('inversa', latitud, longitud))
+        return {'address': {'city': 'Quito', 'road': 'Av. Amazonas'}}
+
+
+@override_settings(
+    GEOCODIFICACION_PROVEEDOR='core.tests.ProveedorDePrueba',
+    GEOCODIFICACION_INTERVALO=0.01,
+    GEOCODIFICACION_ESPERA_MAXIMA=1,
+)
+class GeocodificacionTestCase(TestCase):
+    def setUp(self):
+        ProveedorDePrueba.llamadas = []
+        cache.clear()
+
+    def test_busqueda_repetida_sale_de_la_cache(self):
+        url = reverse('geocodificar_buscar')
+        primera = self.client.get(url, {'q': 'Terminal  Quitumbe'}).json()
+        segunda = self.client.get(url, {'q': ' terminal quitumbe '}).json()
+        self.assertEqual(primera, segunda)
+        self.assertEqual(ProveedorDePrueba.llamadas, [('buscar', 'terminal quitumbe', 'ec')])
+        self.assertEqual(Geocodificacion.objects.get().usos, 1)
+        self.assertEqual(self.client.get(url, {'q': 'ab'}).status_code, 400)
+
+    def test_busqueda_global_si_no_hay_resultados_en_el_pais(self):
+        self.assertEqual(len(geocodificacion.buscar('Lima')), 1)
+        self.assertEqual(ProveedorDePrueba.llamadas, [('buscar', 'lima', 'ec'), ('buscar', 'lima', None)])
+
+    def test_inversa_con_coordenadas_redondeadas(self):
+        url = reverse('geocodificar_inversa')
+        respuesta = self.client.get(url, {'lat': '-0.229512', 'lon': '-78.524298'})
+        self.assertEqual(respuesta.json()['address']['city'], 'Quito')
+        self.client.get(url, {'lat': '-0.229488', 'lon': '-78.524311'})
+        self.assertEqual(ProveedorDePrueba.llamadas, [('inversa', -0.2295, -78.5243)])
+
+    def test_consultas_simultaneas_se_unen(self):
+        liberar = threading.Event()
+        llamadas = []
+
+        def lenta():
+            llamadas.append(1)
+            liberar.wait(5)
+            return ['resultado']
+
+        resultados = []
+        iniciados = threading.Semaphore(0)
+
+        def consultar():
+            iniciados.release()
+            resultados.append(geocodificacion.coalescer('clave', lenta))
+
+        hilos = [threading.Thread(target=consultar) for _ in range(5)]
+        for hilo in hilos:
+            hilo.start()
+        for _ in hilos:
+            iniciados.acquire()
+        # Margen para que todos lleguen a esperar el resultado del primero
+        time.sleep(0.2)
+        liberar.set()
+        for hilo in hilos:
+            hilo.join()
+        self.assertEqual(len(llamadas), 1)
+        self.assertEqual(resultados, [['resultado']] * 5)
+
+    @override_settings(GEOCODIFICACION_INTERVALO=60, GEOCODIFICACION_ESPERA_MAXIMA=0)
+    def test_limite_de_salida(self):
+        geocodificacion.buscar('quito')
+        turno = TurnoServicio.objects.get(servicio=geocodificacion.SERVICIO)
+        self.assertGreater(turno.siguiente, timezone.now() + timedelta(seconds=50))
+        # El turno de 60 s ya está usado y no se puede esperar; se reserva en
+        # la base de datos, no en la caché del proceso
+        cache.clear()
+        respuesta = self.client.get(reverse('geocodificar_buscar'), {'q': 'guayaquil'})
+        self.assertEqual(respuesta.status_code, 503)
+        self.assertLessEqual(int(respuesta['Retry-After']), 60)
+        self.assertEqual(len(ProveedorDePrueba.llamadas), 1)
+
+
+@override_settings(CACHES=CACHES_COMPARTIDAS)
+class DashboardTestCase(TestCase):
+    def setUp(self):
+        cache_versionada.clear()
+        self.conductor = Conductor.objects.create(
+            nombre='Juan',
+            apellido='Pérez',
+            cedula='1234567890',
+            email='juan@example.com',
+            telefono='0987654321',
+            fecha_contratacion='2024-01-01'
+        )
+        self.bus = Bus.objects.create(
+            placa='ABC123',
+            modelo='Mercedes Benz',
+            año_fabricacion=2020,
+            capacidad_pasajeros=40,
+            numero_chasis='CH123',
+            numero_motor='MO123',
+            fecha_adquisicion='2020-05-15'
+        )
+        Bus.objects.create(
+            placa='XYZ789',
+            modelo='Volvo',
+            año_fabricacion=2018,
+            capacidad_pasajeros=30,
+            numero_chasis='CH789',
+            estado='mantenimiento',
+            fecha_adquisicion='2018-01-10'
+        )
+        self.lugar = Lugar.objects.create(nombre='Quito', ciudad='Quito')
+        self.hoy = timezone.localdate()
+        self.viaje = Viaje.objects.create(
+            bus=self.bus,
+            conductor=self.conductor,
+            lugar_origen=self.lugar,
+            lugar_destino=self.lugar,
+            fecha_salida=timezone.now(),
+            fecha_llegada_estimada=timezone.now()
+        )
+        DocumentoVehiculo.objects.create(
+            bus=self.bus,
+            tipo='soat',
+            numero_documento='S-1',
+            fecha_emision=self.hoy - timedelta(days=300),
+            fecha_vencimiento=self.hoy + timedelta(days=10)
+        )
+        DocumentoVehiculo.objects.create(
+            bus=self.bus,
+            tipo='rec',
+            numero_documento='R-1',
+            fecha_emision=self.hoy - timedelta(days=400),
+            fecha_vencimiento=self.hoy - timedelta(days=5)
+        )
+
+    def test_indicadores(self):
+        indicadores = obtener_indicadores()
+        self.assertEqual(indicadores['total_buses'], 2)
+        buses = {fila['estado']: fila['total'] for fila in indicadores['buses']}
+        self.assertEqual(buses, {'activo': 1, 'mantenimiento': 1, 'inactivo': 0})
+        self.assertEqual(indicadores['total_viajes_hoy'], 1)
+        self.assertEqual(indicadores['asientos_totales'], 40)
+        self.assertEqual(indicadores['documentos_por_vencer'], 1)
+        self.assertEqual(indicadores['documentos_vencidos'], 1)
+        self.assertEqual(indicadores['documentos_proximos'][0]['dias'], 10)
+
+    def test_home_desde_cache(self):
+        self.client.get(reverse('home'))
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('home'))
+        self.assertContains(response, 'Panel de Control')
+
+    def test_invalidacion_por_senales(self):
+        self.assertEqual(obtener_indicadores()['asientos_vendidos'], 0)
+        pasajero = Pasajero.objects.create(rut='11111111-1', nombre_completo='Ana Soto')
+        # La reserva actualiza el contador con UPDATE, sin señales del viaje
+        reservar_asiento(self.viaje, pasajero)
+        self.assertEqual(obtener_indicadores()['asientos_vendidos'], 1)
+
+        self.viaje.estado = 'cancelado'
+        self.viaje.save()
+        self.assertEqual(obtener_indicadores()['asientos_totales'], 0)
+
+        self.bus.estado = 'inactivo'
+        self.bus.save()
+        buses = {fila['estado']: fila['total'] for fila in obtener_indicadores()['buses']}
+        self.assertEqual(buses['inactivo'], 1)
+
+
+@override_settings(CACHES=CACHES_COMPARTIDAS)
+class CachePaginasTestCase(TestCase):
+    def setUp(self):
+        cache_versionada.clear()
+        self.lugar = Lugar.objects.create(nombre='Terminal Central', ciudad='Quito')
+
+    def test_lista_y_detalle_desde_cache(self):
+        for url in (reverse('lugar_list'), reverse('lugar_detail', args=[self.lugar.pk])):
+            self.client.get(url)
+            with self.assertNumQueries(0):
+                response = self.client.get(url)
+            self.assertContains(response, 'Terminal Central')
+
+    def test_edicion_invalida_la_cache(self):
+        url = reverse('lugar_detail', args=[self.lugar.pk])
+        self.client.get(url)
+        self.lugar.nombre = 'Terminal Norte'
+        self.lugar.save()
+        response = self.client.get(url)
+        self.assertContains(response, 'Terminal Norte')
+        self.assertNotContains(response, 'Terminal Central')
+
+    def test_parametros_distintos_no_comparten_pagina(self):
+        for i in range(25):
+            Lugar.objects.create(nombre=f'Lugar {i:02d}', ciudad='Quito')
+        primera = self.client.get(reverse('lugar_list'))
+        segunda = self.client.get(reverse('lugar_list') + '?page=2')
+        self.assertNotEqual(primera.content, segunda.content)
+
+    def test_mensajes_no_se_cachean(self):
+        response = self.client.post(reverse('lugar_create'), {
+            'nombre': 'Terminal Sur', 'ciudad': 'Quito', 'pais': 'Ecuador',
+        }, follow=True)
+        self.assertContains(response, 'Terminal Sur')
+        mensaje = list(response.context['messages'])[0].message
+        response = self.client.get(reverse('lugar_list'))
+        self.assertNotContains(response, mensaje)
+
+    @override_settings(CACHES=settings.CACHES)
+    def test_sin_cache_compartida_no_se_cachea(self):
+        # Con locmem cada proceso tendría sus propias versiones
+        url = reverse('lugar_detail', args=[self.lugar.pk])
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as consultas:
+            self.client.get(url)
+        self.assertTrue(consultas.captured_queries)
+
+
+def tarea_suma(a, b):
+    return a + b
+
+
+def tarea_que_falla():
+    raise ValueError('fallo de prueba')
+
+
+class TareasTestCase(TestCase):
+    def test_prioridad_y_programadas(self):
+        ahora = timezone.now()
+        baja = encolar(tarea_suma, {'a': 1, 'b': 2})
+        alta = encolar('core.tests.tarea_suma', {'a': 3, 'b': 4}, prioridad=10)
+        encolar(tarea_suma, {'a': 0, 'b': 0}, ejecutar_en=ahora + timedelta(hours=1))
+
+        tareas = tomar_tareas('prueba', 5)
+        self.assertEqual([t.pk for t in tareas], [alta.pk, baja.pk])
+        # Ya tomadas: otro trabajador no las ve
+        self.assertEqual(tomar_tareas('otro', 5), [])
+
+        self.assertEqual(ejecutar(tareas[0]), 'completada')
+        alta.refresh_from_db()
+        self.assertEqual((alta.estado, alta.resultado, alta.intentos), ('completada', 7, 1))
+
+    def test_reintentos_con_espera(self):
+        tarea = encolar(tarea_que_falla, max_intentos=2)
+        ahora = timezone.now()
+        self.assertEqual(ejecutar(tomar_tareas('prueba')[0]), 'pendiente')
+        tarea.refresh_from_db()
+        self.assertIn('ValueError: fallo de prueba', tarea.error)
+        self.assertGreaterEqual(tarea.ejecutar_en, ahora + timedelta(seconds=30))
+        self.assertEqual(tomar_tareas('prueba'), [])
+
+        segundo = tomar_tareas('prueba', ahora=tarea.ejecutar_en)[0]
+        self.assertEqual(ejecutar(segundo), 'fallida')
+        tarea.refresh_from_db()
+        self.assertEqual((tarea.estado, tarea.intentos), ('fallida', 2))
+
+    def test_recupera_tareas_de_trabajador_caido(self):
+        tarea = encolar(tarea_suma, {'a': 1, 'b': 1})
+        tomar_tareas('caido')
+        self.assertEqual(recuperar_bloqueadas(), 0)
+        self.assertEqual(recuperar_bloqueadas(timezone.now() + timedelta(hours=1)), 1)
+        tarea.refresh_from_db()
+        self.assertEqual((tarea.estado, tarea.intentos), ('pendiente', 1))
+
+    def test_periodicas(self):
+        with self.settings(TAREAS_PERIODICAS={
+            'suma': {'funcion': 'core.tests.tarea_suma', 'parametros': {'a': 1, 'b': 1}, 'intervalo': 60},
+        }):
+            sincronizar_periodicas()
+        periodica = TareaPeriodica.objects.get(nombre='suma')
+        inicio = periodica.proxima_ejecucion
+        # Parada durante 3 intervalos y medio: se ejecuta una sola vez
+        ahora = inicio + timedelta(seconds=210)
+        self.assertEqual(programar_periodicas(ahora), 1)
+        self.assertEqual(programar_periodicas(ahora), 0)
+        periodica.refresh_from_db()
+        self.assertEqual(periodica.proxima_ejecucion, inicio + timedelta(seconds=240))
+        self.assertEqual(Tarea.objects.filter(periodica=periodica).count(), 1)
+
+    def test_comando_worker(self):
+        encolar(tarea_suma, {'a': 2, 'b': 2})
+        encolar(tarea_que_falla, max_intentos=1)
+        salida = StringIO()
+        call_command('worker', '--una-vez', '--nombre', 'prueba', stdout=salida)
+        # También se encolan y ejecutan las periódicas de TAREAS_PERIODICAS
+        self.assertIn(f'{2 + len(settings.TAREAS_PERIODICAS)} tareas ejecutadas', salida.getvalue())
+        self.assertEqual(
+            set(Tarea.objects.filter(periodica__isnull=False).values_list('estado', flat=True)), {'completada'}
+        )
+        self.assertEqual(
+            dict(Tarea.objects.filter(periodica=None).values_list('funcion', 'estado')),
+            {'core.tests.tarea_suma': 'completada', 'core.tests.tarea_que_falla': 'fallida'},
+        )
+
@@ -12,10 +12,15 @@ urlpatterns = [
     # Lugares
     path('lugares/', views.LugarListView.as_view(), name='lugar_list'),
     path('lugares/nuevo/', views.LugarCreateView.as_view(), name='lugar_create'),
+    path('lugares/cercanos/', views.lugares_cercanos, name='lugar_cercanos'),
     path('lugares/<int:pk>/', views.LugarDetailView.as_view(), name='lugar_detail'),
     path('lugares/<int:pk>/editar/', views.LugarUpdateView.as_view(), name='lugar_update'),
     path('lugares/<int:pk>/eliminar/', views.LugarDeleteView.as_view(), name='lugar_delete'),
     
+    # Geocodificación (proxy con caché del servicio externo)
+    path('geocodificacion/buscar/', views.geocodificar_busqueda, name='geocodificar_buscar'),
+    path('geocodificacion/inversa/', views.geocodificar_inversa, name='geocodificar_inversa'),
+    
     # Pasajeros
     path('pasajeros/', views.PasajeroListView.as_view(), name='pasajero_list'),
     path('pasajeros/nuevo/', views.PasajeroCreateView.as_view(), name='pasajero_create'),
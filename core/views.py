@@ -4,7 +4,12 @@ from django.urls import reverse_lazy
 from django.contrib import messages
 from django.forms import ModelForm
 from django import forms
+from django.http import JsonResponse
 from django.utils import timezone
+from django.views.decorators.http import require_safe
+from . import geo, geocodificacion, matriz
+from .cache import CacheModelosMixin
+from .dashboard import DIAS_POR_VENCER, obtener_indicadores
 from .models import Conductor, Lugar, Pasajero
 
 
@@ -76,8 +81,9 @@ class PasajeroForm(ModelForm):
 
 
 # Vistas para Conductores
-class ConductorListView(ListView):
+class ConductorListView(CacheModelosMixin, ListView):
     model = Conductor
+    modelos_cache = (Conductor,)
     template_name = 'core/conductor_list.html'
     context_object_name = 'conductores'
     paginate_by = 20
@@ -86,8 +92,9 @@ class ConductorListView(ListView):
         return Conductor.objects.all().order_by('-creado_en')
 
 
-class ConductorDetailView(DetailView):
+class ConductorDetailView(CacheModelosMixin, DetailView):
     model = Conductor
+    modelos_cache = (Conductor,)
     template_name = 'core/conductor_detail.html'
     context_object_name = 'conductor'
 
@@ -126,8 +133,9 @@ class ConductorDeleteView(DeleteView):
 
 
 # Vistas para Lugares
-class LugarListView(ListView):
+class LugarListView(CacheModelosMixin, ListView):
     model = Lugar
+    modelos_cache = (Lugar,)
     template_name = 'core/lugar_list.html'
     context_object_name = 'lugares'
     paginate_by = 20
@@ -136,11 +144,21 @@ class LugarListView(ListView):
         return Lugar.objects.all().order_by('ciudad', 'nombre')
 
 
-class LugarDetailView(DetailView):
+class LugarDetailView(CacheModelosMixin, DetailView):
     model = Lugar
+    modelos_cache = (Lugar,)
     template_name = 'core/lugar_detail.html'
     context_object_name = 'lugar'
 
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        lugar = self.object
+        if lugar.latitud is not None and lugar.longitud is not None:
+            context['cercanos'] = geo.mas_cercanos(
+                lugar.latitud, lugar.longitud, n=5, queryset=Lugar.objects.exclude(pk=lugar.pk),
+            )
+        return context
+
 
 class LugarCreateView(CreateView):
     model = Lugar
@@ -161,7 +179,11 @@ class LugarUpdateView(UpdateView):
 
     def form_valid(self, form):
         messages.success(self.request, f'Lugar {form.instance.nombre} actualizado exitosamente.')
-        return super().form_valid(form)
+        respuesta = super().form_valid(form)
+        if {'latitud', 'longitud'} & set(form.changed_data):
+            # Solo la fila y la columna de este lugar en la matriz de distancias
+            matriz.recalcular_lugar(self.object.pk)
+        return respuesta
 
 
 class LugarDeleteView(DeleteView):
@@ -175,9 +197,100 @@ class LugarDeleteView(DeleteView):
         return super().delete(request, *args, **kwargs)
 
 
+MAX_CERCANOS = 100
+MAX_RADIO_KM = 500
+
+
+@require_safe
+def lugares_cercanos(request):
+    """
+    Lugares cercanos a un punto, del más cercano al más lejano (core/geo.py).
+
+    ?lat=&lon=          punto de referencia (obligatorios)
+    &radio=5            todos los lugares a no más de 5 km (hasta n)
+    &n=10               sin radio: los n más cercanos
+    &excluir=<id>       omite un lugar (el que se está editando)
+    """
+    try:
+        latitud = float(request.GET['lat'])
+        longitud = float(request.GET['lon'])
+        n = int(request.GET.get('n', 10))
+        radio = float(request.GET['radio']) if request.GET.get('radio') else None
+        excluir = int(request.GET['excluir']) if request.GET.get('excluir') else None
+    except (KeyError, ValueError):
+        return JsonResponse({'error': 'Parámetros inválidos: lat y lon son obligatorios.'}, status=400)
+    if not (-90 <= latitud <= 90 and -180 <= longitud <= 180):
+        return JsonResponse({'error': 'Coordenadas fuera de rango.'}, status=400)
+    if not 1 <= n <= MAX_CERCANOS or (radio is not None and not 0 < radio <= MAX_RADIO_KM):
+        return JsonResponse(
+            {'error': f'n debe estar entre 1 y {MAX_CERCANOS} y radio entre 0 y {MAX_RADIO_KM} km.'}, status=400
+        )
+
+    queryset = Lugar.objects.all()
+    if excluir is not None:
+        queryset = queryset.exclude(pk=excluir)
+    if radio is None:
+        lugares = geo.mas_cercanos(latitud, longitud, n, queryset=queryset)
+    else:
+        lugares = geo.en_radio(latitud, longitud, radio, limite=n, queryset=queryset)
+    return JsonResponse({
+        'lugares': [
+            {
+                'id': lugar.pk,
+                'nombre': lugar.nombre,
+                'ciudad': lugar.ciudad,
+                'latitud': float(lugar.latitud),
+                'longitud': float(lugar.longitud),
+                'distancia_km': lugar.distancia_km,
+            }
+            for lugar in lugares
+        ],
+    })
+
+
+def _respuesta_geocodificacion(obtener):
+    try:
+        datos = obtener()
+    except geocodificacion.LimiteExcedido as e:
+        respuesta = JsonResponse({'error': str(e)}, status=503)
+        respuesta['Retry-After'] = str(max(1, round(e.espera)))
+        return respuesta
+    except geocodificacion.ServicioNoDisponible:
+        return JsonResponse({'error': 'El servicio de geocodificación no está disponible.'}, status=502)
+    respuesta = JsonResponse(datos, safe=False)
+    respuesta['Cache-Control'] = 'private, max-age=3600'
+    return respuesta
+
+
+@require_safe
+def geocodificar_busqueda(request):
+    """
+    ?q=texto: resultados en el formato de búsqueda de Nominatim.
+    """
+    consulta = request.GET.get('q', '')
+    if len(geocodificacion.normalizar(consulta)) < 3:
+        return JsonResponse({'error': 'La búsqueda debe tener al menos 3 caracteres.'}, status=400)
+    return _respuesta_geocodificacion(lambda: geocodificacion.buscar(consulta))
+
+
+@require_safe
+def geocodificar_inversa(request):
+    """
+    ?lat=&lon=: dirección del punto en el formato inverso de Nominatim.
+    """
+    try:
+        latitud, longitud = float(request.GET['lat']), float(request.GET['lon'])
+    except (KeyError, ValueError):
+        return JsonResponse({'error': 'Parámetros inválidos: lat y lon son obligatorios.'}, status=400)
+    if not (-90 <= latitud <= 90 and -180 <= longitud <= 180):
+        return JsonResponse({'error': 'Coordenadas fuera de rango.'}, status=400)
+    return _respuesta_geocodificacion(lambda: geocodificacion.inversa(latitud, longitud))
+
+
 # Vistas para Pasajeros
-class PasajeroListView(ListView):
+class PasajeroListView(CacheModelosMixin, ListView):
     model = Pasajero
+    modelos_cache = (Pasajero,)
     template_name = 'core/pasajero_list.html'
     context_object_name = 'pasajeros'
     paginate_by = 20
@@ -186,8 +299,9 @@ class PasajeroListView(ListView):
         return Pasajero.objects.all().order_by('-creado_en')
 
 
-class PasajeroDetailView(DetailView):
+class PasajeroDetailView(CacheModelosMixin, DetailView):
     model = Pasajero
+    modelos_cache = (Pasajero,)
     template_name = 'core/pasajero_detail.html'
     context_object_name = 'pasajero'
 
@@ -225,7 +339,9 @@ class PasajeroDeleteView(DeleteView):
         return super().delete(request, *args, **kwargs)
 
 
-# Vista Home - redirige a buses por defecto
+# Vista Home - panel de indicadores de la flota (en caché, ver core.dashboard)
 def home_view(request):
-    from django.shortcuts import redirect
-    return redirect('flota:bus_list')
+    return render(request, 'home.html', {
+        'indicadores': obtener_indicadores(),
+        'dias_por_vencer': DIAS_POR_VENCER,
+    })
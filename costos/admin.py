@@ -21,7 +21,8 @@ class CostosViajeAdmin(admin.ModelAdmin):
             'fields': ('observaciones',)
         }),
     )
-    readonly_fields = ('costo_total', 'creado_en', 'actualizado_en')
+    # peajes se mantiene con deltas desde Peaje (ver Peaje.save y costos.signals)
+    readonly_fields = ('peajes', 'costo_total', 'creado_en', 'actualizado_en')
 
 
 @admin.register(Peaje)
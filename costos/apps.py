@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class CostosConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'costos'
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from costos.resumen import reconstruir
+
+
+class Command(BaseCommand):
+    help = 'Reconstruye la tabla resumen de costos (ResumenCosto) desde cero'
+
+    def handle(self, *args, **options):
+        total = reconstruir()
+        self.stdout.write(self.style.SUCCESS(f'Resumen de costos reconstruido: {total} filas'))
@@ -0,0 +1,50 @@
+# Generated by Django 5.2.8 on 2026-10-18 10:51
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def reconciliar_peajes(apps, schema_editor):
+    """
+    Desde esta versión CostosViaje.peajes se mantiene con deltas, así que se
+    parte de totales correctos: se crean los costos que faltan para viajes con
+    peajes y se recalculan peajes y costo_total con dos UPDATE.
+    """
+    CostosViaje = apps.get_model('costos', 'CostosViaje')
+    Peaje = apps.get_model('costos', 'Peaje')
+    cero = Value(Decimal('0'), output_field=models.DecimalField())
+
+    sin_costos = (
+        Peaje.objects.exclude(viaje_id__in=CostosViaje.objects.values('viaje_id'))
+        .values_list('viaje_id', flat=True)
+        .distinct()
+    )
+    CostosViaje.objects.bulk_create([CostosViaje(viaje_id=viaje_id) for viaje_id in sin_costos])
+
+    total_peajes = (
+        Peaje.objects.filter(viaje_id=OuterRef('viaje_id'))
+        .values('viaje_id')
+        .annotate(total=Sum('monto'))
+        .values('total')
+    )
+    CostosViaje.objects.update(peajes=Coalesce(Subquery(total_peajes), cero))
+    CostosViaje.objects.update(
+        costo_total=(
+            Coalesce('combustible', cero) + Coalesce('mantenimiento', cero)
+            + Coalesce('peajes', cero) + Coalesce('otros_costos', cero)
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('costos', '0003_alter_costosviaje_combustible_and_more'),
+    ]
+
+    operations = [
+        migrations.RunPython(reconciliar_peajes, migrations.RunPython.noop),
+    ]
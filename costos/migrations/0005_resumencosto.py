@@ -0,0 +1,45 @@
+# Generated by Django 5.2.8 on 2026-10-18 10:54
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_pasajero_nombre_idx'),
+        ('costos', '0004_reconciliar_peajes'),
+        ('flota', '0003_bus_kilometraje_inicial_alter_bus_marca'),
+        ('viajes', '0007_viajepasajero_asiento_unico'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResumenCosto',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('clave', models.CharField(max_length=100, unique=True)),
+                ('mes', models.DateField()),
+                ('num_viajes', models.PositiveIntegerField(default=0)),
+                ('combustible', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('peajes', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('mantenimiento', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('otros_costos', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('costo_viajes', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('num_mantenimientos', models.PositiveIntegerField(default=0)),
+                ('mantenimiento_flota', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('actualizado_en', models.DateTimeField(auto_now=True)),
+                ('bus', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='flota.bus')),
+                ('conductor', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='core.conductor')),
+                ('lugar_destino', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='core.lugar')),
+                ('lugar_origen', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='core.lugar')),
+            ],
+            options={
+                'verbose_name': 'Resumen de Costos',
+                'verbose_name_plural': 'Resúmenes de Costos',
+                'ordering': ['mes'],
+                'indexes': [models.Index(fields=['mes', 'bus'], name='resumen_mes_bus_idx'), models.Index(fields=['mes', 'conductor'], name='resumen_mes_conductor_idx'), models.Index(fields=['mes', 'lugar_origen', 'lugar_destino'], name='resumen_mes_ruta_idx')],
+            },
+        ),
+        # La carga inicial de la tabla la hace 0006, con todas las columnas
+    ]
@@ -0,0 +1,107 @@
+# Generated by Django 5.2.8 on 2026-10-18 11:20
+
+from datetime import date, datetime
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+# Copia congelada de costos.resumen.reconstruir: la migración no depende del
+# código actual
+CERO = Decimal('0')
+TAMANO_LOTE = 1000
+CAMPOS_VIAJE = ('combustible', 'peajes', 'mantenimiento', 'otros_costos', 'costo_viajes', 'distancia_km')
+
+
+def inicio_mes(valor):
+    if isinstance(valor, datetime):
+        valor = timezone.localtime(valor) if timezone.is_aware(valor) else valor
+        valor = valor.date()
+    return date(valor.year, valor.month, 1)
+
+
+def clave_texto(mes, *ids):
+    ids = ids + (None,) * (4 - len(ids))
+    return ':'.join([f'{mes:%Y-%m}'] + ['' if i is None else str(i) for i in ids])
+
+
+def cargar_resumen(apps, schema_editor):
+    ResumenCosto = apps.get_model('costos', 'ResumenCosto')
+    Viaje = apps.get_model('viajes', 'Viaje')
+    Mantenimiento = apps.get_model('flota', 'Mantenimiento')
+
+    viajes = (
+        Viaje.objects
+        .annotate(mes=TruncMonth('fecha_salida'))
+        .values('mes', 'bus_id', 'conductor_id', 'lugar_origen_id', 'lugar_destino_id')
+        .annotate(
+            num_viajes=Count('id'),
+            combustible=Sum('costos__combustible'),
+            peajes=Sum('costos__peajes'),
+            mantenimiento=Sum('costos__mantenimiento'),
+            otros_costos=Sum('costos__otros_costos'),
+            costo_viajes=Sum('costos__costo_total'),
+            distancia_km=Sum('distancia_km'),
+        )
+        .order_by()
+    )
+    mantenimientos = (
+        Mantenimiento.objects
+        .annotate(mes=TruncMonth('fecha_mantenimiento'))
+        .values('mes', 'bus_id')
+        .annotate(num_mantenimientos=Count('id'), mantenimiento_flota=Sum('costo'))
+        .order_by()
+    )
+
+    def filas():
+        for fila in viajes.iterator():
+            mes = inicio_mes(fila['mes'])
+            ids = (fila['bus_id'], fila['conductor_id'], fila['lugar_origen_id'], fila['lugar_destino_id'])
+            yield ResumenCosto(
+                clave=clave_texto(mes, *ids),
+                mes=mes,
+                bus_id=fila['bus_id'],
+                conductor_id=fila['conductor_id'],
+                lugar_origen_id=fila['lugar_origen_id'],
+                lugar_destino_id=fila['lugar_destino_id'],
+                num_viajes=fila['num_viajes'],
+                **{campo: fila[campo] or CERO for campo in CAMPOS_VIAJE},
+            )
+        for fila in mantenimientos.iterator():
+            mes = inicio_mes(fila['mes'])
+            yield ResumenCosto(
+                clave=clave_texto(mes, fila['bus_id']),
+                mes=mes,
+                bus_id=fila['bus_id'],
+                num_mantenimientos=fila['num_mantenimientos'],
+                mantenimiento_flota=fila['mantenimiento_flota'] or CERO,
+            )
+
+    ResumenCosto.objects.all().delete()
+    lote = []
+    for resumen in filas():
+        lote.append(resumen)
+        if len(lote) >= TAMANO_LOTE:
+            ResumenCosto.objects.bulk_create(lote)
+            lote = []
+    if lote:
+        ResumenCosto.objects.bulk_create(lote)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('costos', '0005_resumencosto'),
+        ('viajes', '0010_calcular_distancias'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='resumencosto',
+            name='distancia_km',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=14),
+        ),
+        migrations.RunPython(cargar_resumen, migrations.RunPython.noop),
+    ]
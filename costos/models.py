@@ -1,5 +1,13 @@
-from django.db import models
+from collections import defaultdict
+from decimal import Decimal
+from django.db import models, transaction
+from django.db.models import F, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from core.models import Conductor, Lugar
+from flota.models import Bus
 from viajes.models import Viaje
+from .resumen import refrescar_viaje
 
 
 class CostosViaje(models.Model):
@@ -34,6 +42,54 @@ class CostosViaje(models.Model):
     def __str__(self):
         return f"Costos - {self.viaje.bus.placa} ({self.viaje.fecha_salida.date()})"
 
+    @classmethod
+    def aplicar_delta_peajes(cls, viaje_id, delta, crear=True):
+        """
+        Suma delta a peajes y costo_total con un UPDATE atómico en la base de
+        datos, sin leer ni recalcular los peajes del viaje. Si el viaje aún no
+        tiene costos y crear es True, los crea con el total real de peajes.
+        """
+        delta = Decimal(str(delta or 0))
+        if not delta:
+            return
+        actualizados = cls.objects.filter(viaje_id=viaje_id).update(
+            peajes=Coalesce(F('peajes'), Value(Decimal('0')), output_field=models.DecimalField()) + delta,
+            costo_total=F('costo_total') + delta,
+            actualizado_en=timezone.now(),
+        )
+        if actualizados:
+            # UPDATE no emite señales: se refresca aquí el resumen del viaje
+            refrescar_viaje(viaje_id)
+        if actualizados or not crear:
+            return
+        total = Peaje.objects.filter(viaje_id=viaje_id).aggregate(total=Sum('monto'))['total'] or 0
+        _, creado = cls.objects.get_or_create(viaje_id=viaje_id, defaults={'peajes': total})
+        if not creado:
+            # Otro proceso lo creó entre medio: se aplica el delta sobre esa fila
+            cls.aplicar_delta_peajes(viaje_id, delta, crear=False)
+
+
+class PeajeQuerySet(models.QuerySet):
+    def bulk_create(self, objs, *args, **kwargs):
+        """
+        bulk_create no llama a save(): los totales de CostosViaje se ajustan
+        con un delta por viaje. Con ignore_conflicts/update_conflicts no se
+        sabe qué filas entraron, así que se recalculan los viajes afectados.
+        """
+        with transaction.atomic(using=self.db):
+            objs = super().bulk_create(objs, *args, **kwargs)
+            viaje_ids = {peaje.viaje_id for peaje in objs}
+            if kwargs.get('ignore_conflicts') or kwargs.get('update_conflicts'):
+                for viaje_id in viaje_ids:
+                    Peaje.recalcular_total(viaje_id)
+            else:
+                deltas = defaultdict(Decimal)
+                for peaje in objs:
+                    deltas[peaje.viaje_id] += Decimal(str(peaje.monto))
+                for viaje_id, delta in deltas.items():
+                    CostosViaje.aplicar_delta_peajes(viaje_id, delta)
+        return objs
+
 
 class Peaje(models.Model):
     """
@@ -46,10 +102,84 @@ class Peaje(models.Model):
     comprobante = models.CharField(max_length=50, blank=True)
     creado_en = models.DateTimeField(auto_now_add=True)
 
+    objects = PeajeQuerySet.as_manager()
+
     class Meta:
         ordering = ['-fecha_pago']
         verbose_name = 'Peaje'
         verbose_name_plural = 'Peajes'
 
     def __str__(self):
-        return f"Peaje en {self.lugar} - ${self.monto}"
\ No newline at end of file
+        return f"Peaje en {self.lugar} - ${self.monto}"
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Valores guardados, para calcular el delta si el peaje se modifica
+        instance._guardado = (instance.__dict__.get('viaje_id'), instance.__dict__.get('monto'))
+        return instance
+
+    def save(self, *args, **kwargs):
+        """
+        Guarda el peaje y ajusta los totales de CostosViaje con deltas en la
+        misma transacción. La eliminación se maneja en costos.signals.
+        """
+        guardado = getattr(self, '_guardado', None)
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if guardado and guardado[0] == self.viaje_id:
+                delta = Decimal(str(self.monto)) - Decimal(str(guardado[1] or 0))
+                CostosViaje.aplicar_delta_peajes(self.viaje_id, delta)
+            else:
+                if guardado and guardado[0] is not None:
+                    CostosViaje.aplicar_delta_peajes(guardado[0], -Decimal(str(guardado[1] or 0)), crear=False)
+                CostosViaje.aplicar_delta_peajes(self.viaje_id, self.monto)
+        self._guardado = (self.viaje_id, self.monto)
+
+    @staticmethod
+    def recalcular_total(viaje_id):
+        """
+        Recalcula desde cero los peajes de un viaje (para reparar totales).
+        """
+        with transaction.atomic():
+            costos, _ = CostosViaje.objects.select_for_update().get_or_create(viaje_id=viaje_id)
+            costos.peajes = Peaje.objects.filter(viaje_id=viaje_id).aggregate(total=Sum('monto'))['total'] or 0
+            costos.save()
+
+
+class ResumenCosto(models.Model):
+    """
+    Tabla resumen para los reportes de costos, mantenida incrementalmente
+    (ver costos.resumen). Cada fila agrupa un mes y una combinación
+    bus / conductor / ruta. Las filas con conductor vacío acumulan los
+    mantenimientos del bus (flota.Mantenimiento) en ese mes.
+    """
+    clave = models.CharField(max_length=100, unique=True)
+    mes = models.DateField()
+    bus = models.ForeignKey(Bus, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    conductor = models.ForeignKey(Conductor, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    lugar_origen = models.ForeignKey(Lugar, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    lugar_destino = models.ForeignKey(Lugar, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    num_viajes = models.PositiveIntegerField(default=0)
+    combustible = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    peajes = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    mantenimiento = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    otros_costos = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    costo_viajes = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    distancia_km = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    num_mantenimientos = models.PositiveIntegerField(default=0)
+    mantenimiento_flota = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    actualizado_en = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['mes']
+        verbose_name = 'Resumen de Costos'
+        verbose_name_plural = 'Resúmenes de Costos'
+        indexes = [
+            models.Index(fields=['mes', 'bus'], name='resumen_mes_bus_idx'),
+            models.Index(fields=['mes', 'conductor'], name='resumen_mes_conductor_idx'),
+            models.Index(fields=['mes', 'lugar_origen', 'lugar_destino'], name='resumen_mes_ruta_idx'),
+        ]
+
+    def __str__(self):
+        return f"Resumen {self.mes:%Y-%m} ({self.clave})"
@@ -0,0 +1,236 @@
+"""
+Mantenimiento de la tabla ResumenCosto.
+
+Cada cambio en un viaje, sus costos, sus peajes o un mantenimiento recalcula
+solo el grupo afectado (mes + bus + conductor + ruta) con una agregación sobre
+índices, en lugar de recorrer todas las tablas. reconstruir() rehace la tabla
+completa con dos consultas agrupadas (carga inicial o reparación).
+"""
+from datetime import date, datetime, time
+from decimal import Decimal
+
+from django.apps import apps as django_apps
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+CERO = Decimal('0')
+
+
+def inicio_mes(valor):
+    """
+    Primer día del mes de una fecha o de un datetime (en la zona horaria local).
+    Acepta también texto ISO, como el que se asigna a un modelo antes de guardar.
+    """
+    if isinstance(valor, str):
+        valor = parse_datetime(valor) or parse_date(valor)
+    if isinstance(valor, datetime):
+        valor = timezone.localtime(valor) if timezone.is_aware(valor) else valor
+        valor = valor.date()
+    return date(valor.year, valor.month, 1)
+
+
+def mes_siguiente(mes):
+    return date(mes.year + mes.month // 12, mes.month % 12 + 1, 1)
+
+
+def armar_clave(mes, bus_id, conductor_id=None, lugar_origen_id=None, lugar_destino_id=None):
+    return (mes, bus_id, conductor_id, lugar_origen_id, lugar_destino_id)
+
+
+def _clave_texto(clave):
+    mes, *ids = clave
+    return ':'.join([f'{mes:%Y-%m}'] + ['' if i is None else str(i) for i in ids])
+
+
+def clave_viaje(viaje):
+    return armar_clave(
+        inicio_mes(viaje.fecha_salida), viaje.bus_id, viaje.conductor_id,
+        viaje.lugar_origen_id, viaje.lugar_destino_id,
+    )
+
+
+def clave_mantenimiento(mantenimiento):
+    return armar_clave(inicio_mes(mantenimiento.fecha_mantenimiento), mantenimiento.bus_id)
+
+
+def _rango(mes):
+    desde = timezone.make_aware(datetime.combine(mes, time.min))
+    hasta = timezone.make_aware(datetime.combine(mes_siguiente(mes), time.min))
+    return desde, hasta
+
+
+def _totales_viajes(clave):
+    Viaje = django_apps.get_model('viajes', 'Viaje')
+    mes, bus_id, conductor_id, lugar_origen_id, lugar_destino_id = clave
+    desde, hasta = _rango(mes)
+    totales = Viaje.objects.filter(
+        bus_id=bus_id,
+        conductor_id=conductor_id,
+        lugar_origen_id=lugar_origen_id,
+        lugar_destino_id=lugar_destino_id,
+        fecha_salida__gte=desde,
+        fecha_salida__lt=hasta,
+    ).aggregate(
+        num_viajes=Count('id'),
+        combustible=Sum('costos__combustible'),
+        peajes=Sum('costos__peajes'),
+        mantenimiento=Sum('costos__mantenimiento'),
+        otros_costos=Sum('costos__otros_costos'),
+        costo_viajes=Sum('costos__costo_total'),
+        distancia_km=Sum('distancia_km'),
+    )
+    return totales['num_viajes'], {campo: valor or CERO for campo, valor in totales.items() if campo != 'num_viajes'}
+
+
+def _totales_mantenimiento(clave):
+    Mantenimiento = django_apps.get_model('flota', 'Mantenimiento')
+    mes, bus_id = clave[0], clave[1]
+    totales = Mantenimiento.objects.filter(
+        bus_id=bus_id,
+        fecha_mantenimiento__gte=mes,
+        fecha_mantenimiento__lt=mes_siguiente(mes),
+    ).aggregate(num_mantenimientos=Count('id'), mantenimiento_flota=Sum('costo'))
+    return totales['num_mantenimientos'], {'mantenimiento_flota': totales['mantenimiento_flota'] or CERO}
+
+
+def refrescar(claves):
+    """
+    Recalcula los grupos indicados. Las claves sin conductor corresponden a
+    mantenimientos del bus; el resto, a viajes.
+
+    La fila del grupo se bloquea (creándola si falta) antes de agregar: dos
+    transacciones que cambian el mismo grupo se serializan y la segunda suma
+    con los cambios ya confirmados de la primera, en lugar de escribir un
+    total viejo. Los grupos se bloquean siempre en el mismo orden.
+    """
+    ResumenCosto = django_apps.get_model('costos', 'ResumenCosto')
+    claves = {clave for clave in claves if clave[1] is not None or clave[2] is not None}
+    for clave in sorted(claves, key=_clave_texto):
+        mes, bus_id, conductor_id, lugar_origen_id, lugar_destino_id = clave
+        with transaction.atomic():
+            resumen, _ = ResumenCosto.objects.select_for_update().get_or_create(
+                clave=_clave_texto(clave),
+                defaults=dict(
+                    mes=mes,
+                    bus_id=bus_id,
+                    conductor_id=conductor_id,
+                    lugar_origen_id=lugar_origen_id,
+                    lugar_destino_id=lugar_destino_id,
+                ),
+            )
+            if conductor_id is None:
+                cantidad, valores = _totales_mantenimiento(clave)
+                valores['num_mantenimientos'] = cantidad
+            else:
+                cantidad, valores = _totales_viajes(clave)
+                valores['num_viajes'] = cantidad
+            if not cantidad:
+                resumen.delete()
+                continue
+            for campo, valor in valores.items():
+                setattr(resumen, campo, valor)
+            resumen.save()
+
+
+def refrescar_viaje(viaje_id):
+    """
+    Recalcula el grupo de un viaje a partir de su id (por ejemplo tras un
+    UPDATE de costos que no emite señales).
+    """
+    Viaje = django_apps.get_model('viajes', 'Viaje')
+    viaje = Viaje.objects.filter(pk=viaje_id).only(
+        'fecha_salida', 'bus_id', 'conductor_id', 'lugar_origen_id', 'lugar_destino_id'
+    ).first()
+    if viaje is not None:
+        refrescar([clave_viaje(viaje)])
+
+
+def claves_de_viajes(queryset):
+    """
+    Claves de un conjunto de viajes, para refrescarlas después de un
+    queryset.update() (que no emite señales).
+    """
+    return {
+        armar_clave(inicio_mes(fecha), bus_id, conductor_id, origen_id, destino_id)
+        for fecha, bus_id, conductor_id, origen_id, destino_id in queryset.values_list(
+            'fecha_salida', 'bus_id', 'conductor_id', 'lugar_origen_id', 'lugar_destino_id'
+        )
+    }
+
+
+def reconstruir(apps=django_apps, tamano_lote=1000):
+    """
+    Rehace la tabla completa con dos consultas agrupadas por mes. Recibe el
+    registro de apps para poder usarse también desde una migración.
+    """
+    ResumenCosto = apps.get_model('costos', 'ResumenCosto')
+    Viaje = apps.get_model('viajes', 'Viaje')
+    Mantenimiento = apps.get_model('flota', 'Mantenimiento')
+
+    viajes = (
+        Viaje.objects
+        .annotate(mes=TruncMonth('fecha_salida'))
+        .values('mes', 'bus_id', 'conductor_id', 'lugar_origen_id', 'lugar_destino_id')
+        .annotate(
+            num_viajes=Count('id'),
+            combustible=Sum('costos__combustible'),
+            peajes=Sum('costos__peajes'),
+            mantenimiento=Sum('costos__mantenimiento'),
+            otros_costos=Sum('costos__otros_costos'),
+            costo_viajes=Sum('costos__costo_total'),
+            distancia_km=Sum('distancia_km'),
+        )
+        .order_by()
+    )
+    mantenimientos = (
+        Mantenimiento.objects
+        .annotate(mes=TruncMonth('fecha_mantenimiento'))
+        .values('mes', 'bus_id')
+        .annotate(num_mantenimientos=Count('id'), mantenimiento_flota=Sum('costo'))
+        .order_by()
+    )
+
+    def filas():
+        campos_viaje = ('combustible', 'peajes', 'mantenimiento', 'otros_costos', 'costo_viajes', 'distancia_km')
+        for fila in viajes.iterator():
+            clave = armar_clave(
+                inicio_mes(fila['mes']), fila['bus_id'], fila['conductor_id'],
+                fila['lugar_origen_id'], fila['lugar_destino_id'],
+            )
+            yield ResumenCosto(
+                clave=_clave_texto(clave),
+                mes=clave[0],
+                bus_id=fila['bus_id'],
+                conductor_id=fila['conductor_id'],
+                lugar_origen_id=fila['lugar_origen_id'],
+                lugar_destino_id=fila['lugar_destino_id'],
+                num_viajes=fila['num_viajes'],
+                **{campo: fila[campo] or CERO for campo in campos_viaje},
+            )
+        for fila in mantenimientos.iterator():
+            clave = armar_clave(inicio_mes(fila['mes']), fila['bus_id'])
+            yield ResumenCosto(
+                clave=_clave_texto(clave),
+                mes=clave[0],
+                bus_id=fila['bus_id'],
+                num_mantenimientos=fila['num_mantenimientos'],
+                mantenimiento_flota=fila['mantenimiento_flota'] or CERO,
+            )
+
+    total = 0
+    with transaction.atomic():
+        ResumenCosto.objects.all().delete()
+        lote = []
+        for resumen in filas():
+            lote.append(resumen)
+            if len(lote) >= tamano_lote:
+                ResumenCosto.objects.bulk_create(lote)
+                total += len(lote)
+                lote = []
+        if lote:
+            ResumenCosto.objects.bulk_create(lote)
+            total += len(lote)
+    return total
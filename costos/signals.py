@@ -0,0 +1,58 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from flota.models import Mantenimiento
+from viajes.models import Viaje
+from .models import CostosViaje, Peaje
+from .resumen import clave_mantenimiento, clave_viaje, refrescar, refrescar_viaje
+
+
+@receiver(post_delete, sender=Peaje)
+def descontar_peaje(sender, instance, **kwargs):
+    """
+    Descuenta el peaje eliminado de los totales del viaje. Cubre delete() de una
+    instancia y de un queryset (incluida la acción masiva del admin), que
+    siempre emiten post_delete dentro de la transacción del borrado.
+    """
+    CostosViaje.aplicar_delta_peajes(instance.viaje_id, -instance.monto, crear=False)
+
+
+# Resumen de costos (ResumenCosto): se refrescan solo los grupos afectados
+
+@receiver(post_save, sender=CostosViaje)
+@receiver(post_delete, sender=CostosViaje)
+def resumen_costos_viaje(sender, instance, **kwargs):
+    refrescar_viaje(instance.viaje_id)
+
+
+@receiver(pre_save, sender=Viaje)
+@receiver(pre_save, sender=Mantenimiento)
+def resumen_clave_anterior(sender, instance, **kwargs):
+    """
+    Guarda la clave del grupo antes de modificar, por si cambian la fecha, el
+    bus, el conductor o la ruta y hay que refrescar también el grupo anterior.
+    """
+    instance._clave_resumen = None
+    if instance.pk:
+        anterior = sender.objects.filter(pk=instance.pk).first()
+        if anterior is not None:
+            instance._clave_resumen = (
+                clave_viaje(anterior) if sender is Viaje else clave_mantenimiento(anterior)
+            )
+
+
+@receiver(post_save, sender=Viaje)
+@receiver(post_delete, sender=Viaje)
+def resumen_viaje(sender, instance, **kwargs):
+    claves = [clave_viaje(instance)]
+    if getattr(instance, '_clave_resumen', None):
+        claves.append(instance._clave_resumen)
+    refrescar(claves)
+
+
+@receiver(post_save, sender=Mantenimiento)
+@receiver(post_delete, sender=Mantenimiento)
+def resumen_mantenimiento(sender, instance, **kwargs):
+    claves = [clave_mantenimiento(instance)]
+    if getattr(instance, '_clave_resumen', None):
+        claves.append(instance._clave_resumen)
+    refrescar(claves)
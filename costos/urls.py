@@ -4,5 +4,5 @@ from . import views
 app_name = 'costos'
 
 urlpatterns = [
-    # TODO: Agregar rutas de la app costos
+    path('reportes/', views.ReporteCostosView.as_view(), name='reporte_costos'),
 ]
@@ -1,6 +1,155 @@
+import csv
+from datetime import date
+from django import forms
+from django.db.models import DecimalField, F, Sum
+from django.db.models.functions import NullIf, Round
+from django.http import HttpResponse
 from django.shortcuts import render
 from django.views import View
-from .models import CostosViaje, Peaje
+from .models import ResumenCosto
+from .resumen import mes_siguiente
 
 
-# TODO: Implementar vistas para análisis de costos y generación de reportes
+class ReporteCostosForm(forms.Form):
+    AGRUPACIONES = [
+        ('bus', 'Por bus'),
+        ('ruta', 'Por ruta'),
+        ('conductor', 'Por conductor'),
+        ('mes', 'Por mes'),
+    ]
+
+    agrupar = forms.ChoiceField(
+        choices=AGRUPACIONES,
+        initial='bus',
+        required=False,
+        widget=forms.Select(attrs={'class': 'form-select form-select-sm'})
+    )
+    desde = forms.DateField(
+        required=False,
+        input_formats=['%Y-%m', '%Y-%m-%d'],
+        widget=forms.DateInput(attrs={'class': 'form-control form-control-sm', 'type': 'month'}, format='%Y-%m')
+    )
+    hasta = forms.DateField(
+        required=False,
+        input_formats=['%Y-%m', '%Y-%m-%d'],
+        widget=forms.DateInput(attrs={'class': 'form-control form-control-sm', 'type': 'month'}, format='%Y-%m')
+    )
+
+
+# Cada agrupación: (claves del grupo, campos mostrados, encabezados, filtro de
+# filas). Se agrupa por ids para no fusionar lugares o conductores homónimos;
+# los nombres dependen del id y no parten los grupos.
+AGRUPACIONES = {
+    'bus': (('bus_id',), ('bus__placa',), ('Bus',), {'bus__isnull': False}),
+    'ruta': (
+        ('lugar_origen_id', 'lugar_destino_id'), ('lugar_origen__nombre', 'lugar_destino__nombre'),
+        ('Origen', 'Destino'), {'conductor__isnull': False},
+    ),
+    'conductor': (
+        ('conductor_id',), ('conductor__apellido', 'conductor__nombre'),
+        ('Apellido', 'Nombre'), {'conductor__isnull': False},
+    ),
+    'mes': (('mes',), ('mes',), ('Mes',), {}),
+}
+
+# (campo, encabezado, formato)
+COLUMNAS = [
+    ('num_viajes', 'Viajes', 'numero'),
+    ('distancia_km', 'Km', 'km'),
+    ('combustible', 'Combustible', 'dinero'),
+    ('peajes', 'Peajes', 'dinero'),
+    ('mantenimiento', 'Mantenimiento (viajes)', 'dinero'),
+    ('otros_costos', 'Otros', 'dinero'),
+    ('costo_viajes', 'Costo viajes', 'dinero'),
+    ('costo_km', 'Costo/km', 'dinero'),
+    ('mantenimiento_flota', 'Mantenimiento flota', 'dinero'),
+    ('total', 'Total', 'dinero'),
+]
+
+
+def costo_por_km(costo, km):
+    return round(costo / km, 2) if km else None
+
+
+def reporte_costos(agrupar, desde=None, hasta=None):
+    """
+    Agrega la tabla ResumenCosto (no las tablas de origen) según la agrupación
+    pedida. Por ruta y por conductor solo cuentan las filas de viajes; los
+    mantenimientos de flota no tienen ruta ni conductor.
+    """
+    claves, campos, _, filtro = AGRUPACIONES[agrupar]
+    queryset = ResumenCosto.objects.filter(**filtro)
+    if desde:
+        queryset = queryset.filter(mes__gte=desde.replace(day=1))
+    if hasta:
+        queryset = queryset.filter(mes__lt=mes_siguiente(hasta.replace(day=1)))
+    return (
+        queryset
+        .values(*dict.fromkeys(claves + campos))
+        .annotate(
+            num_viajes=Sum('num_viajes'),
+            combustible=Sum('combustible'),
+            peajes=Sum('peajes'),
+            mantenimiento=Sum('mantenimiento'),
+            otros_costos=Sum('otros_costos'),
+            costo_viajes=Sum('costo_viajes'),
+            distancia_km=Sum('distancia_km'),
+            mantenimiento_flota=Sum('mantenimiento_flota'),
+        )
+        .annotate(
+            total=F('costo_viajes') + F('mantenimiento_flota'),
+            # Sobre las sumas del grupo: sin cálculos por viaje
+            costo_km=Round(
+                F('costo_viajes') / NullIf(F('distancia_km'), 0), 2,
+                output_field=DecimalField(max_digits=14, decimal_places=2),
+            ),
+        )
+        .order_by(*(('mes',) if agrupar == 'mes' else ('-total',)))
+    )
+
+
+class ReporteCostosView(View):
+    """
+    Reporte de costos por bus, ruta, conductor o mes, con exportación a CSV.
+    """
+    template_name = 'costos/reporte_costos.html'
+
+    def get(self, request):
+        form = ReporteCostosForm(request.GET or None)
+        filtros = form.cleaned_data if form.is_valid() else {}
+        if not filtros.get('desde') and not filtros.get('hasta'):
+            # Por defecto, el año en curso
+            filtros = dict(filtros, desde=date(date.today().year, 1, 1))
+        agrupar = filtros.get('agrupar') or 'bus'
+        filas = list(reporte_costos(agrupar, filtros.get('desde'), filtros.get('hasta')))
+        _, campos, encabezados, _ = AGRUPACIONES[agrupar]
+
+        if request.GET.get('formato') == 'csv':
+            return self.exportar_csv(agrupar, campos, encabezados, filas)
+
+        totales = {
+            columna: sum(fila[columna] or 0 for fila in filas)
+            for columna, _, _ in COLUMNAS
+        }
+        totales['costo_km'] = costo_por_km(totales['costo_viajes'], totales['distancia_km'])
+        context = {
+            'form': form,
+            'agrupar': agrupar,
+            'encabezados': encabezados,
+            'columnas': COLUMNAS,
+            'filas': [
+                ([fila[campo] for campo in campos], [(fila[columna], formato) for columna, _, formato in COLUMNAS])
+                for fila in filas
+            ],
+            'totales': [(totales[columna], formato) for columna, _, formato in COLUMNAS],
+        }
+        return render(request, self.template_name, context)
+
+    def exportar_csv(self, agrupar, campos, encabezados, filas):
+        response = HttpResponse(content_type='text/csv; charset=utf-8')
+        response['Content-Disposition'] = f'attachment; filename="reporte_costos_{agrupar}.csv"'
+        writer = csv.writer(response)
+        writer.writerow(list(encabezados) + [titulo for _, titulo, _ in COLUMNAS])
+        for fila in filas:
+            writer.writerow([fila[campo] for campo in campos] + [fila[columna] or 0 for columna, _, _ in COLUMNAS])
+        return response
@@ -1,10 +1,11 @@
 from django.contrib import admin
-from .models import Bus, DocumentoVehiculo, Mantenimiento
+from .models import Bus, DocumentoVehiculo, LecturaOdometro, Mantenimiento, PronosticoMantenimiento
+from .odometro import recalcular_actual
 
 
 @admin.register(Bus)
 class BusAdmin(admin.ModelAdmin):
-    list_display = ('placa', 'modelo', 'año_fabricacion', 'capacidad_pasajeros', 'estado')
+    list_display = ('placa', 'modelo', 'año_fabricacion', 'capacidad_pasajeros', 'kilometraje_actual', 'estado')
     list_filter = ('estado', 'año_fabricacion')
     search_fields = ('placa', 'modelo', 'numero_chasis')
     fieldsets = (
@@ -17,19 +18,23 @@ class BusAdmin(admin.ModelAdmin):
         ('Estado', {
             'fields': ('estado', 'fecha_adquisicion')
         }),
+        ('Kilometraje', {
+            'fields': ('kilometraje_inicial', 'kilometraje_actual', 'kilometraje_actualizado_en')
+        }),
         ('Metadatos', {
             'fields': ('creado_en', 'actualizado_en'),
             'classes': ('collapse',)
         }),
     )
-    readonly_fields = ('creado_en', 'actualizado_en')
+    readonly_fields = ('kilometraje_actual', 'kilometraje_actualizado_en', 'creado_en', 'actualizado_en')
 
 
 @admin.register(DocumentoVehiculo)
 class DocumentoVehiculoAdmin(admin.ModelAdmin):
-    list_display = ('bus', 'tipo', 'numero_documento', 'fecha_vencimiento')
-    list_filter = ('tipo', 'fecha_vencimiento')
-    search_fields = ('bus__placa', 'numero_documento')
+    list_display = ('bus', 'tipo', 'numero_documento', 'fecha_vencimiento', 'procesamiento_estado')
+    list_filter = ('tipo', 'fecha_vencimiento', 'procesamiento_estado')
+    search_fields = ('bus__placa', 'numero_documento', 'texto')
+    readonly_fields = ('nombre_archivo', 'sha256', 'tipo_mime', 'paginas', 'procesamiento_estado', 'procesamiento')
     fieldsets = (
         ('Información del Documento', {
             'fields': ('bus', 'tipo', 'numero_documento')
@@ -38,7 +43,10 @@ class DocumentoVehiculoAdmin(admin.ModelAdmin):
             'fields': ('fecha_emision', 'fecha_vencimiento')
         }),
         ('Archivo', {
-            'fields': ('archivo',)
+            'fields': ('archivo', 'nombre_archivo')
+        }),
+        ('Procesamiento', {
+            'fields': ('procesamiento_estado', 'sha256', 'tipo_mime', 'paginas', 'procesamiento')
         }),
     )
 
@@ -59,3 +67,49 @@ class MantenimientoAdmin(admin.ModelAdmin):
             'fields': ('observaciones',)
         }),
     )
+
+
+@admin.register(PronosticoMantenimiento)
+class PronosticoMantenimientoAdmin(admin.ModelAdmin):
+    """
+    Solo lectura: la tabla la rehace manage.py pronosticar_mantenimientos.
+    """
+    list_display = ('bus', 'fecha_proxima', 'km_proximo', 'costo_esperado', 'costo_anual_esperado', 'origen', 'calculado_en')
+    list_filter = ('origen',)
+    search_fields = ('bus__placa',)
+    date_hierarchy = 'fecha_proxima'
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(LecturaOdometro)
+class LecturaOdometroAdmin(admin.ModelAdmin):
+    """
+    Las ediciones desde el admin recalculan el kilometraje actual del bus.
+    """
+    list_display = ('bus', 'fecha', 'kilometraje', 'origen', 'referencia')
+    list_filter = ('origen',)
+    search_fields = ('bus__placa',)
+    date_hierarchy = 'fecha'
+    readonly_fields = ('referencia', 'creado_en')
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        recalcular_actual(obj.bus_id)
+        if change and 'bus' in form.changed_data:
+            recalcular_actual(form.initial['bus'])
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        recalcular_actual(obj.bus_id)
+
+    def delete_queryset(self, request, queryset):
+        buses = set(queryset.values_list('bus_id', flat=True))
+        super().delete_queryset(request, queryset)
+        for bus_id in buses:
+            recalcular_actual(bus_id)
+
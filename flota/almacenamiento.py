@@ -0,0 +1,74 @@
+"""
+Almacenamiento de archivos por contenido.
+
+Cada archivo se guarda con el SHA-256 de su contenido como nombre, repartido
+en subdirectorios por los primeros caracteres del hash
+(documentos/ab/cd/abcd...ef.pdf). Dos subidas idénticas terminan en el mismo
+archivo, que se escribe una sola vez, y ningún directorio acumula miles de
+entradas. El nombre original se conserva en DocumentoVehiculo.nombre_archivo.
+"""
+import hashlib
+import os
+import re
+import uuid
+
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+DIRECTORIO_BASE = 'documentos'
+TAMANO_BLOQUE = 64 * 1024
+# documentos/ab/cd/<64 hex>[.ext]
+PATRON_NOMBRE = re.compile(r'^' + DIRECTORIO_BASE + r'/[0-9a-f]{2}/[0-9a-f]{2}/([0-9a-f]{64})(\.[\w]+)?$')
+
+
+def hash_contenido(archivo):
+    """
+    SHA-256 de un archivo abierto, leído por bloques. Deja el archivo al
+    principio.
+    """
+    digest = hashlib.sha256()
+    archivo.seek(0)
+    for bloque in iter(lambda: archivo.read(TAMANO_BLOQUE), b''):
+        digest.update(bloque)
+    archivo.seek(0)
+    return digest.hexdigest()
+
+
+def nombre_por_hash(sha256, nombre_original=''):
+    extension = os.path.splitext(nombre_original)[1].lower()
+    if not re.fullmatch(r'\.\w{1,10}', extension):
+        extension = ''
+    return f'{DIRECTORIO_BASE}/{sha256[:2]}/{sha256[2:4]}/{sha256}{extension}'
+
+
+def hash_de_nombre(nombre):
+    """
+    Hash contenido en un nombre generado por este almacenamiento, o None si
+    el archivo es anterior (nombre libre).
+    """
+    coincidencia = PATRON_NOMBRE.match(nombre or '')
+    return coincidencia.group(1) if coincidencia else None
+
+
+@deconstructible
+class AlmacenamientoPorContenido(FileSystemStorage):
+    def get_available_name(self, name, max_length=None):
+        # El nombre definitivo se decide en _save() a partir del contenido
+        return name
+
+    def _save(self, name, content):
+        nombre = nombre_por_hash(hash_contenido(content), name)
+        if self.exists(nombre):
+            return nombre
+        # Se escribe con un nombre temporal y se renombra: dos subidas
+        # simultáneas del mismo contenido no chocan y el resultado es el mismo
+        temporal = super()._save(f'{nombre}.{uuid.uuid4().hex}.tmp', content)
+        os.replace(self.path(temporal), self.path(nombre))
+        return nombre
+
+
+almacenamiento_documentos = AlmacenamientoPorContenido()
+
+
+def obtener_almacenamiento():
+    return almacenamiento_documentos
@@ -0,0 +1,139 @@
+"""
+Respuestas de descarga de archivos: por bloques, con rangos HTTP (Range /
+If-Range) o delegando el envío al servidor web con X-Sendfile o
+X-Accel-Redirect. Las peticiones condicionales (If-None-Match,
+If-Modified-Since) se resuelven antes, con el decorador condition de la vista.
+"""
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.http import content_disposition_header, http_date, parse_http_date_safe
+
+from .almacenamiento import hash_de_nombre
+
+TAMANO_BLOQUE = 64 * 1024
+PATRON_RANGO = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class RespuestaArchivo(FileResponse):
+    block_size = TAMANO_BLOQUE
+
+
+class RangoInvalido(ValueError):
+    """
+    El rango pedido no se puede satisfacer (HTTP 416).
+    """
+
+
+def etag_archivo(archivo):
+    """
+    ETag fuerte: el hash del contenido si el nombre lo incluye; si no (archivos
+    anteriores al almacenamiento por contenido), tamaño y fecha de modificación.
+    """
+    sha256 = hash_de_nombre(archivo.name)
+    if sha256:
+        return f'"{sha256}"'
+    estado = os.stat(archivo.path)
+    return f'"{estado.st_size:x}-{int(estado.st_mtime):x}"'
+
+
+def leer_rango(cabecera, tamano):
+    """
+    Interpreta una cabecera Range de un solo rango. Devuelve (inicio, fin)
+    inclusivos, None si la cabecera no aplica (se envía el archivo completo)
+    o lanza RangoInvalido si el rango queda fuera del archivo.
+    """
+    coincidencia = PATRON_RANGO.match(cabecera.strip()) if cabecera else None
+    if coincidencia is None:
+        # Varios rangos o sintaxis desconocida: se ignora la cabecera (RFC 9110)
+        return None
+    inicio, fin = coincidencia.groups()
+    if not inicio and not fin:
+        return None
+    if not inicio:
+        # bytes=-N: los últimos N bytes
+        largo = int(fin)
+        if largo == 0:
+            raise RangoInvalido(cabecera)
+        return max(tamano - largo, 0), tamano - 1
+    inicio = int(inicio)
+    fin = min(int(fin), tamano - 1) if fin else tamano - 1
+    if inicio >= tamano or fin < inicio:
+        raise RangoInvalido(cabecera)
+    return inicio, fin
+
+
+def _rango_vigente(request, etag, modificado):
+    """
+    If-Range: el rango solo se respeta si el archivo no cambió desde que el
+    cliente obtuvo la parte que ya tiene.
+    """
+    condicion = request.headers.get('If-Range')
+    if not condicion:
+        return True
+    if condicion.startswith('"'):
+        return condicion == etag
+    fecha = parse_http_date_safe(condicion)
+    return fecha is not None and int(modificado) <= fecha
+
+
+def _leer_bloques(archivo, inicio, largo):
+    with archivo:
+        archivo.seek(inicio)
+        while largo > 0:
+            bloque = archivo.read(min(TAMANO_BLOQUE, largo))
+            if not bloque:
+                break
+            largo -= len(bloque)
+            yield bloque
+
+
+def respuesta_descarga(request, archivo, nombre, adjunto=True):
+    """
+    Respuesta para descargar un FieldFile con el nombre indicado.
+    """
+    ruta = archivo.path
+    estado = os.stat(ruta)
+    etag = etag_archivo(archivo)
+    tipo_contenido = mimetypes.guess_type(nombre)[0] or 'application/octet-stream'
+
+    envio = getattr(settings, 'DOCUMENTOS_ENVIO', None)
+    if envio in ('x-sendfile', 'x-accel-redirect'):
+        # El servidor web envía el archivo y atiende los rangos por su cuenta
+        respuesta = HttpResponse(content_type=tipo_contenido)
+        if envio == 'x-sendfile':
+            respuesta['X-Sendfile'] = ruta
+        else:
+            prefijo = settings.DOCUMENTOS_ACCEL_PREFIJO.rstrip('/')
+            respuesta['X-Accel-Redirect'] = f'{prefijo}/{quote(archivo.name)}'
+    else:
+        rango = None
+        if request.method == 'GET' and _rango_vigente(request, etag, estado.st_mtime):
+            try:
+                rango = leer_rango(request.headers.get('Range'), estado.st_size)
+            except RangoInvalido:
+                respuesta = HttpResponse(status=416)
+                respuesta['Content-Range'] = f'bytes */{estado.st_size}'
+                return respuesta
+        if rango is None:
+            respuesta = RespuestaArchivo(open(ruta, 'rb'), content_type=tipo_contenido)
+        else:
+            inicio, fin = rango
+            largo = fin - inicio + 1
+            respuesta = StreamingHttpResponse(
+                _leer_bloques(open(ruta, 'rb'), inicio, largo),
+                status=206,
+                content_type=tipo_contenido,
+            )
+            respuesta['Content-Length'] = str(largo)
+            respuesta['Content-Range'] = f'bytes {inicio}-{fin}/{estado.st_size}'
+
+    respuesta['Accept-Ranges'] = 'bytes'
+    respuesta['ETag'] = etag
+    respuesta['Last-Modified'] = http_date(estado.st_mtime)
+    respuesta['Content-Disposition'] = content_disposition_header(adjunto, nombre)
+    return respuesta
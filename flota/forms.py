@@ -1,5 +1,7 @@
 from django import forms
-from .models import Mantenimiento, DocumentoVehiculo, Bus
+from .models import Mantenimiento, DocumentoVehiculo, Bus, LecturaOdometro, SubidaArchivo
+from .odometro import registrar_lectura
+from .subidas import adjuntar
 
 class BusForm(forms.ModelForm):
     class Meta:
@@ -62,6 +64,9 @@ class MantenimientoForm(forms.ModelForm):
 
 
 class DocumentoVehiculoForm(forms.ModelForm):
+    # Archivo ya subido por partes desde el navegador (ver flota/subidas.py)
+    subida = forms.UUIDField(required=False, widget=forms.HiddenInput())
+
     class Meta:
         model = DocumentoVehiculo
         fields = ['tipo', 'numero_documento', 'fecha_emision', 'fecha_vencimiento', 'archivo', 'observaciones']
@@ -89,4 +94,92 @@ class DocumentoVehiculoForm(forms.ModelForm):
             'fecha_emision': 'Fecha de Emisión',
             'fecha_vencimiento': 'Fecha de Vencimiento',
             'archivo': 'Archivo (PDF, imagen, etc.)',
-        }
\ No newline at end of file
+        }
+
+    def clean_subida(self):
+        subida_id = self.cleaned_data.get('subida')
+        if not subida_id:
+            return None
+        subida = SubidaArchivo.objects.filter(pk=subida_id).first()
+        if subida is None or not subida.completa:
+            raise forms.ValidationError('La subida del archivo no está completa.')
+        return subida
+
+    def save(self, commit=True):
+        documento = super().save(commit)
+        subida = self.cleaned_data.get('subida')
+        if commit and subida:
+            adjuntar(subida, documento)
+        return documento
+
+
+class LecturaOdometroForm(forms.ModelForm):
+    """
+    Registro manual de una lectura del odómetro. El bus lo pone la vista.
+    """
+    class Meta:
+        model = LecturaOdometro
+        fields = ['fecha', 'kilometraje', 'observaciones']
+        widgets = {
+            'fecha': forms.DateTimeInput(attrs={'class': 'form-control', 'type': 'datetime-local'}),
+            'kilometraje': forms.NumberInput(attrs={'class': 'form-control', 'min': 0}),
+            'observaciones': forms.TextInput(attrs={'class': 'form-control'}),
+        }
+        labels = {
+            'kilometraje': 'Kilometraje (km)',
+        }
+
+    def __init__(self, *args, bus=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.bus = bus
+
+    def clean(self):
+        cleaned_data = super().clean()
+        fecha = cleaned_data.get('fecha')
+        kilometraje = cleaned_data.get('kilometraje')
+        if fecha is None or kilometraje is None:
+            return cleaned_data
+        # El odómetro no retrocede: se compara con las lecturas vecinas
+        lecturas = LecturaOdometro.objects.filter(bus=self.bus)
+        anterior = lecturas.filter(fecha__lte=fecha).order_by('-fecha', '-id').first()
+        siguiente = lecturas.filter(fecha__gt=fecha).order_by('fecha', 'id').first()
+        if anterior and kilometraje < anterior.kilometraje:
+            raise forms.ValidationError(
+                f'El kilometraje no puede ser menor que la lectura anterior '
+                f'({anterior.kilometraje} km el {anterior.fecha:%d/%m/%Y}).'
+            )
+        if siguiente and kilometraje > siguiente.kilometraje:
+            raise forms.ValidationError(
+                f'El kilometraje no puede ser mayor que la lectura siguiente '
+                f'({siguiente.kilometraje} km el {siguiente.fecha:%d/%m/%Y}).'
+            )
+        return cleaned_data
+
+    def save(self, commit=True):
+        return registrar_lectura(
+            self.bus.pk, self.cleaned_data['kilometraje'], self.cleaned_data['fecha'],
+            observaciones=self.cleaned_data['observaciones'],
+        )
+
+
+class CumplimientoFiltroForm(forms.Form):
+    """
+    Filtros de la matriz de cumplimiento documental.
+    """
+    tipo = forms.ChoiceField(
+        required=False,
+        choices=[('', 'Todos los tipos')] + DocumentoVehiculo.TIPO_DOCUMENTO,
+        widget=forms.Select(attrs={'class': 'form-select form-select-sm'})
+    )
+    dias = forms.IntegerField(
+        required=False,
+        min_value=0,
+        max_value=3650,
+        label='Vence en (días)',
+        widget=forms.NumberInput(attrs={'class': 'form-control form-control-sm', 'placeholder': 'Vence en N días'})
+    )
+    incumplimiento = forms.BooleanField(
+        required=False,
+        label='Solo vencidos o faltantes',
+        widget=forms.CheckboxInput(attrs={'class': 'form-check-input'})
+    )
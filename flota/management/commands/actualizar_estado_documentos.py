@@ -0,0 +1,44 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+from flota.models import DocumentoVehiculo
+
+
+class Command(BaseCommand):
+    help = (
+        'Recalcula el estado (vigente/por vencer/vencido) de todos los documentos '
+        'según su fecha de vencimiento. Pensado para ejecutarse a diario (cron) o '
+        'como proceso permanente con --intervalo.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fecha', help='Fecha de referencia AAAA-MM-DD (por defecto, hoy)')
+        parser.add_argument(
+            '--intervalo', type=int, default=0,
+            help='Repetir cada N segundos en lugar de ejecutar una sola vez',
+        )
+
+    def handle(self, *args, **options):
+        hoy = None
+        if options['fecha']:
+            hoy = parse_date(options['fecha'])
+            if hoy is None:
+                raise CommandError(f"Fecha inválida: {options['fecha']}")
+
+        while True:
+            self.actualizar(hoy)
+            if not options['intervalo']:
+                break
+            time.sleep(options['intervalo'])
+
+    def actualizar(self, hoy):
+        inicio = time.monotonic()
+        movidos = DocumentoVehiculo.actualizar_estados(hoy)
+        duracion = time.monotonic() - inicio
+        nombres = dict(DocumentoVehiculo.ESTADO_DOCUMENTO)
+        for (anterior, nuevo), filas in sorted(movidos.items()):
+            self.stdout.write(f'  {nombres[anterior]} -> {nombres[nuevo]}: {filas}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Estados de documentos actualizados: {sum(movidos.values())} cambios en {duracion:.2f} s'
+        ))
@@ -0,0 +1,49 @@
+import os
+
+from django.core.management.base import BaseCommand
+from core.cache import invalidar_modelos
+from flota.almacenamiento import almacenamiento_documentos, hash_de_nombre
+from flota.models import DocumentoVehiculo
+
+
+class Command(BaseCommand):
+    help = (
+        'Mueve los archivos de documentos guardados con su nombre original al '
+        'almacenamiento por contenido. Los duplicados quedan en un solo archivo.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--borrar', action='store_true',
+            help='Borrar los archivos antiguos una vez migrados',
+        )
+
+    def handle(self, *args, **options):
+        migrados = faltantes = 0
+        antiguos = set()
+        documentos = DocumentoVehiculo.objects.exclude(archivo='').exclude(archivo=None).only('id', 'archivo', 'nombre_archivo')
+        for documento in documentos.iterator():
+            nombre = documento.archivo.name
+            if hash_de_nombre(nombre):
+                continue
+            if not almacenamiento_documentos.exists(nombre):
+                faltantes += 1
+                self.stderr.write(f'  Documento {documento.pk}: no existe {nombre}')
+                continue
+            with almacenamiento_documentos.open(nombre) as archivo:
+                nuevo = almacenamiento_documentos.save(nombre, archivo)
+            DocumentoVehiculo.objects.filter(pk=documento.pk).update(
+                archivo=nuevo,
+                nombre_archivo=documento.nombre_archivo or os.path.basename(nombre),
+            )
+            antiguos.add(nombre)
+            migrados += 1
+
+        if migrados:
+            invalidar_modelos(DocumentoVehiculo)
+        if options['borrar']:
+            for nombre in antiguos:
+                almacenamiento_documentos.delete(nombre)
+        self.stdout.write(self.style.SUCCESS(
+            f'Archivos migrados: {migrados}. Sin archivo en disco: {faltantes}.'
+        ))
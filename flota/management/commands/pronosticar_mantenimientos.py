@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+from flota.pronostico import NumpyNoDisponible, actualizar_pronosticos
+
+
+class Command(BaseCommand):
+    help = (
+        'Estima el próximo mantenimiento (fecha, km y costo) de todos los buses '
+        'a partir de su historial. Requiere NumPy.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fecha', help='Fecha de referencia AAAA-MM-DD (por defecto, hoy)')
+
+    def handle(self, *args, **options):
+        hoy = None
+        if options['fecha']:
+            hoy = parse_date(options['fecha'])
+            if hoy is None:
+                raise CommandError(f"Fecha inválida: {options['fecha']}")
+        inicio = time.monotonic()
+        try:
+            total = actualizar_pronosticos(hoy)
+        except NumpyNoDisponible as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS(
+            f'Pronósticos de mantenimiento actualizados: {total} buses en {time.monotonic() - inicio:.2f} s'
+        ))
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.8 on 2026-10-18 10:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flota', '0003_bus_kilometraje_inicial_alter_bus_marca'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='documentovehiculo',
+            index=models.Index(fields=['estado', 'fecha_vencimiento'], name='documento_estado_venc_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.8 on 2026-10-18 11:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flota', '0004_documento_estado_venc_idx'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='documentovehiculo',
+            index=models.Index(fields=['tipo', 'fecha_vencimiento'], name='documento_tipo_venc_idx'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.8 on 2026-10-18 11:01
+
+import flota.almacenamiento
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flota', '0005_documento_tipo_venc_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='documentovehiculo',
+            name='nombre_archivo',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AlterField(
+            model_name='documentovehiculo',
+            name='archivo',
+            field=models.FileField(blank=True, null=True, storage=flota.almacenamiento.obtener_almacenamiento, upload_to='documentos/'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.8 on 2026-10-18 11:04
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flota', '0006_documento_almacenamiento_por_contenido'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SubidaArchivo',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('nombre_archivo', models.CharField(max_length=255)),
+                ('tamano', models.BigIntegerField()),
+                ('recibido', models.BigIntegerField(default=0)),
+                ('completada_en', models.DateTimeField(blank=True, null=True)),
+                ('creado_en', models.DateTimeField(auto_now_add=True)),
+                ('actualizado_en', models.DateTimeField(auto_now=True)),
+                ('documento', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='subidas', to='flota.documentovehiculo')),
+            ],
+            options={
+                'verbose_name': 'Subida de Archivo',
+                'verbose_name_plural': 'Subidas de Archivos',
+                'ordering': ['-creado_en'],
+            },
+        ),
+    ]
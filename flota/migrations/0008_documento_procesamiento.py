@@ -0,0 +1,43 @@
+# Generated by Django 5.2.8 on 2026-10-18 11:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flota', '0007_subidaarchivo'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='documentovehiculo',
+            name='paginas',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='documentovehiculo',
+            name='procesamiento',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddField(
+            model_name='documentovehiculo',
+            name='procesamiento_estado',
+            field=models.CharField(choices=[('sin_archivo', 'Sin Archivo'), ('pendiente', 'Pendiente'), ('procesando', 'Procesando'), ('completado', 'Completado'), ('error', 'Error'), ('rechazado', 'Rechazado')], default='sin_archivo', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='documentovehiculo',
+            name='sha256',
+            field=models.CharField(blank=True, db_index=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='documentovehiculo',
+            name='texto',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddField(
+            model_name='documentovehiculo',
+            name='tipo_mime',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.8 on 2026-10-18 11:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flota', '0008_documento_procesamiento'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='mantenimiento',
+            index=models.Index(fields=['bus', 'fecha_mantenimiento'], name='mantenimiento_bus_fecha_idx'),
+        ),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 5.2.8 on 2026-10-18 11:14
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flota', '0009_mantenimiento_bus_fecha_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LecturaOdometro',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateTimeField(default=django.utils.timezone.now)),
+                ('kilometraje', models.PositiveIntegerField()),
+                ('origen', models.CharField(choices=[('manual', 'Manual'), ('mantenimiento', 'Mantenimiento'), ('viaje', 'Viaje')], default='manual', max_length=20)),
+                ('referencia', models.PositiveBigIntegerField(blank=True, editable=False, null=True)),
+                ('observaciones', models.CharField(blank=True, max_length=200)),
+                ('creado_en', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Lectura de Odómetro',
+                'verbose_name_plural': 'Lecturas de Odómetro',
+                'ordering': ['-fecha', '-id'],
+            },
+        ),
+        migrations.AddField(
+            model_name='bus',
+            name='kilometraje_actual',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='bus',
+            name='kilometraje_actualizado_en',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='bus',
+            index=models.Index(fields=['kilometraje_actual'], name='bus_km_actual_idx'),
+        ),
+        migrations.AddField(
+            model_name='lecturaodometro',
+            name='bus',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lecturas_odometro', to='flota.bus'),
+        ),
+        migrations.AddIndex(
+            model_name='lecturaodometro',
+            index=models.Index(fields=['bus', 'fecha'], name='lectura_bus_fecha_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='lecturaodometro',
+            constraint=models.UniqueConstraint(fields=('origen', 'referencia'), name='lectura_origen_referencia_unica'),
+        ),
+    ]
@@ -0,0 +1,54 @@
+from datetime import datetime, time
+
+from django.db import migrations
+from django.db.models import F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+TAMANO_LOTE = 1000
+
+
+def cargar_lecturas(apps, schema_editor):
+    """
+    El kilometraje de los mantenimientos existentes pasa a ser la primera
+    serie de lecturas; después se calcula el kilometraje actual de cada bus.
+    """
+    Bus = apps.get_model('flota', 'Bus')
+    Mantenimiento = apps.get_model('flota', 'Mantenimiento')
+    LecturaOdometro = apps.get_model('flota', 'LecturaOdometro')
+
+    lote = []
+    mantenimientos = (
+        Mantenimiento.objects
+        .filter(kilometraje__gte=0)
+        .values_list('pk', 'bus_id', 'fecha_mantenimiento', 'kilometraje')
+        .order_by('pk')
+    )
+    for pk, bus_id, fecha, kilometraje in mantenimientos.iterator(chunk_size=TAMANO_LOTE):
+        lote.append(LecturaOdometro(
+            # Las lecturas de mantenimientos toman el inicio del día (hora local)
+            bus_id=bus_id, fecha=timezone.make_aware(datetime.combine(fecha, time.min)), kilometraje=kilometraje,
+            origen='mantenimiento', referencia=pk,
+        ))
+        if len(lote) >= TAMANO_LOTE:
+            LecturaOdometro.objects.bulk_create(lote)
+            lote = []
+    if lote:
+        LecturaOdometro.objects.bulk_create(lote)
+
+    ultima = LecturaOdometro.objects.filter(bus=OuterRef('pk')).order_by('-fecha', '-id')
+    Bus.objects.update(
+        kilometraje_actual=Coalesce(Subquery(ultima.values('kilometraje')[:1]), F('kilometraje_inicial')),
+        kilometraje_actualizado_en=Subquery(ultima.values('fecha')[:1]),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flota', '0010_lecturas_odometro'),
+    ]
+
+    operations = [
+        migrations.RunPython(cargar_lecturas, migrations.RunPython.noop),
+    ]
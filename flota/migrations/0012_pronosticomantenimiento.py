@@ -0,0 +1,37 @@
+# Generated by Django 5.2.8 on 2026-10-18 11:17
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flota', '0011_cargar_lecturas_mantenimientos'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PronosticoMantenimiento',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha_proxima', models.DateField()),
+                ('km_proximo', models.IntegerField()),
+                ('costo_esperado', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('costo_anual_esperado', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('intervalo_dias', models.IntegerField()),
+                ('intervalo_km', models.IntegerField()),
+                ('km_por_dia', models.FloatField(default=0)),
+                ('muestras', models.IntegerField(default=0, help_text='Intervalos del historial usados en la estimación')),
+                ('origen', models.CharField(choices=[('historial', 'Historial del bus'), ('flota', 'Promedio de la flota')], default='historial', max_length=20)),
+                ('calculado_en', models.DateTimeField()),
+                ('bus', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='pronostico', to='flota.bus')),
+            ],
+            options={
+                'verbose_name': 'Pronóstico de Mantenimiento',
+                'verbose_name_plural': 'Pronósticos de Mantenimiento',
+                'ordering': ['fecha_proxima'],
+                'indexes': [models.Index(fields=['fecha_proxima'], name='pronostico_fecha_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.8 on 2026-10-18 12:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flota', '0012_pronosticomantenimiento'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='subidaarchivo',
+            name='escritor',
+            field=models.UUIDField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='subidaarchivo',
+            name='escritura_hasta',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+    ]
@@ -1,5 +1,55 @@
-from django.db import models
-from datetime import date
+from django.db import models, transaction
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from datetime import date, timedelta
+import os
+import uuid
+from core.cache import invalidar_modelos
+from .almacenamiento import obtener_almacenamiento
+from .procesamiento import encolar_procesamiento
+
+def _por_bus(queryset, valor):
+    """
+    Subconsulta escalar correlacionada con el bus de la fila externa.
+    """
+    return models.Subquery(
+        queryset.filter(bus=models.OuterRef('pk')).order_by().values('bus').annotate(valor=valor).values('valor')
+    )
+
+
+class BusQuerySet(models.QuerySet):
+    def con_estadisticas(self, hoy=None):
+        """
+        Agrega a cada bus sus estadísticas de mantenimiento y documentos como
+        subconsultas escalares: se obtienen en la misma consulta que el bus y
+        cada una recorre solo las filas de ese bus por su índice, sin importar
+        cuánto historial tenga.
+        """
+        hoy = hoy or date.today()
+        mantenimientos = Mantenimiento.objects.all()
+        ultimo = Mantenimiento.objects.filter(bus=models.OuterRef('pk')).order_by('-fecha_mantenimiento', '-id')
+        documentos = DocumentoVehiculo.objects.all()
+        cero = models.Value(0)
+        cero_decimal = models.Value(0, output_field=models.DecimalField(max_digits=12, decimal_places=2))
+        anotaciones = {
+            'num_mantenimientos': Coalesce(_por_bus(mantenimientos, models.Count('id')), cero),
+            'costo_mantenimiento_total': Coalesce(_por_bus(mantenimientos, models.Sum('costo')), cero_decimal),
+            'costo_mantenimiento_anio': Coalesce(
+                _por_bus(mantenimientos.filter(fecha_mantenimiento__year=hoy.year), models.Sum('costo')),
+                cero_decimal,
+            ),
+            'ultimo_mantenimiento_fecha': models.Subquery(ultimo.values('fecha_mantenimiento')[:1]),
+            'ultimo_mantenimiento_km': models.Subquery(ultimo.values('kilometraje')[:1]),
+            'num_documentos': Coalesce(_por_bus(documentos, models.Count('id')), cero),
+        }
+        # Por fecha de vencimiento y no por la columna estado, que se
+        # recalcula periódicamente y puede ir un día atrasada
+        for estado, filtro in DocumentoVehiculo.rangos_estado(hoy).items():
+            anotaciones[f'documentos_{estado}'] = Coalesce(
+                _por_bus(documentos.filter(filtro), models.Count('id')), cero,
+            )
+        return self.annotate(**anotaciones)
+
 
 class Bus(models.Model):
     """
@@ -21,17 +71,54 @@ class Bus(models.Model):
     numero_motor = models.CharField(max_length=30, unique=True, blank=True, null=True)
     estado = models.CharField(max_length=20, choices=ESTADO_CHOICES, default='activo')
     fecha_adquisicion = models.DateField()
+    # Última lectura del odómetro, mantenida por flota/odometro.py
+    kilometraje_actual = models.IntegerField(default=0, editable=False)
+    kilometraje_actualizado_en = models.DateTimeField(null=True, blank=True, editable=False)
     creado_en = models.DateTimeField(auto_now_add=True)
     actualizado_en = models.DateTimeField(auto_now=True)
 
+    objects = BusQuerySet.as_manager()
+
+    CAMPOS_ODOMETRO = ('kilometraje_actual', 'kilometraje_actualizado_en')
+
     class Meta:
         ordering = ['placa']  # SE MANTIENE ORDEN POR PLACA
         verbose_name = 'Bus'
         verbose_name_plural = 'Buses'
+        indexes = [
+            # Listado ordenado por kilometraje actual
+            models.Index(fields=['kilometraje_actual'], name='bus_km_actual_idx'),
+        ]
 
     def __str__(self):
         return f"{self.placa} - {self.modelo}"  # SE MANTIENE PLACA EN REPRESENTACIÓN
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instancia = super().from_db(db, field_names, values)
+        if 'kilometraje_inicial' in field_names:
+            instancia._kilometraje_inicial_guardado = instancia.kilometraje_inicial
+        return instancia
+
+    def save(self, *args, **kwargs):
+        if self._state.adding:
+            self.kilometraje_actual = self.kilometraje_inicial or 0
+            super().save(*args, **kwargs)
+            return
+        if kwargs.get('update_fields') is None:
+            # El kilometraje actual se mueve con UPDATE condicionales al
+            # registrar lecturas; guardar el bus no debe pisarlo con el valor
+            # que se leyó al cargar el formulario
+            kwargs['update_fields'] = [
+                campo.name for campo in self._meta.concrete_fields
+                if not campo.primary_key and campo.name not in self.CAMPOS_ODOMETRO
+            ]
+        super().save(*args, **kwargs)
+        if self.kilometraje_inicial != getattr(self, '_kilometraje_inicial_guardado', self.kilometraje_inicial):
+            from .odometro import recalcular_actual
+            recalcular_actual(self.pk)
+            self._kilometraje_inicial_guardado = self.kilometraje_inicial
+
 
 class DocumentoVehiculo(models.Model):
     """
@@ -53,6 +140,16 @@ class DocumentoVehiculo(models.Model):
         ('por_vencer', 'Por Vencer'),
         ('vencido', 'Vencido'),
     ]
+    DIAS_POR_VENCER = 30
+
+    ESTADO_PROCESAMIENTO = [
+        ('sin_archivo', 'Sin Archivo'),
+        ('pendiente', 'Pendiente'),
+        ('procesando', 'Procesando'),
+        ('completado', 'Completado'),
+        ('error', 'Error'),
+        ('rechazado', 'Rechazado'),
+    ]
     
     bus = models.ForeignKey(Bus, on_delete=models.CASCADE, related_name='documentos')
     tipo = models.CharField(max_length=20, choices=TIPO_DOCUMENTO)
@@ -60,36 +157,118 @@ class DocumentoVehiculo(models.Model):
     fecha_emision = models.DateField()
     fecha_vencimiento = models.DateField()
     estado = models.CharField(max_length=20, choices=ESTADO_DOCUMENTO, default='vigente')  # Nuevo campo
-    archivo = models.FileField(upload_to='documentos_vehiculos/', blank=True, null=True)
+    # Guardado por contenido (ver almacenamiento.py); el nombre original va aparte
+    archivo = models.FileField(upload_to='documentos/', storage=obtener_almacenamiento, blank=True, null=True)
+    nombre_archivo = models.CharField(max_length=255, blank=True)
+    # Resultado del procesamiento posterior a la subida (ver procesamiento.py)
+    sha256 = models.CharField(max_length=64, blank=True, db_index=True)
+    tipo_mime = models.CharField(max_length=100, blank=True)
+    paginas = models.PositiveIntegerField(null=True, blank=True)
+    texto = models.TextField(blank=True)
+    procesamiento_estado = models.CharField(max_length=20, choices=ESTADO_PROCESAMIENTO, default='sin_archivo')
+    procesamiento = models.JSONField(default=dict, blank=True)
     observaciones = models.TextField(blank=True, null=True)  # Nuevo campo
     creado_en = models.DateTimeField(auto_now_add=True)
     actualizado_en = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ['-fecha_vencimiento']
+        indexes = [
+            models.Index(fields=['estado', 'fecha_vencimiento'], name='documento_estado_venc_idx'),
+            models.Index(fields=['tipo', 'fecha_vencimiento'], name='documento_tipo_venc_idx'),
+        ]
         verbose_name = 'Documento Vehículo'
         verbose_name_plural = 'Documentos Vehículos'
 
     def __str__(self):
         return f"{self.bus.placa} - {self.get_tipo_display()}"  # SE MANTIENE PLACA
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        documento = super().from_db(db, field_names, values)
+        # Archivo guardado, para detectar en save() si cambió
+        if 'archivo' in field_names:
+            documento._archivo_guardado = documento.__dict__['archivo'] or ''
+        return documento
+
     def save(self, *args, **kwargs):
         self.actualizar_estado()
+        if self.archivo and not self.archivo._committed:
+            self.nombre_archivo = os.path.basename(self.archivo.name)
+        if self._state.adding:
+            archivo_cambiado = bool(self.archivo)
+        else:
+            archivo_cambiado = (
+                hasattr(self, '_archivo_guardado') and (self.archivo.name or '') != self._archivo_guardado
+            )
+        if archivo_cambiado:
+            self.procesamiento_estado = 'pendiente' if self.archivo else 'sin_archivo'
+            self.procesamiento = {}
+            self.sha256 = self.tipo_mime = self.texto = ''
+            self.paginas = None
         super().save(*args, **kwargs)
+        self._archivo_guardado = self.archivo.name or ''
+        if archivo_cambiado and self.archivo:
+            encolar_procesamiento(self.pk)
+
+    @property
+    def nombre_descarga(self):
+        return self.nombre_archivo or os.path.basename(self.archivo.name)
     
     def actualizar_estado(self):
         """
         Actualiza automáticamente el estado del documento basado en la fecha de vencimiento
         """
-        hoy = date.today()
-        dias_para_vencer = (self.fecha_vencimiento - hoy).days
-        
+        self.estado = self.calcular_estado(self.fecha_vencimiento)
+
+    @classmethod
+    def calcular_estado(cls, fecha_vencimiento, hoy=None):
+        hoy = hoy or date.today()
+        dias_para_vencer = (fecha_vencimiento - hoy).days
+
         if dias_para_vencer < 0:
-            self.estado = 'vencido'
-        elif dias_para_vencer <= 30:
-            self.estado = 'por_vencer'
-        else:
-            self.estado = 'vigente'
+            return 'vencido'
+        elif dias_para_vencer <= cls.DIAS_POR_VENCER:
+            return 'por_vencer'
+        return 'vigente'
+
+    @classmethod
+    def rangos_estado(cls, hoy=None):
+        """
+        Filtros de fecha_vencimiento que corresponden a cada estado, con la
+        misma regla que actualizar_estado().
+        """
+        hoy = hoy or date.today()
+        limite = hoy + timedelta(days=cls.DIAS_POR_VENCER)
+        return {
+            'vencido': models.Q(fecha_vencimiento__lt=hoy),
+            'por_vencer': models.Q(fecha_vencimiento__gte=hoy, fecha_vencimiento__lte=limite),
+            'vigente': models.Q(fecha_vencimiento__gt=limite),
+        }
+
+    @classmethod
+    def actualizar_estados(cls, hoy=None):
+        """
+        Recalcula el estado de todos los documentos con un UPDATE por cada par
+        (estado actual, estado correcto), usando el índice (estado,
+        fecha_vencimiento). Solo se tocan las filas que cambian.
+
+        Devuelve un diccionario {(estado_anterior, estado_nuevo): filas}.
+        """
+        movidos = {}
+        ahora = timezone.now()
+        with transaction.atomic():
+            for nuevo, rango in cls.rangos_estado(hoy).items():
+                for anterior, _ in cls.ESTADO_DOCUMENTO:
+                    if anterior == nuevo:
+                        continue
+                    filas = cls.objects.filter(rango, estado=anterior).update(estado=nuevo, actualizado_en=ahora)
+                    if filas:
+                        movidos[(anterior, nuevo)] = filas
+        if movidos:
+            # UPDATE no emite señales
+            invalidar_modelos(cls)
+        return movidos
 
 
 class Mantenimiento(models.Model):
@@ -120,6 +299,116 @@ class Mantenimiento(models.Model):
         ordering = ['-fecha_mantenimiento']
         verbose_name = 'Mantenimiento'
         verbose_name_plural = 'Mantenimientos'
+        indexes = [
+            # Historial paginado y estadísticas de un bus
+            models.Index(fields=['bus', 'fecha_mantenimiento'], name='mantenimiento_bus_fecha_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.bus.placa} - {self.get_tipo_display()} ({self.fecha_mantenimiento})"  # SE MANTIENE PLACA
+
+
+class PronosticoMantenimiento(models.Model):
+    """
+    Próximo mantenimiento estimado de cada bus a partir de su historial (ver
+    flota/pronostico.py). La tabla se rehace completa en cada cálculo.
+    """
+    ORIGEN_PRONOSTICO = [
+        ('historial', 'Historial del bus'),
+        ('flota', 'Promedio de la flota'),
+    ]
+
+    bus = models.OneToOneField(Bus, on_delete=models.CASCADE, related_name='pronostico')
+    fecha_proxima = models.DateField()
+    km_proximo = models.IntegerField()
+    costo_esperado = models.DecimalField(max_digits=10, decimal_places=2)
+    costo_anual_esperado = models.DecimalField(max_digits=12, decimal_places=2)
+    intervalo_dias = models.IntegerField()
+    intervalo_km = models.IntegerField()
+    km_por_dia = models.FloatField(default=0)
+    muestras = models.IntegerField(default=0, help_text='Intervalos del historial usados en la estimación')
+    origen = models.CharField(max_length=20, choices=ORIGEN_PRONOSTICO, default='historial')
+    calculado_en = models.DateTimeField()
+
+    class Meta:
+        ordering = ['fecha_proxima']
+        verbose_name = 'Pronóstico de Mantenimiento'
+        verbose_name_plural = 'Pronósticos de Mantenimiento'
+        indexes = [
+            # Próximos mantenimientos del panel de inicio
+            models.Index(fields=['fecha_proxima'], name='pronostico_fecha_idx'),
+        ]
 
     def __str__(self):
-        return f"{self.bus.placa} - {self.get_tipo_display()} ({self.fecha_mantenimiento})"  # SE MANTIENE PLACA
\ No newline at end of file
+        return f"{self.bus.placa} - {self.fecha_proxima} / {self.km_proximo} km"
+
+
+class LecturaOdometro(models.Model):
+    """
+    Lectura del odómetro de un bus en un momento dado. Las de mantenimientos
+    y viajes se crean solas (referencia es el id del registro de origen); el
+    resto se registran a mano.
+    """
+    ORIGEN_LECTURA = [
+        ('manual', 'Manual'),
+        ('mantenimiento', 'Mantenimiento'),
+        ('viaje', 'Viaje'),
+    ]
+
+    bus = models.ForeignKey(Bus, on_delete=models.CASCADE, related_name='lecturas_odometro')
+    fecha = models.DateTimeField(default=timezone.now)
+    kilometraje = models.PositiveIntegerField()
+    origen = models.CharField(max_length=20, choices=ORIGEN_LECTURA, default='manual')
+    referencia = models.PositiveBigIntegerField(null=True, blank=True, editable=False)
+    observaciones = models.CharField(max_length=200, blank=True)
+    creado_en = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-fecha', '-id']
+        verbose_name = 'Lectura de Odómetro'
+        verbose_name_plural = 'Lecturas de Odómetro'
+        indexes = [
+            # Última lectura y consultas por rango de fechas de un bus
+            models.Index(fields=['bus', 'fecha'], name='lectura_bus_fecha_idx'),
+        ]
+        constraints = [
+            # Una lectura por mantenimiento o viaje (NULL = manual, sin límite)
+            models.UniqueConstraint(fields=['origen', 'referencia'], name='lectura_origen_referencia_unica'),
+        ]
+
+    def __str__(self):
+        return f"{self.bus.placa} - {self.kilometraje} km ({self.fecha:%d/%m/%Y})"
+
+
+class SubidaArchivo(models.Model):
+    """
+    Subida por partes de un archivo de documento (ver flota/subidas.py). Las
+    partes se escriben en un archivo temporal y recibido marca hasta dónde
+    llegó, para poder reanudar desde ese byte.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    nombre_archivo = models.CharField(max_length=255)
+    tamano = models.BigIntegerField()
+    recibido = models.BigIntegerField(default=0)
+    documento = models.ForeignKey(
+        DocumentoVehiculo, on_delete=models.CASCADE, null=True, blank=True, related_name='subidas'
+    )
+    completada_en = models.DateTimeField(null=True, blank=True)
+    # Reserva de la parte que se está recibiendo (ver subidas.reservar_parte)
+    escritor = models.UUIDField(null=True, blank=True, editable=False)
+    escritura_hasta = models.DateTimeField(null=True, blank=True, editable=False)
+    creado_en = models.DateTimeField(auto_now_add=True)
+    actualizado_en = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-creado_en']
+        verbose_name = 'Subida de Archivo'
+        verbose_name_plural = 'Subidas de Archivos'
+
+    def __str__(self):
+        return f"{self.nombre_archivo} ({self.recibido}/{self.tamano})"
+
+    @property
+    def completa(self):
+        return self.recibido >= self.tamano
+
@@ -0,0 +1,139 @@
+"""
+Lecturas del odómetro y kilometraje actual de cada bus.
+
+Cada lectura (manual, de un mantenimiento o de un viaje) se guarda en
+LecturaOdometro, indexada por (bus, fecha) para las consultas por rango. El
+bus guarda además la última lectura en kilometraje_actual /
+kilometraje_actualizado_en, así que conocer el kilometraje actual o ordenar
+el listado por él no recorre las lecturas:
+
+- Una lectura nueva solo mueve el valor guardado si es más reciente, con un
+  UPDATE condicional (sin leer antes el bus ni sus lecturas).
+- Al editar o borrar una lectura se vuelve a tomar la última por el índice.
+- Sin lecturas, el kilometraje actual es el kilometraje inicial del bus.
+"""
+from datetime import datetime, time
+
+from django.db import transaction
+from django.db.models import F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from core.cache import invalidar_modelos
+from .models import Bus, LecturaOdometro
+
+
+def fecha_de_dia(dia):
+    """
+    Momento de una lectura que solo tiene fecha (mantenimientos): el inicio
+    del día en la zona horaria local.
+    """
+    if isinstance(dia, str):
+        dia = parse_date(dia)
+    return timezone.make_aware(datetime.combine(dia, time.min))
+
+
+def _avanzar(bus_id, kilometraje, fecha):
+    movidos = Bus.objects.filter(pk=bus_id).filter(
+        Q(kilometraje_actualizado_en__isnull=True) | Q(kilometraje_actualizado_en__lte=fecha)
+    ).update(kilometraje_actual=kilometraje, kilometraje_actualizado_en=fecha)
+    if movidos:
+        invalidar_modelos(Bus)
+
+
+def recalcular_actual(bus_id):
+    """
+    Vuelve a tomar la última lectura del bus (una consulta por el índice
+    (bus, fecha)) o su kilometraje inicial si no tiene lecturas.
+    """
+    ultima = (
+        LecturaOdometro.objects
+        .filter(bus_id=bus_id)
+        .order_by('-fecha', '-id')
+        .values('kilometraje', 'fecha')
+        .first()
+    )
+    if ultima is None:
+        Bus.objects.filter(pk=bus_id).update(
+            kilometraje_actual=F('kilometraje_inicial'), kilometraje_actualizado_en=None,
+        )
+    else:
+        Bus.objects.filter(pk=bus_id).update(
+            kilometraje_actual=ultima['kilometraje'], kilometraje_actualizado_en=ultima['fecha'],
+        )
+    invalidar_modelos(Bus)
+
+
+def registrar_lectura(bus_id, kilometraje, fecha=None, origen='manual', referencia=None, observaciones=''):
+    """
+    Guarda una lectura y actualiza el kilometraje actual del bus. Con
+    referencia, la lectura de ese registro de origen se reemplaza (un
+    mantenimiento o viaje editado no deja lecturas duplicadas).
+    """
+    fecha = fecha or timezone.now()
+    valores = {'bus_id': bus_id, 'kilometraje': kilometraje, 'fecha': fecha, 'observaciones': observaciones}
+    with transaction.atomic():
+        anterior = None
+        if referencia is not None:
+            anterior = (
+                LecturaOdometro.objects.select_for_update()
+                .filter(origen=origen, referencia=referencia)
+                .first()
+            )
+        if anterior is None:
+            lectura = LecturaOdometro.objects.create(origen=origen, referencia=referencia, **valores)
+            _avanzar(bus_id, kilometraje, fecha)
+            return lectura
+
+        if (anterior.bus_id, anterior.kilometraje, anterior.fecha) == (bus_id, kilometraje, fecha):
+            # Se guardó el registro de origen sin cambiar la lectura
+            return anterior
+        LecturaOdometro.objects.filter(pk=anterior.pk).update(**valores)
+        # La lectura editada pudo ser la última: se recalcula desde el índice
+        recalcular_actual(bus_id)
+        if anterior.bus_id != bus_id:
+            recalcular_actual(anterior.bus_id)
+        anterior.__dict__.update(valores)
+        return anterior
+
+
+def borrar_lecturas(origen, referencia):
+    lecturas = LecturaOdometro.objects.filter(origen=origen, referencia=referencia)
+    buses = set(lecturas.values_list('bus_id', flat=True))
+    if not buses:
+        return
+    with transaction.atomic():
+        lecturas.delete()
+        for bus_id in buses:
+            recalcular_actual(bus_id)
+
+
+def lecturas_entre(bus_id, desde=None, hasta=None):
+    """
+    Lecturas de un bus en [desde, hasta], en orden cronológico. Usa el
+    índice (bus, fecha).
+    """
+    lecturas = LecturaOdometro.objects.filter(bus_id=bus_id)
+    if desde is not None:
+        lecturas = lecturas.filter(fecha__gte=desde)
+    if hasta is not None:
+        lecturas = lecturas.filter(fecha__lte=hasta)
+    return lecturas.order_by('fecha', 'id')
+
+
+def reconstruir_kilometraje_actual(apps=None):
+    """
+    Recalcula el kilometraje actual de todos los buses con un solo UPDATE.
+    Recibe el registro de apps para poder usarse desde una migración.
+    """
+    modelo_bus = apps.get_model('flota', 'Bus') if apps else Bus
+    modelo_lectura = apps.get_model('flota', 'LecturaOdometro') if apps else LecturaOdometro
+    ultima = modelo_lectura.objects.filter(bus=OuterRef('pk')).order_by('-fecha', '-id')
+    total = modelo_bus.objects.update(
+        kilometraje_actual=Coalesce(Subquery(ultima.values('kilometraje')[:1]), F('kilometraje_inicial')),
+        kilometraje_actualizado_en=Subquery(ultima.values('fecha')[:1]),
+    )
+    if apps is None:
+        invalidar_modelos(Bus)
+    return total
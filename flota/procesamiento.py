@@ -0,0 +1,306 @@
+"""
+Procesamiento de los archivos de documentos después de subirlos.
+
+Al guardar un documento con un archivo nuevo se encola su procesamiento en un
+grupo acotado de hilos (DOCUMENTOS_PROCESAMIENTO_HILOS), fuera de la petición:
+la respuesta de la subida no espera. Los pasos son:
+
+- checksum: SHA-256 del contenido.
+- mime: tipo real según los primeros bytes (no la extensión).
+- paginas: número de páginas (PDF; 1 para imágenes).
+- texto: texto para búsquedas (PDF con pypdf si está instalado, texto plano y
+  documentos de Office).
+- escaneo: el escáner configurado en DOCUMENTOS_ESCANER; por defecto
+  EscanerLocal, que solo reconoce la firma de prueba EICAR.
+
+Con DOCUMENTOS_PROCESAMIENTO_COLA el procesamiento se encola en la cola de
+tareas de la base de datos (core.tareas) en lugar del grupo de hilos.
+
+Cada paso se reintenta con espera exponencial y deja en
+DocumentoVehiculo.procesamiento su estado, intentos, duración y error.
+"""
+import hashlib
+import re
+import threading
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+from django.apps import apps
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils.module_loading import import_string
+
+from core.cache import invalidar_modelos
+from .almacenamiento import hash_de_nombre
+
+TAMANO_BLOQUE = 64 * 1024
+MAX_TEXTO = 1024 * 1024
+FIRMA_EICAR = b'EICAR-STANDARD-ANTIVIRUS-TEST-FILE'
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+class ArchivoRechazado(Exception):
+    """
+    El escáner encontró contenido malicioso; no se reintenta.
+    """
+
+
+# Escáneres
+class EscanerLocal:
+    """
+    Reemplazo local de un antivirus (ClamAV, servicio externo...). Cualquier
+    clase con un método escanear(archivo) -> (limpio, detalle) puede
+    configurarse en DOCUMENTOS_ESCANER.
+    """
+    def escanear(self, archivo):
+        anterior = b''
+        for bloque in iter(lambda: archivo.read(TAMANO_BLOQUE), b''):
+            if FIRMA_EICAR in anterior[-len(FIRMA_EICAR):] + bloque:
+                return False, 'Firma de prueba EICAR'
+            anterior = bloque
+        return True, ''
+
+
+def obtener_escaner():
+    return import_string(getattr(settings, 'DOCUMENTOS_ESCANER', 'flota.procesamiento.EscanerLocal'))()
+
+
+# Pasos
+FIRMAS_MIME = [
+    (b'%PDF-', 'application/pdf'),
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'GIF87a', 'image/gif'),
+    (b'GIF89a', 'image/gif'),
+    (b'II*\x00', 'image/tiff'),
+    (b'MM\x00*', 'image/tiff'),
+    (b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1', 'application/vnd.ms-office'),
+    (b'PK\x03\x04', 'application/zip'),
+]
+MIME_OFFICE = {
+    'word/': 'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+    'ppt/': 'application/vnd.openxmlformats-officedocument.presentationml.presentation',
+    'xl/': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+
+def paso_checksum(documento, archivo):
+    sha256 = hash_de_nombre(documento.archivo.name)
+    if not sha256:
+        digest = hashlib.sha256()
+        for bloque in iter(lambda: archivo.read(TAMANO_BLOQUE), b''):
+            digest.update(bloque)
+        sha256 = digest.hexdigest()
+    return {'sha256': sha256}
+
+
+def detectar_mime(archivo):
+    cabecera = archivo.read(512)
+    if cabecera[4:8] == b'ftyp':
+        return 'video/mp4'
+    if cabecera.startswith(b'RIFF') and cabecera[8:12] == b'WEBP':
+        return 'image/webp'
+    for firma, mime in FIRMAS_MIME:
+        if cabecera.startswith(firma):
+            if mime == 'application/zip':
+                archivo.seek(0)
+                return _mime_zip(archivo)
+            return mime
+    try:
+        cabecera.decode('utf-8')
+        return 'text/plain'
+    except UnicodeDecodeError:
+        return 'application/octet-stream'
+
+
+def _mime_zip(archivo):
+    try:
+        with zipfile.ZipFile(archivo) as zip_:
+            for nombre in zip_.namelist():
+                for prefijo, mime in MIME_OFFICE.items():
+                    if nombre.startswith(prefijo):
+                        return mime
+    except zipfile.BadZipFile:
+        pass
+    return 'application/zip'
+
+
+def paso_mime(documento, archivo):
+    return {'tipo_mime': detectar_mime(archivo)}
+
+
+def _pypdf():
+    try:
+        import pypdf
+    except ImportError:
+        return None
+    return pypdf
+
+
+def paso_paginas(documento, archivo):
+    mime = documento.tipo_mime
+    if mime.startswith('image/'):
+        return {'paginas': 1}
+    if mime != 'application/pdf':
+        return {}
+    pypdf = _pypdf()
+    if pypdf is not None:
+        return {'paginas': len(pypdf.PdfReader(archivo).pages)}
+    # Sin pypdf: se cuentan los objetos /Type /Page leyendo por bloques. Se
+    # guarda la cola de cada bloque por si una coincidencia queda partida.
+    patron = re.compile(rb'/Type\s*/Page(?![a-zA-Z])')
+    paginas, ultimo, base, datos = 0, 0, 0, b''
+    for bloque in iter(lambda: archivo.read(TAMANO_BLOQUE), b''):
+        datos += bloque
+        for coincidencia in patron.finditer(datos):
+            # Al final del bloque aún no se sabe si sigue una "s" (/Pages)
+            if base + coincidencia.end() > ultimo and coincidencia.end() < len(datos):
+                paginas += 1
+                ultimo = base + coincidencia.end()
+        corte = max(len(datos) - 32, 0)
+        base += corte
+        datos = datos[corte:]
+    paginas += sum(1 for c in patron.finditer(datos) if base + c.end() > ultimo)
+    return {'paginas': paginas}
+
+
+def _texto_office(archivo):
+    partes = []
+    with zipfile.ZipFile(archivo) as zip_:
+        for nombre in sorted(zip_.namelist()):
+            if re.match(r'(word/document|ppt/slides/slide\d+|xl/sharedStrings)\.xml$', nombre):
+                xml = zip_.read(nombre).decode('utf-8', 'ignore')
+                partes.append(re.sub(r'<[^>]+>', ' ', xml))
+    return ' '.join(partes)
+
+
+def paso_texto(documento, archivo):
+    mime = documento.tipo_mime
+    if mime == 'text/plain':
+        texto = archivo.read(MAX_TEXTO).decode('utf-8', 'ignore')
+    elif mime in MIME_OFFICE.values():
+        texto = _texto_office(archivo)
+    elif mime == 'application/pdf' and _pypdf() is not None:
+        texto = '\n'.join((pagina.extract_text() or '') for pagina in _pypdf().PdfReader(archivo).pages)
+    else:
+        return {}
+    return {'texto': re.sub(r'\s+', ' ', texto).strip()[:MAX_TEXTO]}
+
+
+def paso_escaneo(documento, archivo):
+    limpio, detalle = obtener_escaner().escanear(archivo)
+    if not limpio:
+        raise ArchivoRechazado(detalle or 'Archivo rechazado por el escáner')
+    return {}
+
+
+PASOS = [
+    ('checksum', paso_checksum),
+    ('mime', paso_mime),
+    ('paginas', paso_paginas),
+    ('texto', paso_texto),
+    ('escaneo', paso_escaneo),
+]
+
+
+# Ejecución
+def _guardar(documento_id, **campos):
+    DocumentoVehiculo = apps.get_model('flota', 'DocumentoVehiculo')
+    DocumentoVehiculo.objects.filter(pk=documento_id).update(**campos)
+
+
+def procesar_documento(documento_id):
+    """
+    Ejecuta todos los pasos sobre el archivo actual del documento. Los
+    resultados se guardan con UPDATE para no volver a disparar save().
+    """
+    DocumentoVehiculo = apps.get_model('flota', 'DocumentoVehiculo')
+    documento = DocumentoVehiculo.objects.filter(pk=documento_id).first()
+    if documento is None or not documento.archivo:
+        return None
+
+    reintentos = getattr(settings, 'DOCUMENTOS_PROCESAMIENTO_REINTENTOS', 3)
+    espera = getattr(settings, 'DOCUMENTOS_PROCESAMIENTO_ESPERA', 1.0)
+    archivo_actual = documento.archivo.name
+    registro = {}
+    estado_final = 'completado'
+    _guardar(documento_id, procesamiento_estado='procesando', procesamiento=registro)
+
+    for nombre, paso in PASOS:
+        intentos, inicio = 0, time.monotonic()
+        while True:
+            intentos += 1
+            try:
+                with documento.archivo.storage.open(archivo_actual, 'rb') as archivo:
+                    resultado = paso(documento, archivo)
+            except ArchivoRechazado as e:
+                registro[nombre] = {'estado': 'rechazado', 'intentos': intentos, 'error': str(e)}
+                estado_final = 'rechazado'
+                break
+            except Exception as e:
+                if intentos < reintentos:
+                    time.sleep(espera * 2 ** (intentos - 1))
+                    continue
+                registro[nombre] = {'estado': 'error', 'intentos': intentos, 'error': f'{type(e).__name__}: {e}'}
+                estado_final = 'error'
+                break
+            for campo, valor in resultado.items():
+                setattr(documento, campo, valor)
+            registro[nombre] = {'estado': 'ok', 'intentos': intentos}
+            break
+        registro[nombre]['duracion_ms'] = round((time.monotonic() - inicio) * 1000)
+        if estado_final == 'rechazado':
+            break
+
+    campos = {'procesamiento_estado': estado_final, 'procesamiento': registro}
+    for campo in ('sha256', 'tipo_mime', 'paginas', 'texto'):
+        campos[campo] = getattr(documento, campo)
+    # Si el archivo cambió mientras se procesaba, su propio procesamiento manda
+    DocumentoVehiculo.objects.filter(pk=documento_id, archivo=archivo_actual).update(**campos)
+    invalidar_modelos(DocumentoVehiculo)
+    return estado_final
+
+
+def _procesar_en_hilo(documento_id):
+    close_old_connections()
+    try:
+        procesar_documento(documento_id)
+    finally:
+        close_old_connections()
+
+
+def obtener_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'DOCUMENTOS_PROCESAMIENTO_HILOS', 2),
+                thread_name_prefix='procesamiento-documentos',
+            )
+        return _pool
+
+
+def encolar_procesamiento(documento_id):
+    """
+    Encola el procesamiento cuando la transacción que guardó el archivo se
+    confirma (antes el hilo no vería la fila). Con
+    DOCUMENTOS_PROCESAMIENTO_SINCRONO se ejecuta en el mismo hilo.
+
+    Con DOCUMENTOS_PROCESAMIENTO_COLA se guarda como tarea de core.tareas en
+    la misma transacción y la ejecuta `manage.py worker`: sobrevive a un
+    reinicio del servidor, a diferencia del grupo de hilos.
+    """
+    if getattr(settings, 'DOCUMENTOS_PROCESAMIENTO_COLA', False):
+        from core.tareas import encolar
+        encolar(procesar_documento, {'documento_id': documento_id}, prioridad=5)
+        return
+
+    def enviar():
+        if getattr(settings, 'DOCUMENTOS_PROCESAMIENTO_SINCRONO', False):
+            procesar_documento(documento_id)
+        else:
+            obtener_pool().submit(_procesar_en_hilo, documento_id)
+    transaction.on_commit(enviar)
@@ -0,0 +1,245 @@
+"""
+Pronóstico de mantenimiento de toda la flota.
+
+El historial completo de mantenimientos se carga con una sola consulta en
+arreglos de NumPy ordenados por (bus, fecha) y todas las estimaciones se
+hacen por grupos con operaciones vectorizadas (np.diff, np.bincount...), sin
+recorrer los buses uno por uno. Para cada bus:
+
+- intervalo entre mantenimientos programados (preventivo / predictivo), en
+  días y en km: promedio ponderado que da más peso a los intervalos
+  recientes (la mitad cada SEMIVIDA_INTERVALOS hacia atrás);
+- km por día recorridos según el historial;
+- fecha y km del próximo mantenimiento: el último programado más el
+  intervalo. Si con el kilometraje actual (Bus.kilometraje_actual) y el ritmo
+  de uso el km se alcanza antes, la fecha se adelanta;
+- costo esperado del próximo mantenimiento programado y costo anual esperado
+  (todos los tipos).
+
+Los buses con menos de MIN_INTERVALOS intervalos usan la mediana de la
+flota. Los resultados reemplazan la tabla PronosticoMantenimiento.
+
+NumPy es una dependencia opcional: sin NumPy el pronóstico no se calcula y
+las pantallas muestran el último guardado, si lo hay.
+"""
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.utils import timezone
+
+from core.cache import invalidar_modelos
+from .models import Bus, Mantenimiento, PronosticoMantenimiento
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+TIPOS_PROGRAMADOS = ('preventivo', 'predictivo')
+SEMIVIDA_INTERVALOS = 4
+MIN_INTERVALOS = 2
+# Sin ningún bus con historial suficiente
+INTERVALO_DIAS_DEFECTO = 180
+INTERVALO_KM_DEFECTO = 10000
+TAMANO_LOTE = 1000
+EPOCA = date(1970, 1, 1)
+
+
+class NumpyNoDisponible(ImportError):
+    """
+    NumPy no está instalado.
+    """
+
+
+def numpy_disponible():
+    return np is not None
+
+
+def cargar_historial():
+    """
+    Historial de mantenimientos como arreglos ordenados por (bus, fecha):
+    bus, dia (días desde 1970), km, costo y programado (bool).
+    """
+    filas = list(
+        Mantenimiento.objects
+        .order_by('bus_id', 'fecha_mantenimiento', 'id')
+        .values_list('bus_id', 'fecha_mantenimiento', 'kilometraje', 'costo', 'tipo')
+    )
+    if not filas:
+        vacio = np.array([], dtype=np.int64)
+        return {
+            'bus': vacio, 'dia': vacio, 'km': vacio.astype(float),
+            'costo': vacio.astype(float), 'programado': vacio.astype(bool),
+        }
+    buses, fechas, kms, costos, tipos = zip(*filas)
+    return {
+        'bus': np.array(buses, dtype=np.int64),
+        'dia': np.array(fechas, dtype='datetime64[D]').astype(np.int64),
+        'km': np.array(kms, dtype=float),
+        'costo': np.array(costos, dtype=float),
+        'programado': np.isin(np.array(tipos), TIPOS_PROGRAMADOS),
+    }
+
+
+def _ultimo_por_grupo(grupo):
+    # grupo está ordenado: el último índice de cada valor
+    return np.searchsorted(grupo, grupo, side='right') - 1
+
+
+def _promedio_ponderado(grupo, valores, pesos, cantidad):
+    suma_pesos = np.bincount(grupo, pesos, minlength=cantidad)
+    suma = np.bincount(grupo, pesos * valores, minlength=cantidad)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(suma_pesos > 0, suma / suma_pesos, np.nan)
+
+
+def pronosticar(historial, km_actual, hoy):
+    """
+    Calcula el pronóstico de todos los buses con historial.
+
+    historial: arreglos de cargar_historial(); km_actual: par de arreglos
+    (ids de bus ordenados, kilometraje actual); hoy: date. Devuelve un
+    diccionario de arreglos alineados por bus.
+    """
+    bus, dia, km, costo, programado = (
+        historial['bus'], historial['dia'], historial['km'], historial['costo'], historial['programado'],
+    )
+    ids, inicio, conteo = np.unique(bus, return_index=True, return_counts=True)
+    cantidad = len(ids)
+    if not cantidad:
+        return {'bus': ids}
+    grupo = np.repeat(np.arange(cantidad), conteo)
+    fin = inicio + conteo - 1
+    dia_hoy = (hoy - EPOCA).days
+
+    # Ritmo de uso y costo anual con todo el historial del bus
+    dias_historial = (dia[fin] - dia[inicio]).astype(float)
+    km_historial = km[fin] - km[inicio]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        km_por_dia = np.where((dias_historial > 0) & (km_historial > 0), km_historial / dias_historial, 0.0)
+    costo_total = np.bincount(grupo, costo, minlength=cantidad)
+    costo_anual = costo_total / np.maximum(dias_historial, 365.0) * 365.0
+
+    # Intervalos entre mantenimientos programados consecutivos del mismo bus
+    g = grupo[programado]
+    dia_p, km_p, costo_p = dia[programado], km[programado], costo[programado]
+    tiene_programado = np.bincount(g, minlength=cantidad) > 0
+    edad = _ultimo_por_grupo(g) - np.arange(len(g))
+    peso = 0.5 ** (edad / SEMIVIDA_INTERVALOS)
+
+    mismo_bus = g[1:] == g[:-1]
+    delta_dias = np.diff(dia_p).astype(float)
+    delta_km = np.diff(km_p)
+    valido = mismo_bus & (delta_dias > 0)
+    valido_km = valido & (delta_km > 0)
+    g_intervalo = g[1:]
+    peso_intervalo = peso[1:]
+    muestras = np.bincount(g_intervalo, valido, minlength=cantidad).astype(np.int64)
+    intervalo_dias = _promedio_ponderado(g_intervalo, delta_dias, np.where(valido, peso_intervalo, 0), cantidad)
+    intervalo_km = _promedio_ponderado(g_intervalo, delta_km, np.where(valido_km, peso_intervalo, 0), cantidad)
+    costo_esperado = _promedio_ponderado(g, costo_p, peso, cantidad)
+
+    # Pocos datos: mediana de los buses con historial suficiente
+    propio = muestras >= MIN_INTERVALOS
+    origen_flota = ~propio
+    dias_flota = intervalo_dias[propio]
+    km_flota = intervalo_km[propio & ~np.isnan(intervalo_km)]
+    mediana_dias = np.median(dias_flota) if dias_flota.size else INTERVALO_DIAS_DEFECTO
+    mediana_km = np.median(km_flota) if km_flota.size else INTERVALO_KM_DEFECTO
+    intervalo_dias = np.where(propio, intervalo_dias, mediana_dias)
+    intervalo_km = np.where(propio & ~np.isnan(intervalo_km), intervalo_km, mediana_km)
+    costos_flota = costo_esperado[tiene_programado]
+    mediana_costo = np.median(costos_flota) if costos_flota.size else np.median(costo[fin])
+    costo_esperado = np.where(tiene_programado, costo_esperado, mediana_costo)
+
+    # Base: último mantenimiento programado (o el último de cualquier tipo)
+    ultimos = np.unique(_ultimo_por_grupo(g))
+    ultimo_p = np.full(cantidad, -1, dtype=np.int64)
+    ultimo_p[g[ultimos]] = np.nonzero(programado)[0][ultimos]
+    base = np.where(tiene_programado, ultimo_p, fin)
+    fecha_por_tiempo = dia[base] + np.rint(intervalo_dias).astype(np.int64)
+    km_proximo = km[base] + intervalo_km
+
+    ids_km, kms = km_actual
+    posicion = np.clip(np.searchsorted(ids_km, ids), 0, max(len(ids_km) - 1, 0))
+    encontrado = (ids_km[posicion] == ids) if len(ids_km) else np.zeros(cantidad, dtype=bool)
+    actual = np.maximum(np.where(encontrado, kms[posicion] if len(ids_km) else 0, 0), km[fin])
+    with np.errstate(invalid='ignore', divide='ignore'):
+        dias_hasta_km = np.where(km_por_dia > 0, (km_proximo - actual) / km_por_dia, np.inf)
+    fecha_por_km = dia_hoy + np.ceil(np.clip(dias_hasta_km, 0, 365 * 50)).astype(np.int64)
+    fecha_proxima = np.where(np.isfinite(dias_hasta_km), np.minimum(fecha_por_tiempo, fecha_por_km), fecha_por_tiempo)
+
+    return {
+        'bus': ids,
+        'fecha_proxima': fecha_proxima,
+        'km_proximo': np.rint(km_proximo).astype(np.int64),
+        'costo_esperado': costo_esperado,
+        'costo_anual_esperado': costo_anual,
+        'intervalo_dias': np.rint(intervalo_dias).astype(np.int64),
+        'intervalo_km': np.rint(intervalo_km).astype(np.int64),
+        'km_por_dia': km_por_dia,
+        'muestras': muestras,
+        'origen_flota': origen_flota,
+    }
+
+
+def _km_actual_de_buses():
+    filas = list(Bus.objects.order_by('pk').values_list('pk', 'kilometraje_actual'))
+    ids = np.array([fila[0] for fila in filas], dtype=np.int64)
+    kms = np.array([fila[1] for fila in filas], dtype=float)
+    return ids, kms
+
+
+def _dinero(valor):
+    return Decimal(str(round(float(valor), 2)))
+
+
+def guardar(resultado, calculado_en):
+    """
+    Reemplaza la tabla de pronósticos con bulk_create por lotes.
+    """
+    def filas():
+        for i in range(len(resultado['bus'])):
+            yield PronosticoMantenimiento(
+                bus_id=int(resultado['bus'][i]),
+                fecha_proxima=EPOCA + timedelta(days=int(resultado['fecha_proxima'][i])),
+                km_proximo=int(resultado['km_proximo'][i]),
+                costo_esperado=_dinero(resultado['costo_esperado'][i]),
+                costo_anual_esperado=_dinero(resultado['costo_anual_esperado'][i]),
+                intervalo_dias=int(resultado['intervalo_dias'][i]),
+                intervalo_km=int(resultado['intervalo_km'][i]),
+                km_por_dia=round(float(resultado['km_por_dia'][i]), 2),
+                muestras=int(resultado['muestras'][i]),
+                origen='flota' if resultado['origen_flota'][i] else 'historial',
+                calculado_en=calculado_en,
+            )
+
+    total = 0
+    with transaction.atomic():
+        PronosticoMantenimiento.objects.all().delete()
+        lote = []
+        for pronostico in filas():
+            lote.append(pronostico)
+            if len(lote) >= TAMANO_LOTE:
+                PronosticoMantenimiento.objects.bulk_create(lote)
+                total += len(lote)
+                lote = []
+        if lote:
+            PronosticoMantenimiento.objects.bulk_create(lote)
+            total += len(lote)
+    # bulk_create no emite señales
+    invalidar_modelos(PronosticoMantenimiento)
+    return total
+
+
+def actualizar_pronosticos(hoy=None):
+    """
+    Carga el historial, pronostica toda la flota y guarda el resultado.
+    Devuelve la cantidad de buses pronosticados.
+    """
+    if not numpy_disponible():
+        raise NumpyNoDisponible('El pronóstico de mantenimiento requiere NumPy (pip install numpy).')
+    hoy = hoy or timezone.localdate()
+    resultado = pronosticar(cargar_historial(), _km_actual_de_buses(), hoy)
+    return guardar(resultado, timezone.now())
@@ -0,0 +1,23 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from .models import Mantenimiento
+from .odometro import borrar_lecturas, fecha_de_dia, registrar_lectura
+
+
+@receiver(post_save, sender=Mantenimiento)
+def lectura_mantenimiento(sender, instance, **kwargs):
+    """
+    El kilometraje anotado en un mantenimiento es una lectura del odómetro.
+    """
+    if instance.kilometraje is None or instance.kilometraje < 0:
+        borrar_lecturas('mantenimiento', instance.pk)
+        return
+    registrar_lectura(
+        instance.bus_id, instance.kilometraje, fecha_de_dia(instance.fecha_mantenimiento),
+        origen='mantenimiento', referencia=instance.pk,
+    )
+
+
+@receiver(post_delete, sender=Mantenimiento)
+def borrar_lectura_mantenimiento(sender, instance, **kwargs):
+    borrar_lecturas('mantenimiento', instance.pk)
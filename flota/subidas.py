@@ -0,0 +1,293 @@
+"""
+Subida de archivos por partes, reanudable por posición.
+
+1. POST   /flota/subidas/             {"nombre", "tamano", "documento"?}  -> id
+2. PATCH  /flota/subidas/<id>/        cuerpo = bytes desde Upload-Offset
+3. GET    /flota/subidas/<id>/        -> {"offset"}: desde dónde reanudar
+4. DELETE /flota/subidas/<id>/        cancela y borra la parte recibida
+
+Las subidas sin actividad durante SUBIDA_VENCIMIENTO segundos (abandonadas a
+medias, o completas pero nunca adjuntadas) se borran con su archivo temporal
+en la tarea periódica limpiar_vencidas.
+
+Cada parte se lee del request por bloques y se escribe directamente en un
+archivo temporal en disco, así que la memoria del proceso no depende del
+tamaño del archivo. Al recibir el último byte el archivo se mueve (sin
+copiarlo) al almacenamiento por contenido y se adjunta al documento.
+"""
+import os
+import time
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import DocumentoVehiculo, SubidaArchivo
+
+TAMANO_BLOQUE = 64 * 1024
+TAMANO_MAXIMO = getattr(settings, 'SUBIDA_TAMANO_MAXIMO', 2 * 1024 ** 3)
+TAMANO_MAXIMO_PARTE = getattr(settings, 'SUBIDA_TAMANO_MAXIMO_PARTE', 16 * 1024 ** 2)
+VENCIMIENTO = timedelta(seconds=getattr(settings, 'SUBIDA_VENCIMIENTO', 24 * 60 * 60))
+RESERVA = timedelta(seconds=getattr(settings, 'SUBIDA_RESERVA_PARTE', 60))
+DIRECTORIO = 'subidas'
+
+
+class SubidaError(Exception):
+    """
+    Petición de subida inválida. El mensaje se devuelve al cliente.
+    """
+    status = 400
+
+
+class OffsetIncorrecto(SubidaError):
+    """
+    La parte no empieza donde terminó la anterior; el cliente debe consultar
+    el offset y reanudar desde ahí.
+    """
+    status = 409
+
+
+class SubidaNoEncontrada(SubidaError):
+    """
+    La subida no existe: se canceló o venció mientras llegaba la parte.
+    """
+    status = 404
+
+
+class ArchivoTemporal(File):
+    """
+    Archivo ya escrito en disco: el almacenamiento lo mueve en lugar de
+    copiarlo.
+    """
+    def temporary_file_path(self):
+        return self.file.name
+
+
+def directorio_temporal():
+    return os.path.join(settings.MEDIA_ROOT, DIRECTORIO)
+
+
+def ruta_temporal(subida):
+    directorio = directorio_temporal()
+    os.makedirs(directorio, exist_ok=True)
+    return os.path.join(directorio, f'{subida.pk}.part')
+
+
+def iniciar_subida(nombre, tamano, documento=None):
+    nombre = os.path.basename(str(nombre or '')).strip()
+    if not nombre:
+        raise SubidaError('Falta el nombre del archivo.')
+    try:
+        tamano = int(tamano)
+    except (TypeError, ValueError):
+        raise SubidaError('El tamaño debe ser un número de bytes.')
+    if tamano <= 0 or tamano > TAMANO_MAXIMO:
+        raise SubidaError(f'El tamaño debe estar entre 1 y {TAMANO_MAXIMO} bytes.')
+    subida = SubidaArchivo.objects.create(nombre_archivo=nombre[:255], tamano=tamano, documento=documento)
+    open(ruta_temporal(subida), 'wb').close()
+    return subida
+
+
+def _validar_parte(subida, offset, largo):
+    if subida.completada_en:
+        raise SubidaError('La subida ya está completa.')
+    if offset != subida.recibido:
+        raise OffsetIncorrecto(f'Se esperaba el offset {subida.recibido}.')
+    if offset + largo > subida.tamano:
+        raise SubidaError('La parte excede el tamaño declarado.')
+
+
+def _obtener(subida_id):
+    try:
+        return SubidaArchivo.objects.get(pk=subida_id)
+    except SubidaArchivo.DoesNotExist:
+        raise SubidaNoEncontrada('La subida no existe o venció.')
+
+
+def reservar_parte(subida_id, offset, largo, ahora=None):
+    """
+    Reserva la subida para escribir una parte que empieza en offset. La
+    reserva es un UPDATE condicional (sin transacción abierta ni filas
+    bloqueadas): solo una petición a la vez la obtiene, y vence después de
+    RESERVA si el proceso que la tenía muere. Devuelve (subida, escritor).
+    """
+    subida = _obtener(subida_id)
+    _validar_parte(subida, offset, largo)
+    ahora = ahora or timezone.now()
+    escritor = uuid.uuid4()
+    reservada = (
+        SubidaArchivo.objects
+        .filter(pk=subida_id, recibido=offset, completada_en__isnull=True)
+        .filter(Q(escritura_hasta__isnull=True) | Q(escritura_hasta__lt=ahora))
+        .update(escritor=escritor, escritura_hasta=ahora + RESERVA, actualizado_en=ahora)
+    )
+    if not reservada:
+        # Otra petición cambió la fila entre la lectura y la reserva
+        _validar_parte(_obtener(subida_id), offset, largo)
+        raise OffsetIncorrecto('Otra parte de esta subida se está recibiendo; reintente más tarde.')
+    return subida, escritor
+
+
+def _reserva_perdida(subida_id):
+    _obtener(subida_id)
+    return OffsetIncorrecto('La reserva de la parte venció; consulte el offset y reintente.')
+
+
+def _liberar(subida_id, escritor):
+    SubidaArchivo.objects.filter(pk=subida_id, escritor=escritor).update(escritor=None, escritura_hasta=None)
+
+
+def recibir_parte(subida_id, offset, origen, largo):
+    """
+    Escribe una parte leída de origen (el request) a partir de offset.
+
+    La parte debe empezar exactamente en el byte recibido hasta ahora. Antes
+    de leer el cuerpo se reserva la subida (reservar_parte), y el cuerpo se
+    copia sin ninguna transacción abierta, renovando la reserva mientras
+    llega; al final recibido se actualiza solo si la fila sigue reservada por
+    esta petición y en el mismo offset. Devuelve la subida actualizada.
+    """
+    if largo is None or largo < 0:
+        raise SubidaError('Falta Content-Length.')
+    if largo > TAMANO_MAXIMO_PARTE:
+        raise SubidaError(f'Cada parte puede tener como máximo {TAMANO_MAXIMO_PARTE} bytes.')
+
+    subida, escritor = reservar_parte(subida_id, offset, largo)
+    escritos = 0
+    try:
+        renovada = time.monotonic()
+        try:
+            destino = open(ruta_temporal(subida), 'r+b')
+        except FileNotFoundError:
+            # Se canceló o venció justo después de reservar
+            raise SubidaNoEncontrada('La subida no existe o venció.')
+        with destino:
+            destino.seek(offset)
+            while escritos < largo:
+                bloque = origen.read(min(TAMANO_BLOQUE, largo - escritos))
+                if not bloque:
+                    break
+                destino.write(bloque)
+                escritos += len(bloque)
+                if time.monotonic() - renovada > RESERVA.total_seconds() / 3:
+                    ahora = timezone.now()
+                    if not SubidaArchivo.objects.filter(pk=subida_id, escritor=escritor).update(
+                        escritura_hasta=ahora + RESERVA, actualizado_en=ahora
+                    ):
+                        raise _reserva_perdida(subida_id)
+                    renovada = time.monotonic()
+            # Si la conexión se cortó a mitad de la parte se conserva lo recibido
+            destino.truncate(offset + escritos)
+    except BaseException:
+        _liberar(subida_id, escritor)
+        raise
+
+    ahora = timezone.now()
+    subida.recibido = offset + escritos
+    subida.completada_en = ahora if subida.completa else None
+    actualizada = (
+        SubidaArchivo.objects
+        .filter(pk=subida_id, escritor=escritor, recibido=offset)
+        .update(
+            recibido=subida.recibido, completada_en=subida.completada_en, actualizado_en=ahora,
+            escritor=None, escritura_hasta=None,
+        )
+    )
+    if not actualizada:
+        raise _reserva_perdida(subida_id)
+    subida.actualizado_en = ahora
+
+    if subida.completa and subida.documento_id:
+        adjuntar(subida, subida.documento)
+    return subida
+
+
+def adjuntar(subida, documento):
+    """
+    Mueve el archivo completo al almacenamiento del documento y lo guarda.
+    """
+    if not subida.completa:
+        raise SubidaError('La subida no está completa.')
+    ruta = ruta_temporal(subida)
+    if not os.path.exists(ruta):
+        # Ya se adjuntó antes
+        return documento
+    with open(ruta, 'rb') as archivo:
+        documento.archivo.save(subida.nombre_archivo, ArchivoTemporal(archivo), save=False)
+    documento.nombre_archivo = subida.nombre_archivo
+    documento.save()
+    SubidaArchivo.objects.filter(pk=subida.pk).update(documento=documento)
+    if os.path.exists(ruta):
+        # El almacenamiento no lo movió porque el contenido ya existía
+        os.remove(ruta)
+    return documento
+
+
+def cancelar(subida):
+    ruta = ruta_temporal(subida)
+    if os.path.exists(ruta):
+        os.remove(ruta)
+    subida.delete()
+
+
+def limpiar_vencidas(ahora=None, tamano_lote=500):
+    """
+    Tarea periódica: borra las subidas sin actividad desde hace más de
+    VENCIMIENTO con su archivo temporal, y los .part igual de antiguos que ya
+    no tienen subida (p. ej. si se borró el documento). Las filas se bloquean
+    por lotes saltando las que toma otra limpieza; una subida que está
+    recibiendo una parte renueva actualizado_en, así que no vence mientras
+    llega. Devuelve {"subidas": n, "archivos": m}.
+    """
+    limite = (ahora or timezone.now()) - VENCIMIENTO
+    subidas = archivos = 0
+    while True:
+        with transaction.atomic():
+            lote = list(
+                SubidaArchivo.objects
+                .select_for_update(skip_locked=True)
+                .filter(actualizado_en__lt=limite)
+                .only('id')[:tamano_lote]
+            )
+            if not lote:
+                break
+            for subida in lote:
+                ruta = ruta_temporal(subida)
+                if os.path.exists(ruta):
+                    os.remove(ruta)
+                    archivos += 1
+            SubidaArchivo.objects.filter(pk__in=[subida.pk for subida in lote]).delete()
+        subidas += len(lote)
+
+    directorio = directorio_temporal()
+    if os.path.isdir(directorio):
+        huerfanos = {}
+        for nombre in os.listdir(directorio):
+            ruta = os.path.join(directorio, nombre)
+            if not nombre.endswith('.part') or os.path.getmtime(ruta) >= limite.timestamp():
+                continue
+            try:
+                huerfanos[uuid.UUID(nombre[:-len('.part')])] = ruta
+            except ValueError:
+                huerfanos[nombre] = ruta
+        existentes = set(SubidaArchivo.objects.filter(
+            pk__in=[clave for clave in huerfanos if isinstance(clave, uuid.UUID)]
+        ).values_list('pk', flat=True))
+        for clave, ruta in huerfanos.items():
+            if clave not in existentes:
+                os.remove(ruta)
+                archivos += 1
+    return {'subidas': subidas, 'archivos': archivos}
+
+
+def documento_para_subida(documento_id):
+    if documento_id in (None, ''):
+        return None
+    try:
+        return DocumentoVehiculo.objects.get(pk=documento_id)
+    except (DocumentoVehiculo.DoesNotExist, ValueError, TypeError):
+        raise SubidaError('El documento no existe.')
@@ -0,0 +1,25 @@
+"""
+Funciones de flota que se ejecutan como tareas en segundo plano (core.tareas).
+"""
+from .models import DocumentoVehiculo
+from .pronostico import actualizar_pronosticos, numpy_disponible
+
+
+def actualizar_estados_documentos():
+    """
+    Tarea periódica: recalcula el estado de los documentos (ver
+    DocumentoVehiculo.actualizar_estados). Devuelve las filas movidas por
+    transición, p. ej. {"vigente->por_vencer": 3}.
+    """
+    movidos = DocumentoVehiculo.actualizar_estados()
+    return {f'{anterior}->{nuevo}': filas for (anterior, nuevo), filas in sorted(movidos.items())}
+
+
+def pronosticar_mantenimientos():
+    """
+    Tarea periódica: rehace los pronósticos de mantenimiento. Sin NumPy no
+    hace nada (la dependencia es opcional).
+    """
+    if not numpy_disponible():
+        return 'Omitido: NumPy no está instalado'
+    return actualizar_pronosticos()
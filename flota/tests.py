@@ -1,5 +1,34 @@
-from django.test import TestCase
-from .models import Bus, DocumentoVehiculo, Mantenimiento
+from datetime import date, timedelta
+import os
+import shutil
+import tempfile
+import uuid
+from io import StringIO
+from django.conf import settings
+from django.core.management import call_command
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+import json
+from unittest import mock, skipUnless
+from .models import Bus, DocumentoVehiculo, LecturaOdometro, Mantenimiento, PronosticoMantenimiento, SubidaArchivo
+from .odometro import lecturas_entre, registrar_lectura
+from .pronostico import actualizar_pronosticos, numpy_disponible
+from .procesamiento import procesar_documento
+from .subidas import OffsetIncorrecto, limpiar_vencidas, recibir_parte
+from core.cache import cache_versionada
+from core.models import Tarea
+from core.tareas import ejecutar, tomar_tareas
+from .views import celdas_cumplimiento, matriz_cumplimiento
+
+
+# La caché versionada es DummyCache con locmem; aquí se prueba como si fuera
+# compartida
+CACHES_COMPARTIDAS = dict(settings.CACHES, versionada={
+    'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'versionada',
+})
 
 
 class BusTestCase(TestCase):
@@ -17,3 +46,648 @@ class BusTestCase(TestCase):
     def test_bus_creation(self):
         self.assertEqual(self.bus.placa, 'ABC123')
         self.assertEqual(self.bus.estado, 'activo')
+
+    def crear_historial(self):
+        hoy = date(2025, 6, 1)
+        for i, (fecha, km, costo) in enumerate([
+            (date(2023, 3, 1), 10000, 100), (date(2025, 1, 10), 40000, 250), (date(2025, 5, 20), 52000, 50),
+        ]):
+            Mantenimiento.objects.create(
+                bus=self.bus, tipo='preventivo', descripcion=f'Servicio {i}',
+                fecha_mantenimiento=fecha, kilometraje=km, costo=costo,
+            )
+        for numero, dias in enumerate([-5, 10, 90, 400]):
+            DocumentoVehiculo.objects.create(
+                bus=self.bus, tipo='soat', numero_documento=str(numero),
+                fecha_emision=hoy - timedelta(days=365), fecha_vencimiento=hoy + timedelta(days=dias),
+            )
+        return hoy
+
+    def test_estadisticas_en_una_consulta(self):
+        hoy = self.crear_historial()
+        otro = Bus.objects.create(
+            placa='XYZ999', modelo='Volvo', año_fabricacion=2022, capacidad_pasajeros=40,
+            numero_chasis='CH999', fecha_adquisicion='2022-01-01'
+        )
+        with self.assertNumQueries(1):
+            buses = {bus.pk: bus for bus in Bus.objects.con_estadisticas(hoy)}
+        bus = buses[self.bus.pk]
+        self.assertEqual(bus.num_mantenimientos, 3)
+        self.assertEqual(bus.costo_mantenimiento_total, 400)
+        self.assertEqual(bus.costo_mantenimiento_anio, 300)
+        self.assertEqual((bus.ultimo_mantenimiento_fecha, bus.ultimo_mantenimiento_km), (date(2025, 5, 20), 52000))
+        self.assertEqual(
+            (bus.num_documentos, bus.documentos_vencido, bus.documentos_por_vencer, bus.documentos_vigente),
+            (4, 1, 1, 2)
+        )
+        vacio = buses[otro.pk]
+        self.assertEqual((vacio.num_mantenimientos, vacio.costo_mantenimiento_total, vacio.num_documentos), (0, 0, 0))
+        self.assertIsNone(vacio.ultimo_mantenimiento_fecha)
+
+    def test_detalle_y_historial_paginado(self):
+        self.crear_historial()
+        for i in range(30):
+            Mantenimiento.objects.create(
+                bus=self.bus, tipo='otro', descripcion='Revisión', fecha_mantenimiento=date(2022, 1, 1),
+                kilometraje=i, costo=1,
+            )
+        cache.clear()
+        # Bus con estadísticas, últimos mantenimientos y documentos
+        with self.assertNumQueries(3):
+            respuesta = self.client.get(reverse('flota:bus_detail', args=[self.bus.pk]))
+        self.assertEqual(len(respuesta.context['mantenimientos']), 5)
+        self.assertContains(respuesta, 'Ver todos los mantenimientos (33)')
+
+        respuesta = self.client.get(reverse('flota:mantenimiento_list', args=[self.bus.pk]), {'page': 2})
+        self.assertEqual(respuesta.context['page_obj'].paginator.num_pages, 2)
+        self.assertEqual(len(respuesta.context['mantenimientos']), 8)
+
+
+class OdometroTestCase(TestCase):
+    def setUp(self):
+        self.bus = Bus.objects.create(
+            placa='ABC123',
+            modelo='Mercedes Benz O-500',
+            año_fabricacion=2020,
+            capacidad_pasajeros=50,
+            numero_chasis='CH123456789',
+            kilometraje_inicial=1000,
+            fecha_adquisicion='2020-05-15'
+        )
+
+    def kilometraje(self):
+        return Bus.objects.values_list('kilometraje_actual', flat=True).get(pk=self.bus.pk)
+
+    def mantenimiento(self, fecha, km):
+        return Mantenimiento.objects.create(
+            bus=self.bus, tipo='preventivo', descripcion='Servicio',
+            fecha_mantenimiento=fecha, kilometraje=km, costo=10,
+        )
+
+    def test_lecturas_de_mantenimientos(self):
+        self.assertEqual(self.kilometraje(), 1000)
+        reciente = self.mantenimiento(date(2025, 3, 1), 5000)
+        # Una lectura más antigua no mueve el kilometraje actual
+        self.mantenimiento(date(2024, 3, 1), 3000)
+        self.assertEqual(self.kilometraje(), 5000)
+
+        reciente.kilometraje = 5500
+        reciente.save()
+        self.assertEqual(self.kilometraje(), 5500)
+        self.assertEqual(LecturaOdometro.objects.count(), 2)
+
+        reciente.delete()
+        self.assertEqual(self.kilometraje(), 3000)
+        Mantenimiento.objects.all().delete()
+        self.assertEqual(self.kilometraje(), 1000)
+
+    def test_lectura_de_viaje(self):
+        from core.models import Conductor, Lugar
+        from viajes.models import Viaje
+        conductor = Conductor.objects.create(
+            nombre='Juan', apellido='Pérez', cedula='1', email='j@example.com',
+            telefono='1', fecha_contratacion='2024-01-01'
+        )
+        lugar = Lugar.objects.create(nombre='Quito', ciudad='Quito')
+        llegada = timezone.now()
+        viaje = Viaje.objects.create(
+            bus=self.bus, conductor=conductor, lugar_origen=lugar, lugar_destino=lugar,
+            fecha_salida=llegada - timedelta(hours=3), fecha_llegada_estimada=llegada,
+            kilometraje_llegada=1800,
+        )
+        self.assertEqual(self.kilometraje(), 1800)
+        viaje.kilometraje_llegada = None
+        viaje.save()
+        self.assertEqual(self.kilometraje(), 1000)
+
+    def test_guardar_bus_no_pisa_el_kilometraje(self):
+        formulario = Bus.objects.get(pk=self.bus.pk)
+        registrar_lectura(self.bus.pk, 2500)
+        formulario.modelo = 'O-500 RS'
+        formulario.save()
+        self.assertEqual(self.kilometraje(), 2500)
+
+        # Sin lecturas, cambiar el kilometraje inicial cambia el actual
+        otro = Bus.objects.create(
+            placa='XYZ999', modelo='Volvo', año_fabricacion=2022, capacidad_pasajeros=40,
+            numero_chasis='CH999', fecha_adquisicion='2022-01-01'
+        )
+        otro = Bus.objects.get(pk=otro.pk)
+        otro.kilometraje_inicial = 700
+        otro.save()
+        self.assertEqual(Bus.objects.get(pk=otro.pk).kilometraje_actual, 700)
+
+    def test_registro_manual_y_rango(self):
+        url = reverse('flota:lectura_crear', args=[self.bus.pk])
+        respuesta = self.client.post(url, {'fecha': '2025-01-10T08:00', 'kilometraje': 4000})
+        self.assertRedirects(respuesta, reverse('flota:bus_detail', args=[self.bus.pk]))
+        respuesta = self.client.post(url, {'fecha': '2025-02-10T08:00', 'kilometraje': 3500})
+        self.assertContains(respuesta, 'no puede ser menor que la lectura anterior')
+        self.client.post(url, {'fecha': '2025-03-10T08:00', 'kilometraje': 6000})
+        self.assertEqual(self.kilometraje(), 6000)
+
+        desde = timezone.make_aware(timezone.datetime(2025, 2, 1))
+        self.assertEqual([l.kilometraje for l in lecturas_entre(self.bus.pk, desde)], [6000])
+
+    def test_listado_ordenado_por_kilometraje(self):
+        otro = Bus.objects.create(
+            placa='XYZ999', modelo='Volvo', año_fabricacion=2022, capacidad_pasajeros=40,
+            numero_chasis='CH999', kilometraje_inicial=90000, fecha_adquisicion='2022-01-01'
+        )
+        respuesta = self.client.get(reverse('flota:bus_list'), {'orden': '-km'})
+        self.assertEqual([b.pk for b in respuesta.context['buses']], [otro.pk, self.bus.pk])
+        self.assertContains(respuesta, '90000 km')
+
+
+@skipUnless(numpy_disponible(), 'NumPy no está instalado')
+class PronosticoMantenimientoTestCase(TestCase):
+    def setUp(self):
+        self.bus = Bus.objects.create(
+            placa='ABC123', modelo='Mercedes Benz O-500', año_fabricacion=2020,
+            capacidad_pasajeros=50, numero_chasis='CH123456789', fecha_adquisicion='2020-05-15'
+        )
+        self.nuevo = Bus.objects.create(
+            placa='XYZ999', modelo='Volvo', año_fabricacion=2022, capacidad_pasajeros=40,
+            numero_chasis='CH999', fecha_adquisicion='2022-01-01'
+        )
+        # Cada 100 días y 5000 km: 50 km por día
+        for fecha, km, costo in [(date(2024, 1, 1), 10000, 100), (date(2024, 4, 10), 15000, 200), (date(2024, 7, 19), 20000, 300)]:
+            self.mantenimiento(self.bus, 'preventivo', fecha, km, costo)
+        self.mantenimiento(self.nuevo, 'correctivo', date(2024, 6, 1), 3000, 50)
+
+    def mantenimiento(self, bus, tipo, fecha, km, costo):
+        Mantenimiento.objects.create(
+            bus=bus, tipo=tipo, descripcion='Servicio',
+            fecha_mantenimiento=fecha, kilometraje=km, costo=costo,
+        )
+
+    def test_pronostico_por_historial(self):
+        self.assertEqual(actualizar_pronosticos(date(2024, 8, 1)), 2)
+        pronostico = PronosticoMantenimiento.objects.get(bus=self.bus)
+        self.assertEqual((pronostico.intervalo_dias, pronostico.intervalo_km), (100, 5000))
+        self.assertEqual(pronostico.origen, 'historial')
+        self.assertEqual(pronostico.km_proximo, 25000)
+        self.assertEqual(pronostico.km_por_dia, 50)
+        # El km se alcanza a los 100 días; antes vence el intervalo de tiempo
+        self.assertEqual(pronostico.fecha_proxima, date(2024, 10, 27))
+        # Los costos recientes pesan más
+        self.assertGreater(pronostico.costo_esperado, 200)
+        self.assertLess(pronostico.costo_esperado, 300)
+
+        # Sin intervalos propios se usa la flota
+        nuevo = PronosticoMantenimiento.objects.get(bus=self.nuevo)
+        self.assertEqual(nuevo.origen, 'flota')
+        self.assertEqual((nuevo.intervalo_dias, nuevo.intervalo_km), (100, 5000))
+        self.assertEqual(nuevo.costo_esperado, pronostico.costo_esperado)
+        self.assertEqual(nuevo.fecha_proxima, date(2024, 9, 9))
+
+    def test_kilometraje_actual_adelanta_la_fecha(self):
+        registrar_lectura(self.bus.pk, 24800, timezone.make_aware(timezone.datetime(2024, 7, 30)))
+        actualizar_pronosticos(date(2024, 8, 1))
+        # Faltan 200 km a 50 km por día
+        self.assertEqual(PronosticoMantenimiento.objects.get(bus=self.bus).fecha_proxima, date(2024, 8, 5))
+
+    def test_comando_y_listado(self):
+        salida = StringIO()
+        call_command('pronosticar_mantenimientos', '--fecha', '2024-08-01', stdout=salida)
+        self.assertIn('2 buses', salida.getvalue())
+        # Se rehace completa: no quedan pronósticos duplicados
+        call_command('pronosticar_mantenimientos', '--fecha', '2024-08-01', stdout=StringIO())
+        self.assertEqual(PronosticoMantenimiento.objects.count(), 2)
+        self.assertContains(self.client.get(reverse('flota:bus_list')), '27/10/2024')
+
+
+class EstadoDocumentoTestCase(TestCase):
+    def setUp(self):
+        self.bus = Bus.objects.create(
+            placa='ABC123',
+            modelo='Mercedes Benz O-500',
+            año_fabricacion=2020,
+            capacidad_pasajeros=50,
+            numero_chasis='CH123456789',
+            fecha_adquisicion='2020-05-15'
+        )
+        self.hoy = date(2025, 6, 1)
+        for numero, dias in enumerate([-10, -1, 0, 15, 30, 31, 200]):
+            DocumentoVehiculo.objects.create(
+                bus=self.bus,
+                tipo='soat',
+                numero_documento=str(numero),
+                fecha_emision=self.hoy - timedelta(days=365),
+                fecha_vencimiento=self.hoy + timedelta(days=dias)
+            )
+        # Estados guardados en otra fecha y ya desactualizados
+        DocumentoVehiculo.objects.update(estado='vigente')
+
+    def estados(self):
+        return list(DocumentoVehiculo.objects.order_by('fecha_vencimiento').values_list('estado', flat=True))
+
+    def test_actualizar_estados(self):
+        movidos = DocumentoVehiculo.actualizar_estados(self.hoy)
+        self.assertEqual(movidos, {('vigente', 'vencido'): 2, ('vigente', 'por_vencer'): 3})
+        self.assertEqual(
+            self.estados(),
+            ['vencido', 'vencido', 'por_vencer', 'por_vencer', 'por_vencer', 'vigente', 'vigente']
+        )
+        self.assertEqual(DocumentoVehiculo.actualizar_estados(self.hoy), {})
+
+    def test_comando(self):
+        salida = StringIO()
+        call_command('actualizar_estado_documentos', fecha=self.hoy.isoformat(), stdout=salida)
+        self.assertIn('5 cambios', salida.getvalue())
+        salida = StringIO()
+        call_command('actualizar_estado_documentos', fecha=(self.hoy + timedelta(days=1)).isoformat(), stdout=salida)
+        self.assertIn('Por Vencer -> Vencido: 1', salida.getvalue())
+        self.assertIn('Vigente -> Por Vencer: 1', salida.getvalue())
+
+
+@override_settings(CACHES=CACHES_COMPARTIDAS)
+class CumplimientoDocumentosTestCase(TestCase):
+    def setUp(self):
+        cache_versionada.clear()
+        self.hoy = timezone.localdate()
+        self.buses = [
+            Bus.objects.create(
+                placa=f'BUS{i}',
+                modelo='Volvo',
+                año_fabricacion=2020,
+                capacidad_pasajeros=40,
+                numero_chasis=f'CH{i}',
+                fecha_adquisicion='2020-01-01'
+            )
+            for i in range(3)
+        ]
+        # BUS0: SOAT renovado (el viejo vencido no cuenta) y matrícula por vencer
+        self.crear_documento(self.buses[0], 'soat', -20)
+        self.crear_documento(self.buses[0], 'soat', 300)
+        self.crear_documento(self.buses[0], 'matricula', 10)
+        # BUS1: SOAT vencido
+        self.crear_documento(self.buses[1], 'soat', -1)
+        # BUS2: sin documentos
+
+    def crear_documento(self, bus, tipo, dias):
+        return DocumentoVehiculo.objects.create(
+            bus=bus,
+            tipo=tipo,
+            numero_documento=f'{bus.placa}-{tipo}-{dias}',
+            fecha_emision=self.hoy - timedelta(days=365),
+            fecha_vencimiento=self.hoy + timedelta(days=dias)
+        )
+
+    def placas(self, **filtros):
+        return [bus.placa for bus in matriz_cumplimiento(self.hoy, **filtros)]
+
+    def test_celdas_con_ultimo_vencimiento(self):
+        with self.assertNumQueries(1):
+            buses = list(matriz_cumplimiento(self.hoy))
+        celdas = {celda['tipo']: celda for celda in celdas_cumplimiento(buses[0], self.hoy)}
+        self.assertEqual(celdas['soat']['fecha'], self.hoy + timedelta(days=300))
+        self.assertEqual(celdas['soat']['estado'], 'vigente')
+        self.assertEqual(celdas['matricula']['estado'], 'por_vencer')
+        self.assertIsNone(celdas['revision']['estado'])
+
+    def test_filtros(self):
+        self.assertEqual(self.placas(dias=30), ['BUS0'])
+        self.assertEqual(self.placas(tipo='soat', dias=30), [])
+        self.assertEqual(self.placas(tipo='soat', incumplimiento=True), ['BUS1', 'BUS2'])
+
+    def test_vista_cacheada(self):
+        url = reverse('flota:cumplimiento_documentos')
+        response = self.client.get(url, {'dias': 30})
+        self.assertContains(response, 'BUS0')
+        self.assertNotContains(response, 'BUS1')
+        with self.assertNumQueries(0):
+            self.client.get(url, {'dias': 30})
+
+
+class DescargaDocumentoTestCase(TestCase):
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media)
+        ajustes = override_settings(MEDIA_ROOT=self.media)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+
+        self.bus = Bus.objects.create(
+            placa='ABC123',
+            modelo='Volvo',
+            año_fabricacion=2020,
+            capacidad_pasajeros=40,
+            numero_chasis='CH1',
+            fecha_adquisicion='2020-01-01'
+        )
+        self.contenido = bytes(range(256)) * 40
+        self.documento = self.crear_documento('póliza.pdf')
+
+    def crear_documento(self, nombre):
+        return DocumentoVehiculo.objects.create(
+            bus=self.bus,
+            tipo='seguro',
+            numero_documento=nombre,
+            fecha_emision=date(2025, 1, 1),
+            fecha_vencimiento=date(2030, 1, 1),
+            archivo=SimpleUploadedFile(nombre, self.contenido)
+        )
+
+    def url(self):
+        return reverse('flota:documento_descargar', args=[self.documento.pk])
+
+    def test_archivos_identicos_se_guardan_una_vez(self):
+        otro = self.crear_documento('copia.pdf')
+        self.assertEqual(otro.archivo.name, self.documento.archivo.name)
+        self.assertRegex(self.documento.archivo.name, r'^documentos/[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}\.pdf$')
+        self.assertEqual(otro.nombre_archivo, 'copia.pdf')
+        archivos = [nombre for _, _, nombres in os.walk(self.media) for nombre in nombres]
+        self.assertEqual(len(archivos), 1)
+
+    def test_descarga_completa(self):
+        response = self.client.get(self.url())
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.contenido)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertIn("filename*=utf-8''p%C3%B3liza.pdf", response['Content-Disposition'])
+
+    def test_nombre_con_comillas(self):
+        DocumentoVehiculo.objects.filter(pk=self.documento.pk).update(nombre_archivo='a"b\\c.pdf')
+        response = self.client.get(self.url())
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="a\\"b\\\\c.pdf"')
+
+    def test_rangos(self):
+        response = self.client.get(self.url(), HTTP_RANGE='bytes=100-199')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 100-199/{len(self.contenido)}')
+        self.assertEqual(b''.join(response.streaming_content), self.contenido[100:200])
+
+        response = self.client.get(self.url(), HTTP_RANGE='bytes=-10')
+        self.assertEqual(b''.join(response.streaming_content), self.contenido[-10:])
+
+        response = self.client.get(self.url(), HTTP_RANGE=f'bytes={len(self.contenido)}-')
+        self.assertEqual(response.status_code, 416)
+
+        # If-Range con otra versión: se envía el archivo completo
+        response = self.client.get(self.url(), HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"otro"')
+        self.assertEqual(response.status_code, 200)
+
+    def test_peticion_condicional(self):
+        etag = self.client.get(self.url())['ETag']
+        response = self.client.get(self.url(), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    @override_settings(DOCUMENTOS_ENVIO='x-accel-redirect', DOCUMENTOS_ACCEL_PREFIJO='/protegido/')
+    def test_delegar_envio(self):
+        response = self.client.get(self.url())
+        self.assertEqual(response['X-Accel-Redirect'], '/protegido/' + self.documento.archivo.name)
+        self.assertEqual(response.content, b'')
+
+    def test_migrar_archivos_antiguos(self):
+        os.makedirs(os.path.join(self.media, 'documentos_vehiculos'))
+        for nombre in ('manual.pptx', 'manual_WX55JSo.pptx'):
+            with open(os.path.join(self.media, 'documentos_vehiculos', nombre), 'wb') as archivo:
+                archivo.write(b'igual')
+        antiguo = DocumentoVehiculo.objects.filter(pk=self.documento.pk)
+        antiguo.update(archivo='documentos_vehiculos/manual.pptx', nombre_archivo='')
+        copia = self.crear_documento('otro.pdf')
+        DocumentoVehiculo.objects.filter(pk=copia.pk).update(
+            archivo='documentos_vehiculos/manual_WX55JSo.pptx', nombre_archivo=''
+        )
+
+        call_command('migrar_archivos_documentos', borrar=True, stdout=StringIO())
+        nombres = set(DocumentoVehiculo.objects.values_list('archivo', flat=True))
+        self.assertEqual(len(nombres), 1)
+        self.assertFalse(os.path.exists(os.path.join(self.media, 'documentos_vehiculos', 'manual.pptx')))
+        self.assertEqual(DocumentoVehiculo.objects.get(pk=copia.pk).nombre_archivo, 'manual_WX55JSo.pptx')
+
+
+class SubidaPorPartesTestCase(TestCase):
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media)
+        ajustes = override_settings(MEDIA_ROOT=self.media)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+
+        self.bus = Bus.objects.create(
+            placa='ABC123',
+            modelo='Volvo',
+            año_fabricacion=2020,
+            capacidad_pasajeros=40,
+            numero_chasis='CH1',
+            fecha_adquisicion='2020-01-01'
+        )
+        self.contenido = os.urandom(300 * 1024)
+
+    def crear_subida(self, **datos):
+        datos = dict({'nombre': 'revision.mp4', 'tamano': len(self.contenido)}, **datos)
+        response = self.client.post(reverse('flota:subida_crear'), json.dumps(datos), content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        return response.json()['url']
+
+    def enviar(self, url, offset, fin):
+        return self.client.generic(
+            'PATCH', url, self.contenido[offset:fin],
+            content_type='application/offset+octet-stream', HTTP_UPLOAD_OFFSET=str(offset),
+        )
+
+    def test_subida_reanudable_adjunta_el_archivo(self):
+        documento = DocumentoVehiculo.objects.create(
+            bus=self.bus,
+            tipo='revision',
+            numero_documento='RT-1',
+            fecha_emision=date(2025, 1, 1),
+            fecha_vencimiento=date(2030, 1, 1)
+        )
+        url = self.crear_subida(documento=documento.pk)
+        self.assertEqual(self.enviar(url, 0, 100 * 1024).json()['offset'], 100 * 1024)
+
+        # Una parte repetida o fuera de orden se rechaza con el offset correcto
+        response = self.enviar(url, 0, 100 * 1024)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response['Upload-Offset'], str(100 * 1024))
+
+        offset = self.client.get(url).json()['offset']
+        response = self.enviar(url, offset, len(self.contenido))
+        self.assertTrue(response.json()['completa'])
+
+        documento.refresh_from_db()
+        self.assertEqual(documento.nombre_archivo, 'revision.mp4')
+        with documento.archivo.open('rb') as archivo:
+            self.assertEqual(archivo.read(), self.contenido)
+        self.assertEqual(os.listdir(os.path.join(self.media, 'subidas')), [])
+
+    def test_parte_excede_tamano(self):
+        url = self.crear_subida(tamano=10)
+        self.assertEqual(self.enviar(url, 0, 20).status_code, 400)
+
+    def test_parte_reservada_por_otra_peticion(self):
+        url = self.crear_subida()
+        subida = SubidaArchivo.objects.get()
+        SubidaArchivo.objects.filter(pk=subida.pk).update(
+            escritor=uuid.uuid4(), escritura_hasta=timezone.now() + timedelta(minutes=1)
+        )
+        response = self.enviar(url, 0, 1024)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response['Upload-Offset'], '0')
+
+        # Una reserva vencida (el proceso murió) no bloquea la subida
+        SubidaArchivo.objects.filter(pk=subida.pk).update(escritura_hasta=timezone.now() - timedelta(seconds=1))
+        response = self.enviar(url, 0, 1024)
+        self.assertEqual(response.json()['offset'], 1024)
+        subida.refresh_from_db()
+        self.assertIsNone(subida.escritor)
+
+    def test_reserva_perdida_no_confirma_la_parte(self):
+        self.crear_subida()
+        subida = SubidaArchivo.objects.get()
+
+        class Origen:
+            def __init__(self, datos):
+                self.datos = datos
+
+            def read(self, n):
+                # Otra petición toma la subida mientras llega el cuerpo
+                SubidaArchivo.objects.filter(pk=subida.pk).update(escritor=uuid.uuid4())
+                bloque, self.datos = self.datos[:n], self.datos[n:]
+                return bloque
+
+        with self.assertRaises(OffsetIncorrecto):
+            recibir_parte(subida.pk, 0, Origen(self.contenido[:1024]), 1024)
+        subida.refresh_from_db()
+        self.assertEqual(subida.recibido, 0)
+
+    def test_formulario_con_subida(self):
+        url = self.crear_subida()
+        self.enviar(url, 0, len(self.contenido))
+        subida = SubidaArchivo.objects.get()
+        response = self.client.post(reverse('flota:documento_crear', args=[self.bus.pk]), {
+            'tipo': 'revision',
+            'numero_documento': 'RT-2',
+            'fecha_emision': '2025-01-01',
+            'fecha_vencimiento': '2030-01-01',
+            'subida': str(subida.pk),
+        })
+        self.assertEqual(response.status_code, 302)
+        documento = DocumentoVehiculo.objects.get(numero_documento='RT-2')
+        self.assertEqual(documento.archivo.size, len(self.contenido))
+
+    def test_limpiar_subidas_vencidas(self):
+        abandonada = self.crear_subida()
+        self.enviar(abandonada, 0, 100 * 1024)
+        activa = self.crear_subida(nombre='otra.mp4')
+        directorio = os.path.join(self.media, 'subidas')
+        huerfano = os.path.join(directorio, 'ffffffff-ffff-4fff-bfff-ffffffffffff.part')
+        open(huerfano, 'wb').close()
+        hace_dos_dias = timezone.now() - timedelta(days=2)
+        os.utime(huerfano, (hace_dos_dias.timestamp(), hace_dos_dias.timestamp()))
+        SubidaArchivo.objects.filter(nombre_archivo='revision.mp4').update(actualizado_en=hace_dos_dias)
+
+        self.assertEqual(limpiar_vencidas(), {'subidas': 1, 'archivos': 2})
+        self.assertEqual(list(SubidaArchivo.objects.values_list('nombre_archivo', flat=True)), ['otra.mp4'])
+        self.assertEqual(len(os.listdir(directorio)), 1)
+        # Una parte que llega después de la limpieza recibe 404
+        self.assertEqual(self.enviar(abandonada, 100 * 1024, 200 * 1024).status_code, 404)
+        self.assertEqual(self.enviar(activa, 0, 100).status_code, 200)
+        self.assertEqual(limpiar_vencidas(), {'subidas': 0, 'archivos': 0})
+
+
+class EscanerQueFalla:
+    fallos = 0
+
+    def escanear(self, archivo):
+        EscanerQueFalla.fallos += 1
+        if EscanerQueFalla.fallos < 3:
+            raise ConnectionError('servicio no disponible')
+        return True, ''
+
+
+@override_settings(DOCUMENTOS_PROCESAMIENTO_SINCRONO=True, DOCUMENTOS_PROCESAMIENTO_ESPERA=0)
+class ProcesamientoDocumentoTestCase(TestCase):
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media)
+        ajustes = override_settings(MEDIA_ROOT=self.media)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+
+        self.bus = Bus.objects.create(
+            placa='ABC123',
+            modelo='Volvo',
+            año_fabricacion=2020,
+            capacidad_pasajeros=40,
+            numero_chasis='CH1',
+            fecha_adquisicion='2020-01-01'
+        )
+
+    def crear_documento(self, nombre, contenido):
+        with self.captureOnCommitCallbacks(execute=True):
+            documento = DocumentoVehiculo.objects.create(
+                bus=self.bus,
+                tipo='revision',
+                numero_documento=nombre,
+                fecha_emision=date(2025, 1, 1),
+                fecha_vencimiento=date(2030, 1, 1),
+                archivo=SimpleUploadedFile(nombre, contenido)
+            )
+        documento.refresh_from_db()
+        return documento
+
+    def test_pdf(self):
+        contenido = (
+            b'%PDF-1.4\n1 0 obj << /Type /Pages /Count 2 >> endobj\n'
+            + b'2 0 obj << /Type /Page >> endobj\n' + b' ' * 70000
+            + b'3 0 obj << /Type/Page >> endobj\n%%EOF'
+        )
+        documento = self.crear_documento('informe.bin', contenido)
+        self.assertEqual(documento.procesamiento_estado, 'completado')
+        self.assertEqual(documento.tipo_mime, 'application/pdf')
+        self.assertEqual(documento.paginas, 2)
+        self.assertEqual(len(documento.sha256), 64)
+        self.assertEqual(set(documento.procesamiento), {'checksum', 'mime', 'paginas', 'texto', 'escaneo'})
+        self.assertIn('duracion_ms', documento.procesamiento['checksum'])
+
+    def test_texto_y_reprocesamiento_al_cambiar_archivo(self):
+        documento = self.crear_documento('nota.txt', 'Revisión técnica aprobada'.encode())
+        self.assertEqual(documento.texto, 'Revisión técnica aprobada')
+
+        # Guardar sin cambiar el archivo no vuelve a procesarlo
+        with mock.patch('flota.models.encolar_procesamiento') as encolar:
+            documento.observaciones = 'Sin cambios en el archivo'
+            documento.save()
+        encolar.assert_not_called()
+
+        with mock.patch('flota.models.encolar_procesamiento') as encolar:
+            documento.archivo = SimpleUploadedFile('otra.txt', b'Nueva version')
+            documento.save()
+        encolar.assert_called_once_with(documento.pk)
+        documento.refresh_from_db()
+        self.assertEqual(documento.procesamiento_estado, 'pendiente')
+
+    def test_escaner_rechaza(self):
+        contenido = b'X5O!P%@AP[4\\PZX54(P^)7CC)7}$' + b'EICAR-STANDARD-ANTIVIRUS-TEST-FILE!$H+H*'
+        documento = self.crear_documento('virus.com', contenido)
+        self.assertEqual(documento.procesamiento_estado, 'rechazado')
+        self.assertEqual(documento.procesamiento['escaneo']['estado'], 'rechazado')
+
+    @override_settings(DOCUMENTOS_ESCANER='flota.tests.EscanerQueFalla')
+    def test_reintentos(self):
+        EscanerQueFalla.fallos = 0
+        documento = self.crear_documento('nota.txt', b'hola')
+        self.assertEqual(documento.procesamiento_estado, 'completado')
+        self.assertEqual(documento.procesamiento['escaneo']['intentos'], 3)
+
+        EscanerQueFalla.fallos = -10
+        procesar_documento(documento.pk)
+        documento.refresh_from_db()
+        self.assertEqual(documento.procesamiento_estado, 'error')
+        self.assertIn('ConnectionError', documento.procesamiento['escaneo']['error'])
+
+    @override_settings(DOCUMENTOS_PROCESAMIENTO_COLA=True)
+    def test_procesamiento_por_cola_de_tareas(self):
+        documento = self.crear_documento('nota.txt', b'en cola')
+        self.assertEqual(documento.procesamiento_estado, 'pendiente')
+        tarea = Tarea.objects.get(funcion='flota.procesamiento.procesar_documento')
+        self.assertEqual(tarea.parametros, {'documento_id': documento.pk})
+
+        self.assertEqual(ejecutar(tomar_tareas('prueba')[0]), 'completada')
+        documento.refresh_from_db()
+        self.assertEqual((documento.procesamiento_estado, documento.texto), ('completado', 'en cola'))
+
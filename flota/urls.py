@@ -12,12 +12,20 @@ urlpatterns = [
     path('buses/<int:pk>/eliminar/', views.BusDeleteView.as_view(), name='bus_delete'),
     
     # Mantenimientos - Del código de patentes
+    path('buses/<int:pk>/mantenimientos/', views.MantenimientoListView.as_view(), name='mantenimiento_list'),
     path('buses/<int:bus_id>/mantenimiento/crear/', views.MantenimientoCreateView.as_view(), name='mantenimiento_crear'),
     path('mantenimiento/<int:pk>/editar/', views.MantenimientoUpdateView.as_view(), name='mantenimiento_editar'),
     path('mantenimiento/<int:pk>/eliminar/', views.MantenimientoDeleteView.as_view(), name='mantenimiento_eliminar'),
     
+    # Odómetro
+    path('buses/<int:bus_id>/odometro/registrar/', views.LecturaOdometroCreateView.as_view(), name='lectura_crear'),
+
     # Documentos Vehiculares - Del código de patentes
     path('buses/<int:bus_id>/documento/crear/', views.DocumentoVehiculoCreateView.as_view(), name='documento_crear'),
     path('documento/<int:pk>/editar/', views.DocumentoVehiculoUpdateView.as_view(), name='documento_editar'),
     path('documento/<int:pk>/eliminar/', views.DocumentoVehiculoDeleteView.as_view(), name='documento_eliminar'),
+    path('documento/<int:pk>/descargar/', views.descargar_documento, name='documento_descargar'),
+    path('subidas/', views.crear_subida, name='subida_crear'),
+    path('subidas/<uuid:pk>/', views.subida_detalle, name='subida_detalle'),
+    path('documentos/cumplimiento/', views.CumplimientoDocumentosView.as_view(), name='cumplimiento_documentos'),
 ]
\ No newline at end of file
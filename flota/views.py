@@ -1,35 +1,66 @@
 from django.shortcuts import render, get_object_or_404, redirect
 from django.views.generic import ListView, DetailView, CreateView, UpdateView, DeleteView, View
-from django.urls import reverse_lazy
+from django.urls import reverse, reverse_lazy
 from django.contrib import messages
 from django.utils import timezone
-from django.http import HttpResponseRedirect
-from .models import Bus, DocumentoVehiculo, Mantenimiento
-from .forms import BusForm, MantenimientoForm, DocumentoVehiculoForm
+from datetime import timedelta
+import json
+from django.http import Http404, HttpResponse, HttpResponseRedirect, JsonResponse
+from django.views.decorators.http import condition, require_http_methods, require_safe
+from django.db.models import Exists, Max, OuterRef, Q
+from .models import Bus, DocumentoVehiculo, Mantenimiento, PronosticoMantenimiento, SubidaArchivo
+from .forms import BusForm, MantenimientoForm, DocumentoVehiculoForm, CumplimientoFiltroForm, LecturaOdometroForm
+from .descargas import etag_archivo, respuesta_descarga
+from . import subidas
+from costos.resumen import claves_de_viajes, refrescar
+from core.cache import CacheModelosMixin, invalidar_modelos
+from viajes.models import Viaje
 
 # Vistas de Buses (Proyecto Principal)
-class BusListView(ListView):
+class BusListView(CacheModelosMixin, ListView):
     model = Bus
+    modelos_cache = (Bus, PronosticoMantenimiento)
     template_name = 'flota/bus_list.html'
     context_object_name = 'buses'
     paginate_by = 20
 
+    # ?orden=km / -km: se ordena por el kilometraje guardado en el bus
+    ORDENES = {
+        'km': ('kilometraje_actual', 'placa'),
+        '-km': ('-kilometraje_actual', 'placa'),
+    }
+
     def get_queryset(self):
-        return Bus.objects.all().order_by('-creado_en')
+        orden = self.ORDENES.get(self.request.GET.get('orden'), ('-creado_en',))
+        return Bus.objects.select_related('pronostico').order_by(*orden)
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['orden'] = self.request.GET.get('orden', '')
+        return context
 
 
-class BusDetailView(DetailView):
+class BusDetailView(CacheModelosMixin, DetailView):
     model = Bus
+    modelos_cache = (Bus, Mantenimiento, DocumentoVehiculo, PronosticoMantenimiento)
     template_name = 'flota/bus_detail.html'
     context_object_name = 'bus'
 
+    mantenimientos_recientes = 5
+
+    def get_queryset(self):
+        # Las estadísticas llegan en la misma consulta que el bus
+        return Bus.objects.con_estadisticas(timezone.localdate()).select_related('pronostico')
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         bus = self.object
-        # Agregar mantenimientos y documentos al contexto
-        context['mantenimientos'] = bus.mantenimientos.all().order_by('-fecha_mantenimiento')
+        # Solo los últimos mantenimientos; el historial completo va paginado
+        context['mantenimientos'] = bus.mantenimientos.order_by('-fecha_mantenimiento', '-id')[:self.mantenimientos_recientes]
+        context['hay_mas_mantenimientos'] = bus.num_mantenimientos > self.mantenimientos_recientes
         context['documentos'] = bus.documentos.all().order_by('-fecha_vencimiento')
-        context['today'] = timezone.now().date()
+        context['today'] = timezone.localdate()
+        context['anios_servicio'] = (context['today'] - bus.fecha_adquisicion).days // 365
         return context
 
 
@@ -84,6 +115,8 @@ class BusDeleteView(View):
     def post(self, request, pk):
         bus = get_object_or_404(Bus, pk=pk)
         viajes = bus.viajes.all()
+        # Grupos del resumen de costos que se mueven de bus (update() no emite señales)
+        claves = claves_de_viajes(viajes)
         
         action = request.POST.get('action')
         
@@ -97,6 +130,7 @@ class BusDeleteView(View):
             nuevo_bus = get_object_or_404(Bus, pk=nuevo_bus_id)
             viajes.update(bus=nuevo_bus)
             bus.delete()
+            refrescar((mes, nuevo_bus.pk) + tuple(resto) for mes, _, *resto in claves)
             messages.success(
                 request,
                 f'Bus {bus.placa} eliminado. Sus {viajes.count()} viaje(s) han sido asignados a {nuevo_bus.placa}.'
@@ -111,7 +145,10 @@ class BusDeleteView(View):
                 f'Bus {bus.placa} eliminado. Sus {viajes.count()} viaje(s) quedan sin bus asignado.'
             )
             bus.delete()
-        
+            refrescar((mes, None) + tuple(resto) for mes, _, *resto in claves)
+
+        # Los viajes se reasignan con UPDATE (o SET_NULL), que no emite señales
+        invalidar_modelos(Viaje)
         return redirect('flota:bus_list')
 
 
@@ -161,6 +198,59 @@ class MantenimientoDeleteView(DeleteView):
         return reverse_lazy('flota:bus_detail', kwargs={'pk': self.object.bus.pk})
 
 
+class MantenimientoListView(CacheModelosMixin, ListView):
+    """
+    Historial completo de mantenimientos de un bus, paginado.
+    """
+    model = Mantenimiento
+    modelos_cache = (Bus, Mantenimiento)
+    template_name = 'flota/mantenimiento_list.html'
+    context_object_name = 'mantenimientos'
+    paginate_by = 25
+
+    def get_queryset(self):
+        self.bus = get_object_or_404(Bus, pk=self.kwargs['pk'])
+        return self.bus.mantenimientos.order_by('-fecha_mantenimiento', '-id')
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['bus'] = self.bus
+        return context
+
+
+class LecturaOdometroCreateView(CreateView):
+    """
+    Registro manual de una lectura del odómetro.
+    """
+    form_class = LecturaOdometroForm
+    template_name = 'flota/lectura_form.html'
+
+    def dispatch(self, request, *args, **kwargs):
+        self.bus = get_object_or_404(Bus, pk=self.kwargs['bus_id'])
+        return super().dispatch(request, *args, **kwargs)
+
+    def get_form_kwargs(self):
+        kwargs = super().get_form_kwargs()
+        kwargs['bus'] = self.bus
+        return kwargs
+
+    def get_initial(self):
+        return {'fecha': timezone.localtime().strftime('%Y-%m-%dT%H:%M'), 'kilometraje': self.bus.kilometraje_actual}
+
+    def form_valid(self, form):
+        messages.success(self.request, 'Lectura de odómetro registrada correctamente.')
+        return super().form_valid(form)
+
+    def get_success_url(self):
+        return reverse('flota:bus_detail', kwargs={'pk': self.bus.pk})
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['bus'] = self.bus
+        context['lecturas'] = self.bus.lecturas_odometro.order_by('-fecha', '-id')[:10]
+        return context
+
+
 # Vistas de Documentos (De Patentes)
 class DocumentoVehiculoCreateView(CreateView):
     model = DocumentoVehiculo
@@ -204,4 +294,197 @@ class DocumentoVehiculoDeleteView(DeleteView):
     
     def get_success_url(self):
         messages.success(self.request, 'Documento eliminado correctamente.')
-        return reverse_lazy('flota:bus_detail', kwargs={'pk': self.object.bus.pk})
\ No newline at end of file
+        return reverse_lazy('flota:bus_detail', kwargs={'pk': self.object.bus.pk})
+
+
+def _documento_descarga(request, pk):
+    """
+    Documento con archivo existente, leído una sola vez por petición (lo usan
+    tanto las funciones de condition como la vista).
+    """
+    if getattr(request, '_documento_descarga', None) is None:
+        documento = get_object_or_404(
+            DocumentoVehiculo.objects.only('id', 'archivo', 'nombre_archivo'), pk=pk
+        )
+        if not documento.archivo or not documento.archivo.storage.exists(documento.archivo.name):
+            raise Http404('El documento no tiene archivo.')
+        request._documento_descarga = documento
+    return request._documento_descarga
+
+
+def _etag_documento(request, pk):
+    return etag_archivo(_documento_descarga(request, pk).archivo)
+
+
+def _modificacion_documento(request, pk):
+    archivo = _documento_descarga(request, pk).archivo
+    return archivo.storage.get_modified_time(archivo.name)
+
+
+@require_safe
+@condition(etag_func=_etag_documento, last_modified_func=_modificacion_documento)
+def descargar_documento(request, pk):
+    """
+    Descarga el archivo de un documento: por bloques y con soporte de rangos
+    (reanudar descargas, visores de PDF), o mediante X-Sendfile /
+    X-Accel-Redirect según DOCUMENTOS_ENVIO.
+    """
+    documento = _documento_descarga(request, pk)
+    return respuesta_descarga(
+        request, documento.archivo, documento.nombre_descarga,
+        adjunto=request.GET.get('ver') != '1',
+    )
+
+
+# Subidas por partes (protocolo en subidas.py)
+def _subida_a_dict(subida):
+    return {
+        'id': str(subida.pk),
+        'nombre': subida.nombre_archivo,
+        'tamano': subida.tamano,
+        'offset': subida.recibido,
+        'completa': subida.completa,
+        'documento': subida.documento_id,
+        'url': reverse('flota:subida_detalle', args=[subida.pk]),
+    }
+
+
+@require_http_methods(['POST'])
+def crear_subida(request):
+    try:
+        datos = json.loads(request.body or b'{}')
+        subida = subidas.iniciar_subida(
+            datos.get('nombre'), datos.get('tamano'),
+            subidas.documento_para_subida(datos.get('documento')),
+        )
+    except ValueError:
+        return JsonResponse({'error': 'JSON inválido.'}, status=400)
+    except subidas.SubidaError as e:
+        return JsonResponse({'error': str(e)}, status=e.status)
+    respuesta = JsonResponse(_subida_a_dict(subida), status=201)
+    respuesta['Location'] = reverse('flota:subida_detalle', args=[subida.pk])
+    return respuesta
+
+
+@require_http_methods(['GET', 'HEAD', 'PATCH', 'DELETE'])
+def subida_detalle(request, pk):
+    subida = get_object_or_404(SubidaArchivo, pk=pk)
+    if request.method == 'DELETE':
+        subidas.cancelar(subida)
+        return HttpResponse(status=204)
+    if request.method == 'PATCH':
+        try:
+            offset = int(request.headers.get('Upload-Offset', ''))
+            largo = int(request.headers.get('Content-Length', ''))
+        except ValueError:
+            return JsonResponse({'error': 'Faltan Upload-Offset o Content-Length.'}, status=400)
+        try:
+            # El cuerpo se lee por bloques desde el request, sin request.body
+            subida = subidas.recibir_parte(subida.pk, offset, request, largo)
+        except subidas.SubidaNoEncontrada as e:
+            return JsonResponse({'error': str(e)}, status=e.status)
+        except subidas.SubidaError as e:
+            subida.refresh_from_db()
+            respuesta = JsonResponse(dict(_subida_a_dict(subida), error=str(e)), status=e.status)
+            respuesta['Upload-Offset'] = str(subida.recibido)
+            return respuesta
+    respuesta = JsonResponse(_subida_a_dict(subida))
+    respuesta['Upload-Offset'] = str(subida.recibido)
+    respuesta['Cache-Control'] = 'no-store'
+    return respuesta
+
+
+# Cumplimiento documental
+def _campo_vencimiento(tipo):
+    return f'vence_{tipo}'
+
+
+def matriz_cumplimiento(hoy, tipo=None, dias=None, incumplimiento=False):
+    """
+    Buses con el último vencimiento de cada tipo de documento como columnas
+    (vence_<tipo>), calculado en una sola consulta agrupada por bus.
+
+    - dias: solo buses cuyo último documento (del tipo indicado o de
+      cualquiera) vence entre hoy y hoy + dias. La preselección usa el índice
+      (tipo, fecha_vencimiento) de DocumentoVehiculo.
+    - incumplimiento: solo buses con el documento vencido o sin registrar.
+    """
+    tipos = [tipo] if tipo else [clave for clave, _ in DocumentoVehiculo.TIPO_DOCUMENTO]
+    queryset = Bus.objects.only('id', 'placa', 'modelo', 'estado').annotate(**{
+        _campo_vencimiento(clave): Max(
+            'documentos__fecha_vencimiento', filter=Q(documentos__tipo=clave)
+        )
+        for clave, _ in DocumentoVehiculo.TIPO_DOCUMENTO
+    })
+
+    if dias is not None:
+        limite = hoy + timedelta(days=dias)
+        queryset = queryset.filter(Exists(
+            DocumentoVehiculo.objects.filter(
+                bus=OuterRef('pk'),
+                tipo__in=tipos,
+                fecha_vencimiento__gte=hoy,
+                fecha_vencimiento__lte=limite,
+            )
+        ))
+        en_rango = Q()
+        for clave in tipos:
+            campo = _campo_vencimiento(clave)
+            en_rango |= Q(**{f'{campo}__gte': hoy, f'{campo}__lte': limite})
+        queryset = queryset.filter(en_rango)
+
+    if incumplimiento:
+        faltante = Q()
+        for clave in tipos:
+            campo = _campo_vencimiento(clave)
+            faltante |= Q(**{f'{campo}__isnull': True}) | Q(**{f'{campo}__lt': hoy})
+        queryset = queryset.filter(faltante)
+
+    return queryset.order_by('placa')
+
+
+def celdas_cumplimiento(bus, hoy):
+    """
+    Celdas de una fila de la matriz: último vencimiento y estado por tipo.
+    El estado se calcula con la fecha, no con el campo guardado.
+    """
+    celdas = []
+    for tipo, nombre in DocumentoVehiculo.TIPO_DOCUMENTO:
+        fecha = getattr(bus, _campo_vencimiento(tipo))
+        estado = DocumentoVehiculo.calcular_estado(fecha, hoy) if fecha else None
+        celdas.append({
+            'tipo': tipo,
+            'fecha': fecha,
+            'estado': estado,
+            'dias': (fecha - hoy).days if fecha else None,
+        })
+    return celdas
+
+
+class CumplimientoDocumentosView(CacheModelosMixin, ListView):
+    """
+    Matriz bus x tipo de documento con el último vencimiento de cada celda.
+    """
+    template_name = 'flota/cumplimiento_documentos.html'
+    context_object_name = 'buses'
+    paginate_by = 50
+    modelos_cache = (Bus, DocumentoVehiculo)
+
+    def get_queryset(self):
+        self.hoy = timezone.localdate()
+        self.filtro_form = CumplimientoFiltroForm(self.request.GET or None)
+        filtros = self.filtro_form.cleaned_data if self.filtro_form.is_valid() else {}
+        return matriz_cumplimiento(
+            self.hoy,
+            tipo=filtros.get('tipo') or None,
+            dias=filtros.get('dias'),
+            incumplimiento=filtros.get('incumplimiento', False),
+        )
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['filtro_form'] = self.filtro_form
+        context['tipos'] = DocumentoVehiculo.TIPO_DOCUMENTO
+        context['filas'] = [(bus, celdas_cumplimiento(bus, self.hoy)) for bus in context['buses']]
+        return context
+
@@ -128,7 +128,109 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+# Archivos subidos. Los documentos existentes están en BASE_DIR/documentos_vehiculos/
+MEDIA_ROOT = os.environ.get('MEDIA_ROOT', str(BASE_DIR))
+MEDIA_URL = 'media/'
+
+# Descarga de documentos: None (Django transmite el archivo), 'x-sendfile'
+# (Apache/lighttpd) o 'x-accel-redirect' (nginx, con una location internal
+# que apunte a MEDIA_ROOT en DOCUMENTOS_ACCEL_PREFIJO).
+DOCUMENTOS_ENVIO = os.environ.get('DOCUMENTOS_ENVIO') or None
+DOCUMENTOS_ACCEL_PREFIJO = os.environ.get('DOCUMENTOS_ACCEL_PREFIJO', '/protegido/')
+
+# Procesamiento de archivos subidos (flota/procesamiento.py)
+DOCUMENTOS_PROCESAMIENTO_HILOS = int(os.environ.get('DOCUMENTOS_PROCESAMIENTO_HILOS', 2))
+DOCUMENTOS_PROCESAMIENTO_REINTENTOS = 3
+DOCUMENTOS_ESCANER = os.environ.get('DOCUMENTOS_ESCANER', 'flota.procesamiento.EscanerLocal')
+# Con DOCUMENTOS_PROCESAMIENTO_COLA=1 lo ejecuta `manage.py worker` (core.tareas)
+DOCUMENTOS_PROCESAMIENTO_COLA = os.environ.get('DOCUMENTOS_PROCESAMIENTO_COLA', '') == '1'
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
-DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
\ No newline at end of file
+DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Caché
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# CACHE_BACKEND elige el motor: 'locmem' (por defecto, un proceso), 'file'
+# (compartida entre procesos del mismo servidor) o 'redis' (entre servidores;
+# CACHE_LOCATION con la URL, p. ej. redis://localhost:6379/1; requiere el
+# paquete redis, ver requirements.txt).
+
+CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'locmem')
+CACHE_BACKENDS = {
+    'locmem': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'sistema_flota',
+    },
+    'file': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get('CACHE_LOCATION', str(BASE_DIR / 'cache')),
+    },
+    'redis': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ.get('CACHE_LOCATION', 'redis://127.0.0.1:6379/1'),
+    },
+}
+# Las páginas y el panel se cachean con claves versionadas por modelo (ver
+# core/cache.py). La versión se sube en el proceso que edita, así que con
+# 'locmem' los demás procesos servirían páginas viejas: solo se cachean con
+# una caché compartida.
+CACHES_COMPARTIDAS = ('file', 'redis')
+CACHES = {
+    'default': dict(CACHE_BACKENDS[CACHE_BACKEND], KEY_PREFIX='flota'),
+    'versionada': (
+        dict(CACHE_BACKENDS[CACHE_BACKEND], KEY_PREFIX='flota')
+        if CACHE_BACKEND in CACHES_COMPARTIDAS
+        else {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}
+    ),
+}
+# Duración máxima de una página cacheada; las ediciones la invalidan antes
+CACHE_PAGINAS_SEGUNDOS = int(os.environ.get('CACHE_PAGINAS_SEGUNDOS', 60 * 15))
+
+# Geocodificación del formulario de lugares (core/geocodificacion.py). El
+# intervalo es el mínimo entre consultas al servicio externo, compartido por
+# todos los procesos que usan la misma base de datos.
+GEOCODIFICACION_PROVEEDOR = os.environ.get('GEOCODIFICACION_PROVEEDOR', 'core.geocodificacion.Nominatim')
+GEOCODIFICACION_USER_AGENT = os.environ.get('GEOCODIFICACION_USER_AGENT', 'sistema-flota/1.0')
+GEOCODIFICACION_PAIS = 'ec'
+GEOCODIFICACION_INTERVALO = 1
+GEOCODIFICACION_ESPERA_MAXIMA = 5
+GEOCODIFICACION_DIAS = 30
+
+# Matriz de distancias entre lugares (core/matriz.py): con True guarda todos
+# los pares con coordenadas y no solo los usados en viajes
+MATRIZ_DISTANCIAS_TODOS = False
+
+# Duración máxima de un viaje: acota la búsqueda de conflictos de horario
+# (viajes/conflictos.py) y la valida el formulario de viajes
+VIAJE_DURACION_MAXIMA_HORAS = 72
+
+# Cola de tareas en segundo plano (core/tareas.py, `manage.py worker`)
+TAREAS_BLOQUEO_SEGUNDOS = 10 * 60
+TAREAS_ESPERA_REINTENTO = 30
+TAREAS_PERIODICAS = {
+    'actualizar_estado_documentos': {
+        'funcion': 'flota.tareas.actualizar_estados_documentos',
+        'intervalo': 60 * 60,
+    },
+    'reconciliar_pasajeros_confirmados': {
+        'funcion': 'viajes.reservas.reconciliar_pasajeros_confirmados',
+        'intervalo': 60 * 60,
+    },
+    'pronosticar_mantenimientos': {
+        'funcion': 'flota.tareas.pronosticar_mantenimientos',
+        'intervalo': 24 * 60 * 60,
+        'prioridad': -5,
+    },
+    'reconstruir_resumen_costos': {
+        'funcion': 'costos.resumen.reconstruir',
+        'intervalo': 24 * 60 * 60,
+        'prioridad': -5,
+    },
+    'limpiar_subidas_vencidas': {
+        'funcion': 'flota.subidas.limpiar_vencidas',
+        'intervalo': 60 * 60,
+    },
+}
+
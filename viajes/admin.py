@@ -1,9 +1,13 @@
 from django.contrib import admin
 from .models import Viaje
+from .views import ViajeForm
 
 
 @admin.register(Viaje)
 class ViajeAdmin(admin.ModelAdmin):
+    # Mismas validaciones que el formulario de la aplicación (fechas y
+    # conflictos de horario del bus y del conductor)
+    form = ViajeForm
     list_display = ('bus', 'conductor', 'lugar_origen', 'lugar_destino', 'fecha_salida', 'estado')
     list_filter = ('estado', 'fecha_salida')
     search_fields = ('bus__placa', 'conductor__apellido', 'lugar_origen__nombre', 'lugar_destino__nombre')
@@ -22,6 +26,9 @@ class ViajeAdmin(admin.ModelAdmin):
             'fields': ('latitud_destino', 'longitud_destino'),
             'classes': ('collapse',)
         }),
+        ('Distancia', {
+            'fields': ('distancia_km',),
+        }),
         ('Fechas', {
             'fields': ('fecha_salida', 'fecha_llegada_estimada', 'fecha_llegada_real')
         }),
@@ -33,4 +40,4 @@ class ViajeAdmin(admin.ModelAdmin):
             'classes': ('collapse',)
         }),
     )
-    readonly_fields = ('creado_en', 'actualizado_en', 'latitud_origen', 'longitud_origen', 'latitud_destino', 'longitud_destino')
+    readonly_fields = ('creado_en', 'actualizado_en', 'pasajeros_confirmados', 'latitud_origen', 'longitud_origen', 'latitud_destino', 'longitud_destino', 'distancia_km')
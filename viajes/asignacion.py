@@ -0,0 +1,345 @@
+"""
+Asignación automática de bus y conductor a los viajes programados.
+
+planificar() arma un plan para los viajes 'programado' que salen en
+[desde, hasta) y aplicar() lo guarda; sin aplicar, el plan es una vista
+previa. Por defecto solo se elige el bus de los viajes que no lo tienen y
+cada uno conserva su conductor (Viaje.conductor es obligatorio), que igual
+tiene que cumplir las restricciones: si está inactivo u ocupado el viaje
+queda sin asignar; con reasignar se eligen bus y conductor para todos los
+programados del período.
+huella_plan() resume los cambios de un plan: la vista previa la envía con el
+formulario y aplicar() solo guarda un plan con la misma huella.
+
+Restricciones:
+- bus con estado 'activo' y capacidad_pasajeros >= pasajeros_confirmados;
+- conductor activo;
+- sin superposición: entre dos viajes del mismo bus o conductor tiene que
+  alcanzar el tiempo de ir en vacío del destino del primero al origen del
+  segundo (a VELOCIDAD_VACIO_KMH) más MARGEN_ENTRE_VIAJES. Los viajes que
+  no se planifican (otros estados, o ya asignados si no se pide reasignar)
+  siguen ocupando a su bus y su conductor.
+
+Los viajes se recorren por orden de salida y cada uno toma el bus y el
+conductor factibles de menor costo: km en vacío * PESO_KM_VACIO + horas de
+espera * PESO_HORA_ESPERA, y para el bus también asientos libres *
+PESO_ASIENTO_LIBRE (los buses grandes quedan para los grupos grandes). La
+espera de un recurso que aún no trabajó se cuenta desde el inicio del
+período, así que se prefiere encadenar viajes antes que sumar buses.
+
+El costo de todos los buses (o conductores) para un viaje se calcula a la
+vez con arreglos de NumPy: 10.000 viajes se planifican en segundos
+(`manage.py benchmark_asignacion` lo mide con datos sintéticos). Las
+distancias en vacío son de haversine entre lugares; sin coordenadas cuentan
+como 0 km.
+"""
+import hashlib
+import math
+from collections import defaultdict, namedtuple
+from datetime import timedelta
+
+from django.db import transaction
+
+from core.cache import invalidar_modelos
+from core.geo import RADIO_TIERRA_KM
+from core.models import Conductor, Lugar
+from costos.resumen import claves_de_viajes, reconstruir, refrescar
+from flota.models import Bus
+from flota.pronostico import NumpyNoDisponible
+from .conflictos import ESTADOS_SIN_CONFLICTO
+from .models import Viaje
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+VELOCIDAD_VACIO_KMH = 60
+MARGEN_ENTRE_VIAJES = timedelta(minutes=15)
+PESO_KM_VACIO = 1.0
+PESO_HORA_ESPERA = 10.0
+PESO_ASIENTO_LIBRE = 0.05
+# Viajes anteriores al período que fijan dónde está cada bus y conductor
+VENTANA_PREVIA = timedelta(days=1)
+TAMANO_LOTE = 1000
+# Con más grupos del resumen de costos afectados conviene reconstruirlo entero
+MAX_GRUPOS_A_REFRESCAR = 500
+
+Asignacion = namedtuple('Asignacion', 'viaje_id bus_id conductor_id bus_anterior conductor_anterior vacio_km espera_horas')
+Plan = namedtuple('Plan', 'asignaciones sin_asignar km_vacio horas_espera')
+
+
+class PlanDesactualizado(Exception):
+    """
+    Algún viaje del plan cambió desde que se calculó.
+    """
+
+
+def numpy_disponible():
+    return np is not None
+
+
+class _Recursos:
+    """
+    Estado de los buses o conductores durante el recorrido: hasta cuándo
+    están ocupados, dónde quedan y cuál es su próximo viaje fijo.
+    """
+    def __init__(self, ids, desde, sin_lugar):
+        self.ids = np.array(ids, dtype=np.int64)
+        self.posicion = {pk: i for i, pk in enumerate(ids)}
+        self.libre = np.full(len(ids), desde)
+        self.ubicacion = np.full(len(ids), sin_lugar, dtype=np.int64)
+        self.proximo_inicio = np.full(len(ids), np.inf)
+        self.proximo_origen = np.full(len(ids), sin_lugar, dtype=np.int64)
+        self.fijos = defaultdict(list)
+
+    def agregar_fijo(self, pk, salida, llegada, origen, destino):
+        if pk in self.posicion:
+            self.fijos[self.posicion[pk]].append((salida, llegada, origen, destino))
+
+    def preparar(self):
+        for i, viajes in self.fijos.items():
+            viajes.sort(reverse=True)
+            self._siguiente_fijo(i)
+
+    def _siguiente_fijo(self, i):
+        viajes = self.fijos[i]
+        if viajes:
+            self.proximo_inicio[i], _, self.proximo_origen[i], _ = viajes[-1]
+        else:
+            self.proximo_inicio[i] = np.inf
+
+    def avanzar(self, i):
+        # El próximo viaje fijo ya salió: el recurso queda donde termina
+        _, llegada, _, destino = self.fijos[i].pop()
+        self.libre[i] = max(self.libre[i], llegada)
+        self.ubicacion[i] = destino
+        self._siguiente_fijo(i)
+
+    def ocupar(self, i, llegada, destino):
+        self.libre[i] = llegada
+        self.ubicacion[i] = destino
+
+
+def _haversine(lat1, lon1, lat2, lon2):
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return np.nan_to_num(2 * RADIO_TIERRA_KM * np.arcsin(np.minimum(1.0, np.sqrt(a))))
+
+
+class _Planificador:
+    def __init__(self, lat, lon, sin_lugar):
+        self.lat = lat
+        self.lon = lon
+        self.sin_lugar = sin_lugar
+        self.segundos_por_km = 3600 / VELOCIDAD_VACIO_KMH
+        self.margen = MARGEN_ENTRE_VIAJES.total_seconds()
+
+    def _vacio_km(self, desde, hacia):
+        # desde: arreglo de lugares; hacia: un lugar
+        return _haversine(self.lat[desde], self.lon[desde], self.lat[hacia], self.lon[hacia])
+
+    def costos(self, recursos, salida, llegada, origen, destino):
+        """
+        Costo de asignar el viaje a cada recurso (inf si no es factible) y sus
+        km en vacío.
+        """
+        vacio = self._vacio_km(recursos.ubicacion, origen)
+        ubicado = recursos.ubicacion != self.sin_lugar
+        disponible_en = recursos.libre + vacio * self.segundos_por_km + np.where(ubicado, self.margen, 0)
+        # Después del viaje tiene que llegar a tiempo a su próximo viaje fijo
+        hasta_proximo = self._vacio_km(recursos.proximo_origen, destino) * self.segundos_por_km
+        factible = (disponible_en <= salida) & (llegada + hasta_proximo + self.margen <= recursos.proximo_inicio)
+        costo = vacio * PESO_KM_VACIO + (salida - recursos.libre) / 3600 * PESO_HORA_ESPERA
+        return np.where(factible, costo, np.inf), vacio
+
+
+def _ids_activos():
+    buses = list(
+        Bus.objects.filter(estado='activo').order_by('pk').values_list('pk', 'capacidad_pasajeros')
+    )
+    conductores = list(Conductor.objects.filter(activo=True).order_by('pk').values_list('pk', flat=True))
+    return buses, conductores
+
+
+def planificar(desde, hasta, reasignar=False):
+    """
+    Plan de asignación de los viajes programados que salen en [desde, hasta).
+    Devuelve un Plan con una Asignacion por viaje asignado y los viajes sin
+    asignar con el motivo.
+    """
+    if not numpy_disponible():
+        raise NumpyNoDisponible('La asignación automática requiere NumPy (pip install numpy).')
+
+    campos = (
+        'pk', 'bus_id', 'conductor_id', 'fecha_salida', 'fecha_llegada_estimada',
+        'lugar_origen_id', 'lugar_destino_id', 'pasajeros_confirmados',
+    )
+    a_planificar = Viaje.objects.filter(estado='programado', fecha_salida__gte=desde, fecha_salida__lt=hasta)
+    if not reasignar:
+        a_planificar = a_planificar.filter(bus__isnull=True)
+    viajes = sorted(
+        a_planificar.order_by().values_list(*campos),
+        key=lambda fila: (fila[3], fila[0]),
+    )
+    if not viajes:
+        return Plan([], [], 0.0, 0.0)
+    ultima_llegada = max(fila[4] for fila in viajes)
+    fijos = list(
+        Viaje.objects
+        .exclude(estado__in=ESTADOS_SIN_CONFLICTO)
+        .exclude(pk__in=a_planificar.values('pk'))
+        .filter(fecha_llegada_estimada__gt=desde - VENTANA_PREVIA)
+        .filter(fecha_salida__lt=ultima_llegada + VENTANA_PREVIA)
+        .order_by()
+        .values_list(*campos)
+    )
+
+    lugares = {fila[i] for fila in viajes + fijos for i in (5, 6)}
+    coordenadas = Lugar.objects.filter(pk__in=lugares).values_list('pk', 'latitud', 'longitud')
+    indice = {}
+    lat, lon = [], []
+    for pk, latitud, longitud in coordenadas:
+        indice[pk] = len(lat)
+        lat.append(math.nan if latitud is None else math.radians(latitud))
+        lon.append(math.nan if longitud is None else math.radians(longitud))
+    sin_lugar = len(lat)
+    lat.append(math.nan)
+    lon.append(math.nan)
+
+    buses_activos, conductores_activos = _ids_activos()
+    inicio = desde.timestamp()
+    buses = _Recursos([pk for pk, _ in buses_activos], inicio, sin_lugar)
+    capacidad = np.array([capacidad for _, capacidad in buses_activos], dtype=np.int64)
+    conductores = _Recursos(conductores_activos, inicio, sin_lugar)
+    for _, bus_id, conductor_id, salida, llegada, origen, destino, _ in fijos:
+        fijo = (salida.timestamp(), llegada.timestamp(), indice[origen], indice[destino])
+        buses.agregar_fijo(bus_id, *fijo)
+        conductores.agregar_fijo(conductor_id, *fijo)
+    buses.preparar()
+    conductores.preparar()
+    planificador = _Planificador(np.array(lat), np.array(lon), sin_lugar)
+
+    asignaciones = []
+    sin_asignar = []
+    for viaje_id, bus_anterior, conductor_anterior, salida, llegada, origen, destino, pasajeros in viajes:
+        salida, llegada = salida.timestamp(), llegada.timestamp()
+        origen, destino = indice[origen], indice[destino]
+        for recursos in (buses, conductores):
+            for i in np.flatnonzero(recursos.proximo_inicio <= salida):
+                while recursos.proximo_inicio[i] <= salida:
+                    recursos.avanzar(i)
+
+        costo_bus, vacio_bus = planificador.costos(buses, salida, llegada, origen, destino)
+        con_capacidad = capacidad >= pasajeros
+        costo_bus = np.where(con_capacidad, costo_bus + (capacidad - pasajeros) * PESO_ASIENTO_LIBRE, np.inf)
+        b = int(np.argmin(costo_bus)) if len(costo_bus) else None
+        if b is None or not np.isfinite(costo_bus[b]):
+            if not con_capacidad.any():
+                motivo = f'Ningún bus activo tiene capacidad para {pasajeros} pasajeros.'
+            else:
+                motivo = 'No hay un bus activo con capacidad suficiente libre en ese horario.'
+            sin_asignar.append((viaje_id, motivo))
+            continue
+        costo_conductor, _ = planificador.costos(conductores, salida, llegada, origen, destino)
+        if reasignar:
+            c = int(np.argmin(costo_conductor)) if len(costo_conductor) else None
+            if c is None or not np.isfinite(costo_conductor[c]):
+                sin_asignar.append((viaje_id, 'No hay un conductor activo libre en ese horario.'))
+                continue
+        else:
+            c = conductores.posicion.get(conductor_anterior)
+            if c is None:
+                sin_asignar.append((viaje_id, 'El conductor del viaje no está activo.'))
+                continue
+            if not np.isfinite(costo_conductor[c]):
+                sin_asignar.append((viaje_id, 'El conductor del viaje tiene otro viaje en ese horario.'))
+                continue
+        conductores.ocupar(c, llegada, destino)
+        conductor_id = int(conductores.ids[c])
+
+        espera_horas = (salida - buses.libre[b]) / 3600
+        buses.ocupar(b, llegada, destino)
+        asignaciones.append(Asignacion(
+            viaje_id, int(buses.ids[b]), conductor_id, bus_anterior, conductor_anterior,
+            round(float(vacio_bus[b]), 2), round(float(espera_horas), 2),
+        ))
+
+    return Plan(
+        asignaciones,
+        sin_asignar,
+        round(sum(asignacion.vacio_km for asignacion in asignaciones), 2),
+        round(sum(asignacion.espera_horas for asignacion in asignaciones), 2),
+    )
+
+
+def cambios(plan):
+    return [
+        asignacion for asignacion in plan.asignaciones
+        if (asignacion.bus_id, asignacion.conductor_id) != (asignacion.bus_anterior, asignacion.conductor_anterior)
+    ]
+
+
+def huella_plan(plan):
+    """
+    Resumen de los cambios del plan, para comprobar al aplicarlo que es el
+    mismo que se mostró en la vista previa.
+    """
+    contenido = ';'.join(
+        f'{a.viaje_id}:{a.bus_id}:{a.conductor_id}:{a.bus_anterior}:{a.conductor_anterior}'
+        for a in sorted(cambios(plan))
+    )
+    return hashlib.sha256(contenido.encode()).hexdigest()
+
+
+def _lotes(valores):
+    for inicio in range(0, len(valores), TAMANO_LOTE):
+        yield valores[inicio:inicio + TAMANO_LOTE]
+
+
+def aplicar(plan, huella=None):
+    """
+    Guarda el plan en una transacción, con un UPDATE por bus y por
+    conductor. Lanza PlanDesactualizado si el plan no tiene la huella
+    indicada (la de la vista previa) o si algún viaje cambió de bus,
+    conductor o estado desde que se planificó. Devuelve la cantidad de
+    viajes actualizados.
+    """
+    if huella is not None and huella != huella_plan(plan):
+        raise PlanDesactualizado('El plan cambió desde la vista previa; revíselo y vuelva a aplicarlo.')
+    por_aplicar = cambios(plan)
+    if not por_aplicar:
+        return 0
+    ids = [asignacion.viaje_id for asignacion in por_aplicar]
+    with transaction.atomic():
+        actuales = {}
+        for lote in _lotes(ids):
+            actuales.update(
+                (pk, (bus_id, conductor_id))
+                for pk, bus_id, conductor_id in Viaje.objects
+                .select_for_update()
+                .filter(pk__in=lote, estado='programado')
+                .values_list('pk', 'bus_id', 'conductor_id')
+            )
+        if any(actuales.get(a.viaje_id) != (a.bus_anterior, a.conductor_anterior) for a in por_aplicar):
+            raise PlanDesactualizado('Algunos viajes cambiaron desde la vista previa; vuelva a planificar.')
+
+        # update() no emite señales: se refrescan los grupos del resumen de costos
+        claves = set()
+        for lote in _lotes(ids):
+            claves |= claves_de_viajes(Viaje.objects.filter(pk__in=lote))
+        # Un UPDATE por bus y por conductor (bulk_update arma un CASE por fila)
+        for campo in ('bus_id', 'conductor_id'):
+            por_recurso = defaultdict(list)
+            for asignacion in por_aplicar:
+                por_recurso[getattr(asignacion, campo)].append(asignacion.viaje_id)
+            for recurso_id, viajes in por_recurso.items():
+                for lote in _lotes(viajes):
+                    Viaje.objects.filter(pk__in=lote).update(**{campo: recurso_id})
+        for lote in _lotes(ids):
+            claves |= claves_de_viajes(Viaje.objects.filter(pk__in=lote))
+        if len(claves) > MAX_GRUPOS_A_REFRESCAR:
+            reconstruir()
+        else:
+            refrescar(claves)
+    invalidar_modelos(Viaje)
+    return len(por_aplicar)
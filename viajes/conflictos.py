@@ -0,0 +1,103 @@
+"""
+Conflictos de horario: un bus o un conductor asignado a dos viajes que se
+superponen.
+
+Cada viaje ocupa el intervalo [fecha_salida, fecha_llegada_estimada): un
+viaje puede salir a la misma hora en que llega el anterior. Los viajes
+cancelados no ocupan al bus ni al conductor.
+
+- conflictos_de_horario(): los viajes que chocan con un horario, para
+  validar un viaje nuevo o editado. Busca la superposición real
+  (salida < fin y llegada > inicio) acotando la salida a
+  [inicio - DURACION_MAXIMA, fin): un rango de los índices
+  (bus, fecha_salida) y (conductor, fecha_salida) que no depende de que la
+  agenda ya esté libre de conflictos. El formulario rechaza viajes más
+  largos que DURACION_MAXIMA (VIAJE_DURACION_MAXIMA_HORAS).
+- detectar_conflictos(): todos los pares superpuestos de la flota. Lee los
+  viajes con una consulta, los ordena por (recurso, fecha_salida) y los
+  recorre una vez con un heap de los viajes en curso ordenado por llegada:
+  O(n log n + conflictos) en lugar de comparar todos contra todos.
+"""
+import heapq
+from collections import namedtuple
+from datetime import timedelta
+from itertools import groupby
+from operator import itemgetter
+
+from django.conf import settings
+
+from .models import Viaje
+
+RECURSOS = ('bus', 'conductor')
+ESTADOS_SIN_CONFLICTO = ('cancelado',)
+DURACION_MAXIMA = timedelta(hours=getattr(settings, 'VIAJE_DURACION_MAXIMA_HORAS', 72))
+
+# viaje_a sale antes (o a la vez) que viaje_b; [inicio, fin) es la superposición
+Conflicto = namedtuple('Conflicto', 'recurso recurso_id viaje_a viaje_b inicio fin')
+
+
+def _ocupados(recurso, recurso_id, excluir=None):
+    viajes = Viaje.objects.filter(**{f'{recurso}_id': recurso_id}).exclude(estado__in=ESTADOS_SIN_CONFLICTO)
+    if excluir is not None:
+        viajes = viajes.exclude(pk=excluir)
+    return viajes
+
+
+def conflictos_de_horario(inicio, fin, bus_id=None, conductor_id=None, excluir=None):
+    """
+    Viajes del bus o del conductor que se superponen con [inicio, fin), sin
+    contar el viaje excluir (el que se edita). Devuelve pares
+    (recurso, viaje) ordenados por salida.
+    """
+    conflictos = []
+    for recurso, recurso_id in zip(RECURSOS, (bus_id, conductor_id)):
+        if recurso_id is None:
+            continue
+        viajes = (
+            _ocupados(recurso, recurso_id, excluir)
+            .filter(
+                fecha_salida__gt=inicio - DURACION_MAXIMA,
+                fecha_salida__lt=fin,
+                fecha_llegada_estimada__gt=inicio,
+            )
+            .select_related('lugar_origen', 'lugar_destino')
+            .order_by('fecha_salida', 'pk')
+        )
+        conflictos.extend((recurso, viaje) for viaje in viajes)
+    return conflictos
+
+
+def _barrido(recurso, filas):
+    # filas: (recurso_id, salida, llegada, pk) ordenadas por recurso y salida
+    for recurso_id, grupo in groupby(filas, key=itemgetter(0)):
+        en_curso = []
+        for _, salida, llegada, pk in grupo:
+            while en_curso and en_curso[0][0] <= salida:
+                heapq.heappop(en_curso)
+            for llegada_otro, otro in en_curso:
+                yield Conflicto(recurso, recurso_id, otro, pk, salida, min(llegada, llegada_otro))
+            heapq.heappush(en_curso, (llegada, pk))
+
+
+def detectar_conflictos(desde=None, hasta=None):
+    """
+    Todos los pares de viajes que comparten bus o conductor y se superponen,
+    entre los viajes que ocupan algún momento de [desde, hasta). Devuelve una
+    lista de Conflicto ordenada por recurso y fecha.
+    """
+    viajes = Viaje.objects.exclude(estado__in=ESTADOS_SIN_CONFLICTO).order_by()
+    if desde is not None:
+        viajes = viajes.filter(fecha_llegada_estimada__gt=desde)
+    if hasta is not None:
+        viajes = viajes.filter(fecha_salida__lt=hasta)
+    filas = list(viajes.values_list('pk', 'bus_id', 'conductor_id', 'fecha_salida', 'fecha_llegada_estimada'))
+
+    conflictos = []
+    for posicion, recurso in enumerate(RECURSOS, start=1):
+        por_recurso = sorted(
+            (fila[posicion], fila[3], fila[4], fila[0])
+            for fila in filas
+            if fila[posicion] is not None
+        )
+        conflictos.extend(_barrido(recurso, por_recurso))
+    return conflictos
@@ -0,0 +1,54 @@
+"""
+Distancia de cada viaje entre las coordenadas de origen y destino.
+
+Viaje guarda una copia de las coordenadas de sus lugares; la distancia en
+línea recta (círculo máximo, fórmula de haversine) se calcula al guardar el
+viaje y queda en Viaje.distancia_km, indexada. Los reportes de km por bus,
+de la flota o de costo por km suman esa columna en la base de datos.
+
+recalcular_distancias() la rehace para todos los viajes por lotes de ids:
+cada lote se lee con una consulta, se calcula de una vez (core.geo, con NumPy
+si está instalado) y solo se escriben las filas que cambian.
+"""
+from django.apps import apps as django_apps
+from django.db import transaction
+
+from core.geo import distancias_km
+
+CAMPOS_COORDENADAS = ('latitud_origen', 'longitud_origen', 'latitud_destino', 'longitud_destino')
+TAMANO_LOTE = 2000
+
+
+def recalcular_distancias(apps=None, tamano_lote=TAMANO_LOTE):
+    """
+    Recalcula distancia_km de todos los viajes, por lotes de ids y una
+    transacción por lote. Recibe el registro de apps para poder usarse desde
+    una migración. Devuelve la cantidad de viajes actualizados.
+
+    bulk_update no emite señales: quien la llama refresca lo que dependa de
+    la distancia (por ejemplo, el resumen de costos).
+    """
+    Viaje = (apps or django_apps).get_model('viajes', 'Viaje')
+    actualizados = 0
+    ultimo = 0
+    while True:
+        filas = list(
+            Viaje.objects
+            .filter(pk__gt=ultimo)
+            .order_by('pk')
+            .values_list('pk', 'distancia_km', *CAMPOS_COORDENADAS)[:tamano_lote]
+        )
+        if not filas:
+            break
+        ultimo = filas[-1][0]
+        ids, guardadas, *coordenadas = zip(*filas)
+        cambios = [
+            Viaje(pk=pk, distancia_km=nueva)
+            for pk, guardada, nueva in zip(ids, guardadas, distancias_km(*coordenadas))
+            if guardada != nueva
+        ]
+        if cambios:
+            with transaction.atomic():
+                Viaje.objects.bulk_update(cambios, ['distancia_km'])
+            actualizados += len(cambios)
+    return actualizados
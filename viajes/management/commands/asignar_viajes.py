@@ -0,0 +1,44 @@
+import time
+from datetime import datetime, timedelta, time as hora
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from flota.pronostico import NumpyNoDisponible
+from viajes.asignacion import aplicar, cambios, planificar
+
+
+def _fecha(valor):
+    return datetime.strptime(valor, '%Y-%m-%d').date()
+
+
+class Command(BaseCommand):
+    help = (
+        'Asigna bus y conductor a los viajes programados de un período. Sin '
+        '--aplicar solo muestra el resultado (vista previa).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--desde', type=_fecha, required=True, help='Fecha inicial (AAAA-MM-DD)')
+        parser.add_argument('--hasta', type=_fecha, required=True, help='Fecha final, incluida (AAAA-MM-DD)')
+        parser.add_argument('--reasignar', action='store_true', help='Incluir los viajes que ya tienen bus')
+        parser.add_argument('--aplicar', action='store_true', help='Guardar las asignaciones')
+
+    def handle(self, *args, **options):
+        desde = timezone.make_aware(datetime.combine(options['desde'], hora.min))
+        hasta = timezone.make_aware(datetime.combine(options['hasta'] + timedelta(days=1), hora.min))
+        inicio = time.monotonic()
+        try:
+            with transaction.atomic():
+                plan = planificar(desde, hasta, reasignar=options['reasignar'])
+                actualizados = aplicar(plan) if options['aplicar'] else 0
+        except NumpyNoDisponible as e:
+            raise CommandError(str(e))
+        if options['aplicar']:
+            resultado = f'{actualizados} cambios aplicados'
+        else:
+            resultado = f'{len(cambios(plan))} cambios por aplicar (vista previa)'
+        self.stdout.write(self.style.SUCCESS(
+            f'Viajes asignados: {len(plan.asignaciones)}, {resultado}, {len(plan.sin_asignar)} sin asignar, '
+            f'{plan.km_vacio:.1f} km en vacío, {plan.horas_espera:.1f} h de espera en {time.monotonic() - inicio:.2f} s'
+        ))
@@ -0,0 +1,106 @@
+import random
+import time
+from datetime import datetime, timedelta, time as hora
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from core.models import Conductor, Lugar
+from flota.models import Bus
+from flota.pronostico import NumpyNoDisponible
+from viajes.asignacion import aplicar, cambios, huella_plan, planificar
+from viajes.models import Viaje
+
+PREFIJO = 'BENCH'
+CAPACIDADES = (20, 30, 45, 50)
+
+
+class Command(BaseCommand):
+    help = (
+        'Mide planificar() y aplicar() de la asignación automática sobre datos '
+        'sintéticos (viajes sin bus, buses, conductores y lugares en Ecuador). '
+        'Todo se crea en una transacción que se revierte al terminar.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--viajes', type=int, default=10000)
+        parser.add_argument('--buses', type=int, default=200)
+        parser.add_argument('--conductores', type=int, default=200)
+        parser.add_argument('--lugares', type=int, default=50)
+        parser.add_argument('--dias', type=int, default=7, help='Días del período planificado')
+        parser.add_argument('--semilla', type=int, default=1)
+        parser.add_argument('--reasignar', action='store_true', help='Elegir también el conductor')
+
+    def handle(self, *args, **options):
+        if options['lugares'] < 2 or options['conductores'] < 1:
+            raise CommandError('Se necesitan al menos 2 lugares y 1 conductor.')
+        aleatorio = random.Random(options['semilla'])
+        # Un período sin viajes reales, para medir solo los sintéticos
+        dia = timezone.localdate() + timedelta(days=3650)
+        desde = timezone.make_aware(datetime.combine(dia, hora.min))
+        hasta = desde + timedelta(days=options['dias'])
+
+        with transaction.atomic():
+            conductores, lugares = self._crear_datos(aleatorio, options)
+            viajes = []
+            for _ in range(options['viajes']):
+                salida = desde + timedelta(minutes=aleatorio.randrange(options['dias'] * 24 * 60))
+                origen, destino = aleatorio.sample(lugares, 2)
+                viajes.append(Viaje(
+                    conductor=aleatorio.choice(conductores), lugar_origen=origen, lugar_destino=destino,
+                    fecha_salida=salida, fecha_llegada_estimada=salida + timedelta(minutes=aleatorio.randrange(60, 8 * 60)),
+                    pasajeros_confirmados=aleatorio.randrange(46),
+                ))
+            Viaje.objects.bulk_create(viajes, batch_size=1000)
+
+            try:
+                inicio = time.monotonic()
+                plan = planificar(desde, hasta, reasignar=options['reasignar'])
+                t_planificar = time.monotonic() - inicio
+                inicio = time.monotonic()
+                actualizados = aplicar(plan, huella=huella_plan(plan))
+                t_aplicar = time.monotonic() - inicio
+            except NumpyNoDisponible as e:
+                raise CommandError(str(e))
+            finally:
+                transaction.set_rollback(True)
+
+        self.stdout.write(
+            f'{options["viajes"]} viajes, {options["buses"]} buses, {options["conductores"]} conductores, '
+            f'{options["lugares"]} lugares en {options["dias"]} días'
+        )
+        self.stdout.write(
+            f'{len(plan.asignaciones)} asignados ({len(cambios(plan))} cambios), {len(plan.sin_asignar)} sin asignar, '
+            f'{plan.km_vacio:.1f} km en vacío, {plan.horas_espera:.1f} h de espera'
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'planificar: {t_planificar:.2f} s, aplicar: {t_aplicar:.2f} s ({actualizados} viajes); datos revertidos'
+        ))
+
+    def _crear_datos(self, aleatorio, options):
+        Bus.objects.bulk_create([
+            Bus(
+                placa=f'{PREFIJO}{i}', marca='Benchmark', modelo='Benchmark', año_fabricacion=2020,
+                capacidad_pasajeros=aleatorio.choice(CAPACIDADES), numero_chasis=f'{PREFIJO}-CH{i}',
+                fecha_adquisicion='2020-01-01',
+            )
+            for i in range(options['buses'])
+        ])
+        Conductor.objects.bulk_create([
+            Conductor(
+                nombre=f'Conductor {i}', apellido=PREFIJO, cedula=f'{PREFIJO}{i}',
+                email=f'{PREFIJO.lower()}{i}@example.com', telefono='0', fecha_contratacion='2024-01-01',
+            )
+            for i in range(options['conductores'])
+        ])
+        Lugar.objects.bulk_create([
+            Lugar(
+                nombre=f'{PREFIJO} {i}', ciudad=PREFIJO,
+                latitud=Decimal(f'{aleatorio.uniform(-4.5, 1.0):.6f}'),
+                longitud=Decimal(f'{aleatorio.uniform(-80.5, -76.0):.6f}'),
+            )
+            for i in range(options['lugares'])
+        ])
+        # bulk_create no devuelve los ids en todas las bases (MySQL)
+        return list(Conductor.objects.filter(apellido=PREFIJO)), list(Lugar.objects.filter(ciudad=PREFIJO))
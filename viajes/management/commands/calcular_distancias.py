@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+from costos.resumen import reconstruir
+from viajes.distancias import TAMANO_LOTE, recalcular_distancias
+
+
+class Command(BaseCommand):
+    help = (
+        'Recalcula la distancia (haversine) de todos los viajes por lotes y, si '
+        'alguna cambia, reconstruye el resumen de costos.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=TAMANO_LOTE, help='Viajes por lote')
+
+    def handle(self, *args, **options):
+        inicio = time.monotonic()
+        actualizados = recalcular_distancias(tamano_lote=options['lote'])
+        if actualizados:
+            # bulk_update no emite las señales que mantienen el resumen
+            reconstruir()
+        self.stdout.write(self.style.SUCCESS(
+            f'Distancias recalculadas: {actualizados} viajes actualizados en {time.monotonic() - inicio:.2f} s'
+        ))
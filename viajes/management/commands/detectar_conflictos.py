@@ -0,0 +1,28 @@
+import time
+from collections import Counter
+from datetime import datetime, time as hora
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from viajes.conflictos import detectar_conflictos
+
+
+def _fecha(valor):
+    return timezone.make_aware(datetime.combine(datetime.strptime(valor, '%Y-%m-%d').date(), hora.min))
+
+
+class Command(BaseCommand):
+    help = 'Busca buses y conductores asignados a viajes que se superponen en toda la flota.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--desde', type=_fecha, help='Fecha inicial (AAAA-MM-DD)')
+        parser.add_argument('--hasta', type=_fecha, help='Fecha final, sin incluir (AAAA-MM-DD)')
+
+    def handle(self, *args, **options):
+        inicio = time.monotonic()
+        conflictos = detectar_conflictos(options['desde'], options['hasta'])
+        por_recurso = Counter(conflicto.recurso for conflicto in conflictos)
+        self.stdout.write(self.style.SUCCESS(
+            f'Conflictos encontrados: {por_recurso["bus"]} de buses y {por_recurso["conductor"]} de '
+            f'conductores en {time.monotonic() - inicio:.2f} s'
+        ))
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.8 on 2026-10-18 10:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_pasajero'),
+        ('flota', '0003_bus_kilometraje_inicial_alter_bus_marca'),
+        ('viajes', '0004_alter_viaje_bus'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='viaje',
+            index=models.Index(fields=['fecha_salida', 'id'], name='viaje_salida_id_idx'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.8 on 2026-10-18 10:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_pasajero'),
+        ('flota', '0003_bus_kilometraje_inicial_alter_bus_marca'),
+        ('viajes', '0005_viaje_salida_id_idx'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='viaje',
+            index=models.Index(fields=['estado', 'fecha_salida'], name='viaje_estado_salida_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='viaje',
+            index=models.Index(fields=['bus', 'fecha_salida'], name='viaje_bus_salida_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='viaje',
+            index=models.Index(fields=['conductor', 'fecha_salida'], name='viaje_conductor_salida_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='viaje',
+            index=models.Index(fields=['lugar_origen', 'fecha_salida'], name='viaje_origen_salida_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='viaje',
+            index=models.Index(fields=['lugar_destino', 'fecha_salida'], name='viaje_destino_salida_idx'),
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.2.8 on 2026-10-18 10:48
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def normalizar_asientos(apps, schema_editor):
+    """
+    Deja en NULL los asientos vacíos y los repetidos dentro de un mismo viaje
+    (se conserva el primer registro), y recalcula pasajeros_confirmados.
+    """
+    Viaje = apps.get_model('viajes', 'Viaje')
+    ViajePasajero = apps.get_model('viajes', 'ViajePasajero')
+    ViajePasajero.objects.filter(asiento='').update(asiento=None)
+    repetidos = (
+        ViajePasajero.objects.exclude(asiento=None)
+        .values('viaje_id', 'asiento')
+        .annotate(total=Count('id'))
+        .filter(total__gt=1)
+    )
+    for fila in repetidos:
+        ids = list(
+            ViajePasajero.objects
+            .filter(viaje_id=fila['viaje_id'], asiento=fila['asiento'])
+            .order_by('id')
+            .values_list('id', flat=True)
+        )
+        ViajePasajero.objects.filter(id__in=ids[1:]).update(asiento=None)
+    conteo = (
+        ViajePasajero.objects.filter(viaje_id=OuterRef('pk'))
+        .values('viaje_id')
+        .annotate(total=Count('id'))
+        .values('total')
+    )
+    Viaje.objects.update(pasajeros_confirmados=Coalesce(Subquery(conteo), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_pasajero'),
+        ('viajes', '0006_viaje_indices_filtros'),
+    ]
+
+    operations = [
+        migrations.RunPython(normalizar_asientos, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='viajepasajero',
+            constraint=models.UniqueConstraint(fields=('viaje', 'asiento'), name='viajepasajero_asiento_unico'),
+        ),
+    ]
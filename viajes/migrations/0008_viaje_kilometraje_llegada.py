@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-18 11:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('viajes', '0007_viajepasajero_asiento_unico'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='viaje',
+            name='kilometraje_llegada',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.8 on 2026-10-18 11:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_tareas'),
+        ('flota', '0012_pronosticomantenimiento'),
+        ('viajes', '0008_viaje_kilometraje_llegada'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='viaje',
+            name='distancia_km',
+            field=models.DecimalField(blank=True, decimal_places=2, editable=False, max_digits=8, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='viaje',
+            index=models.Index(fields=['bus', 'distancia_km'], name='viaje_bus_distancia_idx'),
+        ),
+    ]
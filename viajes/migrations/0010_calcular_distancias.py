@@ -0,0 +1,57 @@
+import math
+from decimal import Decimal
+
+from django.db import migrations
+
+# Copia congelada del cálculo de viajes.distancias / core.geo: la migración
+# no depende del código actual
+RADIO_TIERRA_KM = 6371.0088
+TAMANO_LOTE = 2000
+
+
+def haversine_km(latitud_origen, longitud_origen, latitud_destino, longitud_destino):
+    if None in (latitud_origen, longitud_origen, latitud_destino, longitud_destino):
+        return None
+    fi1, fi2 = math.radians(float(latitud_origen)), math.radians(float(latitud_destino))
+    delta_fi = fi2 - fi1
+    delta_lambda = math.radians(float(longitud_destino) - float(longitud_origen))
+    a = math.sin(delta_fi / 2) ** 2 + math.cos(fi1) * math.cos(fi2) * math.sin(delta_lambda / 2) ** 2
+    return Decimal(str(round(2 * RADIO_TIERRA_KM * math.asin(min(1.0, math.sqrt(a))), 2)))
+
+
+def calcular_distancias(apps, schema_editor):
+    """
+    Distancia de los viajes existentes a partir de las coordenadas copiadas
+    de sus lugares.
+    """
+    Viaje = apps.get_model('viajes', 'Viaje')
+    ultimo = 0
+    while True:
+        filas = list(
+            Viaje.objects
+            .filter(pk__gt=ultimo)
+            .order_by('pk')
+            .values_list('pk', 'latitud_origen', 'longitud_origen', 'latitud_destino', 'longitud_destino')[:TAMANO_LOTE]
+        )
+        if not filas:
+            break
+        ultimo = filas[-1][0]
+        cambios = [
+            Viaje(pk=pk, distancia_km=distancia)
+            for pk, *coordenadas in filas
+            for distancia in [haversine_km(*coordenadas)]
+            if distancia is not None
+        ]
+        if cambios:
+            Viaje.objects.bulk_update(cambios, ['distancia_km'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('viajes', '0009_viaje_distancia_km'),
+    ]
+
+    operations = [
+        migrations.RunPython(calcular_distancias, migrations.RunPython.noop),
+    ]
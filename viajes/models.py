@@ -1,6 +1,8 @@
 from django.db import models
 from core.models import Conductor, Lugar, Pasajero
 from flota.models import Bus
+from core.geo import distancia_km
+from .distancias import CAMPOS_COORDENADAS
 
 
 class Viaje(models.Model):
@@ -26,16 +28,49 @@ class Viaje(models.Model):
     longitud_origen = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
     latitud_destino = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
     longitud_destino = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
+    # Haversine entre las coordenadas anteriores; se calcula al guardar (viajes/distancias.py)
+    distancia_km = models.DecimalField(max_digits=8, decimal_places=2, null=True, blank=True, editable=False)
     pasajeros = models.ManyToManyField(Pasajero, through='ViajePasajero', blank=True, related_name='viajes')
     pasajeros_confirmados = models.IntegerField(default=0)
+    # Odómetro del bus al llegar; genera una lectura (flota/odometro.py)
+    kilometraje_llegada = models.PositiveIntegerField(null=True, blank=True)
     observaciones = models.TextField(blank=True)
     creado_en = models.DateTimeField(auto_now_add=True)
     actualizado_en = models.DateTimeField(auto_now=True)
 
+    CAMPOS_CONTADORES = ('pasajeros_confirmados',)
+
     class Meta:
         ordering = ['-fecha_salida']
         verbose_name = 'Viaje'
         verbose_name_plural = 'Viajes'
+        indexes = [
+            # Paginación por cursor sobre (fecha_salida, id)
+            models.Index(fields=['fecha_salida', 'id'], name='viaje_salida_id_idx'),
+            # Filtros del listado, combinados con el rango de fecha_salida
+            models.Index(fields=['estado', 'fecha_salida'], name='viaje_estado_salida_idx'),
+            models.Index(fields=['bus', 'fecha_salida'], name='viaje_bus_salida_idx'),
+            models.Index(fields=['conductor', 'fecha_salida'], name='viaje_conductor_salida_idx'),
+            models.Index(fields=['lugar_origen', 'fecha_salida'], name='viaje_origen_salida_idx'),
+            models.Index(fields=['lugar_destino', 'fecha_salida'], name='viaje_destino_salida_idx'),
+            # Reportes de km por bus
+            models.Index(fields=['bus', 'distancia_km'], name='viaje_bus_distancia_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        self.distancia_km = distancia_km(*(getattr(self, campo) for campo in CAMPOS_COORDENADAS))
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None and not self._state.adding:
+            # pasajeros_confirmados se mueve con UPDATE ... F() al reservar
+            # (viajes/reservas.py); guardar el viaje no debe pisarlo con el
+            # valor que se leyó al cargar el formulario
+            kwargs['update_fields'] = [
+                campo.name for campo in self._meta.concrete_fields
+                if not campo.primary_key and campo.name not in self.CAMPOS_CONTADORES
+            ]
+        elif update_fields is not None and set(update_fields) & set(CAMPOS_COORDENADAS):
+            kwargs['update_fields'] = set(update_fields) | {'distancia_km'}
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return f"{self.bus.placa} - {self.lugar_origen.nombre} -> {self.lugar_destino.nombre} ({self.fecha_salida.date()})"
@@ -56,6 +91,10 @@ class ViajePasajero(models.Model):
     
     class Meta:
         unique_together = ('viaje', 'pasajero')
+        constraints = [
+            # Un asiento no puede asignarse dos veces en el mismo viaje (NULL = sin asiento)
+            models.UniqueConstraint(fields=['viaje', 'asiento'], name='viajepasajero_asiento_unico'),
+        ]
         verbose_name = 'Pasajero en Viaje'
         verbose_name_plural = 'Pasajeros en Viajes'
     
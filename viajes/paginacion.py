@@ -0,0 +1,77 @@
+import base64
+from datetime import datetime
+
+from django.db.models import Q
+
+
+class CursorInvalido(ValueError):
+    """
+    El cursor recibido no se pudo decodificar.
+    """
+
+
+def codificar_cursor(viaje, direccion):
+    """
+    Codifica la posición (fecha_salida, id) de un viaje y la dirección
+    ('n' siguiente, 'p' anterior) en un cursor opaco para la URL.
+    """
+    valor = f"{direccion}|{viaje.fecha_salida.isoformat()}|{viaje.pk}"
+    return base64.urlsafe_b64encode(valor.encode()).decode().rstrip('=')
+
+
+def decodificar_cursor(cursor):
+    """
+    Devuelve (direccion, fecha_salida, id) a partir de un cursor.
+    """
+    try:
+        relleno = '=' * (-len(cursor) % 4)
+        valor = base64.urlsafe_b64decode(cursor + relleno).decode()
+        direccion, fecha, pk = valor.split('|')
+        if direccion not in ('n', 'p'):
+            raise ValueError(direccion)
+        return direccion, datetime.fromisoformat(fecha), int(pk)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise CursorInvalido(cursor) from e
+
+
+def paginar_por_cursor(queryset, cursor=None, tamano=20):
+    """
+    Paginación por clave (keyset) sobre (fecha_salida, id) descendente.
+
+    En lugar de OFFSET filtra por la posición del último registro visto, de modo
+    que cualquier página usa el índice (fecha_salida, id) y cuesta lo mismo que
+    la primera. No ejecuta COUNT(*).
+
+    Devuelve (objetos, cursor_siguiente, cursor_anterior).
+    """
+    if not cursor:
+        filas = list(queryset.order_by('-fecha_salida', '-id')[:tamano + 1])
+        hay_mas = len(filas) > tamano
+        filas = filas[:tamano]
+        siguiente = codificar_cursor(filas[-1], 'n') if hay_mas else None
+        return filas, siguiente, None
+
+    direccion, fecha, pk = decodificar_cursor(cursor)
+    if direccion == 'n':
+        filas = list(
+            queryset
+            .filter(Q(fecha_salida__lt=fecha) | Q(fecha_salida=fecha, id__lt=pk))
+            .order_by('-fecha_salida', '-id')[:tamano + 1]
+        )
+        hay_mas = len(filas) > tamano
+        filas = filas[:tamano]
+        siguiente = codificar_cursor(filas[-1], 'n') if hay_mas else None
+        anterior = codificar_cursor(filas[0], 'p') if filas else None
+        return filas, siguiente, anterior
+
+    # Página anterior: se recorre el índice en sentido inverso y se invierte el resultado
+    filas = list(
+        queryset
+        .filter(Q(fecha_salida__gt=fecha) | Q(fecha_salida=fecha, id__gt=pk))
+        .order_by('fecha_salida', 'id')[:tamano + 1]
+    )
+    hay_mas = len(filas) > tamano
+    filas = filas[:tamano][::-1]
+    siguiente = codificar_cursor(filas[-1], 'n') if filas else None
+    anterior = codificar_cursor(filas[0], 'p') if hay_mas else None
+    return filas, siguiente, anterior
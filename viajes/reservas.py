@@ -0,0 +1,208 @@
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+
+from core.cache import invalidar_modelos
+from core.models import Pasajero
+from .models import Viaje, ViajePasajero
+
+
+class ReservaError(Exception):
+    """
+    No se pudo reservar el asiento. El mensaje se muestra al usuario.
+    """
+
+
+class CapacidadExcedida(ReservaError):
+    pass
+
+
+class PasajeroDuplicado(ReservaError):
+    pass
+
+
+class AsientoOcupado(ReservaError):
+    pass
+
+
+class AsientoInvalido(ReservaError):
+    pass
+
+
+def normalizar_asiento(asiento):
+    """
+    Los asientos vacíos se guardan como NULL para no chocar con la restricción
+    única (viaje, asiento). Los números (p. ej. desde JSON) se guardan como
+    texto; un asiento más largo que la columna es un AsientoInvalido.
+    """
+    asiento = str(asiento if asiento is not None else '').strip()
+    if not asiento:
+        return None
+    max_length = ViajePasajero._meta.get_field('asiento').max_length
+    if len(asiento) > max_length:
+        raise AsientoInvalido(f'El asiento no puede superar los {max_length} caracteres.')
+    return asiento
+
+
+def reservar_asiento(viaje, pasajero, asiento=None, observaciones=''):
+    """
+    Agrega un pasajero a un viaje sin sobrevender el bus.
+
+    La capacidad se controla con un único UPDATE condicional sobre
+    pasajeros_confirmados, que además bloquea la fila del viaje hasta el final
+    de la transacción: las reservas concurrentes del mismo viaje se serializan
+    y no hace falta contar pasajeros. Si la inserción falla (pasajero o asiento
+    repetido) la transacción se revierte y el contador vuelve a su valor.
+    """
+    if viaje.bus_id is None:
+        raise ReservaError('El viaje no tiene un bus asignado.')
+    capacidad = viaje.bus.capacidad_pasajeros
+    asiento = normalizar_asiento(asiento)
+
+    try:
+        with transaction.atomic():
+            actualizados = (
+                Viaje.objects
+                .filter(pk=viaje.pk, pasajeros_confirmados__lt=capacidad)
+                .update(pasajeros_confirmados=F('pasajeros_confirmados') + 1)
+            )
+            if not actualizados:
+                raise CapacidadExcedida('El bus ha alcanzado su capacidad máxima de pasajeros.')
+            viaje_pasajero = ViajePasajero.objects.create(
+                viaje=viaje,
+                pasajero=pasajero,
+                asiento=asiento,
+                observaciones=observaciones
+            )
+    except IntegrityError:
+        if ViajePasajero.objects.filter(viaje=viaje, pasajero=pasajero).exists():
+            raise PasajeroDuplicado(
+                f'El pasajero {pasajero.nombre_completo} ya está registrado en este viaje.'
+            )
+        raise AsientoOcupado(f'El asiento {asiento} ya está asignado en este viaje.')
+    # El contador se actualiza con UPDATE, que no emite señales
+    invalidar_modelos(Viaje)
+    return viaje_pasajero
+
+
+def resolver_pasajeros(identificadores):
+    """
+    Busca en una sola consulta los pasajeros indicados por RUT o por id.
+
+    Devuelve (pasajeros, no_encontrados), con los pasajeros en el mismo orden
+    que los identificadores. Un identificador se interpreta primero como RUT.
+    """
+    ids = [int(i) for i in identificadores if i.isdigit()]
+    por_rut, por_id = {}, {}
+    for pasajero in Pasajero.objects.filter(Q(rut__in=identificadores) | Q(id__in=ids)).only('id', 'rut', 'nombre_completo'):
+        por_rut[pasajero.rut] = pasajero
+        por_id[str(pasajero.pk)] = pasajero
+    pasajeros, no_encontrados = [], []
+    for identificador in identificadores:
+        pasajero = por_rut.get(identificador) or por_id.get(identificador)
+        if pasajero is None:
+            no_encontrados.append(identificador)
+        else:
+            pasajeros.append(pasajero)
+    return pasajeros, no_encontrados
+
+
+def reservar_grupo(viaje, inscripciones, observaciones=''):
+    """
+    Inscribe un grupo de pasajeros en un viaje de una sola vez.
+
+    inscripciones es una lista de (pasajero, asiento). La capacidad se valida
+    una vez con el mismo UPDATE condicional que reservar_asiento (sumando el
+    tamaño del grupo) y las filas se insertan con un único bulk_create. Es todo
+    o nada: si algún pasajero o asiento ya existe no se inscribe ninguno.
+    """
+    if viaje.bus_id is None:
+        raise ReservaError('El viaje no tiene un bus asignado.')
+    if not inscripciones:
+        raise ReservaError('No se indicaron pasajeros.')
+
+    inscripciones = [(pasajero, normalizar_asiento(asiento)) for pasajero, asiento in inscripciones]
+    pasajero_ids = [pasajero.pk for pasajero, _ in inscripciones]
+    asientos = [asiento for _, asiento in inscripciones if asiento]
+    if len(set(pasajero_ids)) != len(pasajero_ids):
+        raise PasajeroDuplicado('Hay pasajeros repetidos en el grupo.')
+    if len(set(asientos)) != len(asientos):
+        raise AsientoOcupado('Hay asientos repetidos en el grupo.')
+
+    total = len(inscripciones)
+    try:
+        with transaction.atomic():
+            actualizados = (
+                Viaje.objects
+                .filter(pk=viaje.pk, pasajeros_confirmados__lte=viaje.bus.capacidad_pasajeros - total)
+                .update(pasajeros_confirmados=F('pasajeros_confirmados') + total)
+            )
+            if not actualizados:
+                raise CapacidadExcedida(f'No hay asientos suficientes para {total} pasajeros.')
+            creados = ViajePasajero.objects.bulk_create([
+                ViajePasajero(viaje=viaje, pasajero=pasajero, asiento=asiento, observaciones=observaciones)
+                for pasajero, asiento in inscripciones
+            ])
+    except IntegrityError:
+        registrados = list(
+            ViajePasajero.objects
+            .filter(viaje=viaje, pasajero_id__in=pasajero_ids)
+            .values_list('pasajero__nombre_completo', flat=True)
+        )
+        if registrados:
+            raise PasajeroDuplicado(f'Ya están registrados en este viaje: {", ".join(registrados)}.')
+        ocupados = list(
+            ViajePasajero.objects
+            .filter(viaje=viaje, asiento__in=asientos)
+            .values_list('asiento', flat=True)
+        )
+        raise AsientoOcupado(f'Asientos ya asignados en este viaje: {", ".join(ocupados)}.')
+    invalidar_modelos(Viaje)
+    return creados
+
+
+def liberar_asiento(viaje, pasajero):
+    """
+    Quita un pasajero del viaje y descuenta pasajeros_confirmados en la misma
+    transacción. Devuelve False si el pasajero no estaba en el viaje.
+    """
+    with transaction.atomic():
+        borrados, _ = ViajePasajero.objects.filter(viaje=viaje, pasajero=pasajero).delete()
+        if borrados:
+            Viaje.objects.filter(pk=viaje.pk).update(
+                pasajeros_confirmados=F('pasajeros_confirmados') - borrados
+            )
+    if borrados:
+        invalidar_modelos(Viaje)
+    return bool(borrados)
+
+
+def reconciliar_pasajeros_confirmados():
+    """
+    Corrige pasajeros_confirmados en los viajes donde no coincide con los
+    pasajeros registrados (cargas por el admin, borrados masivos...). Se
+    ejecuta como tarea periódica; devuelve cuántos viajes se corrigieron.
+    """
+    conteo = Coalesce(
+        Subquery(
+            ViajePasajero.objects
+            .filter(viaje=OuterRef('pk'))
+            .order_by()
+            .values('viaje')
+            .annotate(total=Count('id'))
+            .values('total')
+        ),
+        0,
+    )
+    ids = list(
+        Viaje.objects
+        .annotate(registrados=conteo)
+        .exclude(pasajeros_confirmados=F('registrados'))
+        .values_list('pk', flat=True)
+    )
+    if not ids:
+        return 0
+    corregidos = Viaje.objects.filter(pk__in=ids).update(pasajeros_confirmados=conteo)
+    invalidar_modelos(Viaje)
+    return corregidos
+
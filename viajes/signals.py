@@ -0,0 +1,33 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from core.matriz import asegurar_par
+from flota.odometro import borrar_lecturas, registrar_lectura
+from .models import Viaje
+
+
+@receiver(post_save, sender=Viaje)
+def lectura_viaje(sender, instance, **kwargs):
+    """
+    El kilometraje al llegar es una lectura del odómetro del bus del viaje.
+    """
+    if instance.bus_id is None or instance.kilometraje_llegada is None:
+        borrar_lecturas('viaje', instance.pk)
+        return
+    registrar_lectura(
+        instance.bus_id, instance.kilometraje_llegada,
+        instance.fecha_llegada_real or instance.fecha_llegada_estimada,
+        origen='viaje', referencia=instance.pk,
+    )
+
+
+@receiver(post_delete, sender=Viaje)
+def borrar_lectura_viaje(sender, instance, **kwargs):
+    borrar_lecturas('viaje', instance.pk)
+
+
+@receiver(post_save, sender=Viaje)
+def distancia_de_la_ruta(sender, instance, **kwargs):
+    """
+    La matriz de distancias incluye los pares de lugares usados en viajes.
+    """
+    asegurar_par(instance.lugar_origen_id, instance.lugar_destino_id)
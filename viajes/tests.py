@@ -1,12 +1,35 @@
-from django.test import TestCase
+import json
+import random
+import threading
+from decimal import Decimal
+from io import StringIO
+from django.contrib.messages import get_messages
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, skipUnlessDBFeature
+from django.urls import reverse
 from django.utils import timezone
-from .models import Viaje
-from core.models import Conductor, Lugar
+from datetime import datetime, timedelta
+from unittest import skipUnless
+from .asignacion import PlanDesactualizado, aplicar, numpy_disponible, planificar
+from .conflictos import DURACION_MAXIMA, conflictos_de_horario, detectar_conflictos
+from .distancias import recalcular_distancias
+from core.geo import distancia_km, distancias_km
+from .models import Viaje, ViajePasajero
+from .views import ViajeForm
+from .reservas import (
+    reservar_asiento, reservar_grupo, liberar_asiento, reconciliar_pasajeros_confirmados,
+    ReservaError, CapacidadExcedida, PasajeroDuplicado, AsientoOcupado, AsientoInvalido
+)
+from core.models import Conductor, Lugar, Pasajero
 from flota.models import Bus
 
 
-class ViajeTestCase(TestCase):
-    def setUp(self):
+class DatosViajeMixin:
+    """
+    Conductor, bus y lugares comunes a las pruebas de viajes y reservas.
+    """
+    def crear_datos(self, capacidad=50):
         self.conductor = Conductor.objects.create(
             nombre='Juan',
             apellido='Pérez',
@@ -19,7 +42,7 @@ class ViajeTestCase(TestCase):
             placa='ABC123',
             modelo='Mercedes Benz',
             año_fabricacion=2020,
-            capacidad_pasajeros=50,
+            capacidad_pasajeros=capacidad,
             numero_chasis='CH123',
             numero_motor='MO123',
             fecha_adquisicion='2020-05-15'
@@ -27,6 +50,30 @@ class ViajeTestCase(TestCase):
         self.lugar_origen = Lugar.objects.create(nombre='Quito', ciudad='Quito')
         self.lugar_destino = Lugar.objects.create(nombre='Cuenca', ciudad='Cuenca')
 
+    def crear_viaje_con_pasajeros(self, cantidad):
+        self.viaje = Viaje.objects.create(
+            bus=self.bus,
+            conductor=self.conductor,
+            lugar_origen=self.lugar_origen,
+            lugar_destino=self.lugar_destino,
+            fecha_salida=timezone.now(),
+            fecha_llegada_estimada=timezone.now()
+        )
+        self.pasajeros = [
+            Pasajero.objects.create(
+                nombre_completo=f'Pasajero {i}',
+                rut=f'{i}-9',
+                telefono='0987654321',
+                correo='pasajero@example.com'
+            )
+            for i in range(cantidad)
+        ]
+
+
+class ViajeTestCase(DatosViajeMixin, TestCase):
+    def setUp(self):
+        self.crear_datos()
+
     def test_viaje_creation(self):
         viaje = Viaje.objects.create(
             bus=self.bus,
@@ -37,3 +84,634 @@ class ViajeTestCase(TestCase):
             fecha_llegada_estimada=timezone.now()
         )
         self.assertEqual(viaje.estado, 'programado')
+
+    def test_distancia_al_guardar(self):
+        viaje = Viaje.objects.create(
+            bus=self.bus, conductor=self.conductor,
+            lugar_origen=self.lugar_origen, lugar_destino=self.lugar_destino,
+            fecha_salida=timezone.now(), fecha_llegada_estimada=timezone.now(),
+        )
+        self.assertIsNone(viaje.distancia_km)
+        # Quito -> Guayaquil
+        viaje.latitud_origen, viaje.longitud_origen = Decimal('-0.1807'), Decimal('-78.4678')
+        viaje.latitud_destino, viaje.longitud_destino = Decimal('-2.1894'), Decimal('-79.8890')
+        viaje.save(update_fields=['latitud_origen', 'longitud_origen', 'latitud_destino', 'longitud_destino'])
+        self.assertEqual(Viaje.objects.get(pk=viaje.pk).distancia_km, Decimal('273.59'))
+
+    def test_recalcular_por_lotes(self):
+        for _ in range(3):
+            Viaje.objects.create(
+                bus=self.bus, conductor=self.conductor,
+                lugar_origen=self.lugar_origen, lugar_destino=self.lugar_destino,
+                fecha_salida=timezone.now(), fecha_llegada_estimada=timezone.now(),
+            )
+        # update() no pasa por save(): la distancia queda desactualizada
+        Viaje.objects.update(latitud_origen=0, longitud_origen=0, latitud_destino=0, longitud_destino=1)
+        self.assertEqual(recalcular_distancias(tamano_lote=2), 3)
+        self.assertEqual(set(Viaje.objects.values_list('distancia_km', flat=True)), {Decimal('111.20')})
+        # Sin cambios no se escribe nada
+        salida = StringIO()
+        call_command('calcular_distancias', stdout=salida)
+        self.assertIn('0 viajes actualizados', salida.getvalue())
+
+    def test_distancias_vectorizadas_igual_que_una_a_una(self):
+        puntos = [(-0.1807, -78.4678, -2.1894, -79.8890), (10, 20, -30, 140), (None, 1, 2, 3)]
+        self.assertEqual(distancias_km(*zip(*puntos)), [distancia_km(*punto) for punto in puntos])
+
+
+class ViajeListTestCase(DatosViajeMixin, TestCase):
+    def setUp(self):
+        self.crear_datos()
+
+    def crear_viajes(self, cantidad):
+        inicio = timezone.now()
+        for i in range(cantidad):
+            viaje = Viaje.objects.create(
+                bus=self.bus,
+                conductor=self.conductor,
+                lugar_origen=self.lugar_origen,
+                lugar_destino=self.lugar_destino,
+                # Pares de viajes con la misma fecha para probar el desempate por id
+                fecha_salida=inicio - timedelta(hours=i // 2),
+                fecha_llegada_estimada=timezone.now()
+            )
+            pasajero = Pasajero.objects.create(
+                nombre_completo=f'Pasajero {viaje.pk}',
+                rut=f'{viaje.pk}-9',
+                telefono='0987654321',
+                correo='pasajero@example.com'
+            )
+            ViajePasajero.objects.create(viaje=viaje, pasajero=pasajero)
+
+    def test_pasajeros_anotados(self):
+        self.crear_viajes(1)
+        response = self.client.get(reverse('viajes:viaje_list'))
+        self.assertEqual(response.context['viajes'][0].num_pasajeros, 1)
+
+    def test_consultas_constantes_por_pagina(self):
+        # Conteo del paginador y una consulta para las filas; los filtros no
+        # cargan opciones
+        self.crear_viajes(3)
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('viajes:viaje_list'))
+        self.assertNotContains(response, '<option value="%s"' % self.lugar_origen.pk)
+        self.crear_viajes(40)
+        with self.assertNumQueries(2):
+            self.client.get(reverse('viajes:viaje_list'))
+
+    def test_cursor_recorre_todos_los_viajes(self):
+        self.crear_viajes(45)
+        esperados = list(
+            Viaje.objects.order_by('-fecha_salida', '-id').values_list('id', flat=True)
+        )
+        vistos = []
+        cursor = ''
+        while cursor is not None:
+            data = self.client.get(reverse('viajes:viaje_list_json'), {'cursor': cursor}).json()
+            vistos.extend(viaje['id'] for viaje in data['results'])
+            cursor = data['next']
+        self.assertEqual(vistos, esperados)
+
+    def test_cursor_anterior_vuelve_a_la_pagina_previa(self):
+        self.crear_viajes(45)
+        url = reverse('viajes:viaje_list_json')
+        primera = self.client.get(url).json()
+        segunda = self.client.get(url, {'cursor': primera['next']}).json()
+        self.assertIsNone(primera['previous'])
+        de_vuelta = self.client.get(url, {'cursor': segunda['previous']}).json()
+        self.assertEqual(de_vuelta['results'], primera['results'])
+        self.assertIsNone(de_vuelta['previous'])
+
+    def test_cursor_sin_conteo(self):
+        self.crear_viajes(45)
+        primera = self.client.get(reverse('viajes:viaje_list_json')).json()
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('viajes:viaje_list'), {'cursor': primera['next']})
+        self.assertTrue(response.context['modo_cursor'])
+        self.assertEqual(len(response.context['viajes']), 20)
+
+    def test_cursor_invalido(self):
+        response = self.client.get(reverse('viajes:viaje_list_json'), {'cursor': 'xyz'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_filtros(self):
+        self.crear_viajes(4)
+        otro_destino = Lugar.objects.create(nombre='Loja', ciudad='Loja')
+        viaje = Viaje.objects.first()
+        viaje.estado = 'completado'
+        viaje.lugar_destino = otro_destino
+        viaje.save()
+        url = reverse('viajes:viaje_list_json')
+
+        data = self.client.get(url, {'estado': 'completado'}).json()
+        self.assertEqual([v['id'] for v in data['results']], [viaje.pk])
+        data = self.client.get(url, {'destino': otro_destino.pk, 'bus': self.bus.pk}).json()
+        self.assertEqual([v['id'] for v in data['results']], [viaje.pk])
+        data = self.client.get(url, {'placa': 'abc'}).json()
+        self.assertEqual(len(data['results']), 4)
+
+        hoy = timezone.localdate()
+        data = self.client.get(url, {'desde': hoy - timedelta(days=1), 'hasta': hoy}).json()
+        self.assertTrue(data['results'])
+        data = self.client.get(url, {'desde': hoy + timedelta(days=1)}).json()
+        self.assertEqual(data['results'], [])
+
+        response = self.client.get(reverse('viajes:viaje_list'), {'estado': 'completado'})
+        self.assertEqual(list(response.context['viajes']), [viaje])
+
+    def test_filtro_invalido(self):
+        response = self.client.get(reverse('viajes:viaje_list_json'), {'desde': 'ayer'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_buscador_de_filtros(self):
+        url = reverse('viajes:buscar_filtro_viajes')
+        data = self.client.get(url, {'tipo': 'lugar', 'q': 'cue'}).json()
+        self.assertEqual(data['results'], [{'id': self.lugar_destino.pk, 'texto': str(self.lugar_destino)}])
+        data = self.client.get(url, {'tipo': 'conductor', 'q': 'pér'}).json()
+        self.assertEqual([fila['id'] for fila in data['results']], [self.conductor.pk])
+        data = self.client.get(url, {'tipo': 'bus', 'q': 'abc'}).json()
+        self.assertEqual([fila['id'] for fila in data['results']], [self.bus.pk])
+        self.assertEqual(self.client.get(url, {'tipo': 'pasajero', 'q': 'a'}).status_code, 400)
+
+        # El filtro elegido se muestra con su nombre
+        response = self.client.get(reverse('viajes:viaje_list'), {'destino': self.lugar_destino.pk})
+        self.assertContains(response, f'value="{self.lugar_destino}"')
+
+
+class ConflictosTestCase(TestCase):
+    def setUp(self):
+        self.conductores = [
+            Conductor.objects.create(
+                nombre=f'Conductor {i}', apellido='Pérez', cedula=f'12345678{i:02d}',
+                email=f'c{i}@example.com', telefono='0987654321', fecha_contratacion='2024-01-01'
+            )
+            for i in range(2)
+        ]
+        self.buses = [
+            Bus.objects.create(
+                placa=f'BUS{i}', modelo='Mercedes Benz', año_fabricacion=2020, capacidad_pasajeros=50,
+                numero_chasis=f'CH{i}', numero_motor=f'MO{i}', fecha_adquisicion='2020-05-15'
+            )
+            for i in range(2)
+        ]
+        self.origen = Lugar.objects.create(nombre='Quito', ciudad='Quito')
+        self.destino = Lugar.objects.create(nombre='Cuenca', ciudad='Cuenca')
+        self.inicio = timezone.now().replace(second=0, microsecond=0) + timedelta(days=1)
+        self.viaje = self.crear_viaje(self.buses[0], self.conductores[0], 0, 4)
+
+    def crear_viaje(self, bus, conductor, desde_hora, hasta_hora, estado='programado'):
+        return Viaje.objects.create(
+            bus=bus, conductor=conductor, lugar_origen=self.origen, lugar_destino=self.destino,
+            fecha_salida=self.inicio + timedelta(hours=desde_hora),
+            fecha_llegada_estimada=self.inicio + timedelta(hours=hasta_hora),
+            estado=estado,
+        )
+
+    def formulario(self, bus, conductor, desde_hora, hasta_hora, instance=None):
+        formato = '%Y-%m-%dT%H:%M'
+        return ViajeForm(data={
+            'bus': bus.pk, 'conductor': conductor.pk,
+            'lugar_origen': self.origen.pk, 'lugar_destino': self.destino.pk,
+            'fecha_salida': timezone.localtime(self.inicio + timedelta(hours=desde_hora)).strftime(formato),
+            'fecha_llegada_estimada': timezone.localtime(self.inicio + timedelta(hours=hasta_hora)).strftime(formato),
+            'estado': 'programado',
+        }, instance=instance)
+
+    def test_formulario_rechaza_superposicion(self):
+        form = self.formulario(self.buses[0], self.conductores[1], 3, 6)
+        self.assertFalse(form.is_valid())
+        self.assertIn('bus', form.errors)
+        self.assertIn(f'#{self.viaje.pk}', form.errors['bus'][0])
+        self.assertNotIn('conductor', form.errors)
+
+        form = self.formulario(self.buses[1], self.conductores[0], -2, 1)
+        self.assertFalse(form.is_valid())
+        self.assertIn('conductor', form.errors)
+
+    def test_formulario_acepta_horarios_validos(self):
+        # Salir cuando llega el viaje anterior no es un conflicto
+        self.assertTrue(self.formulario(self.buses[0], self.conductores[0], 4, 8).is_valid())
+        self.assertTrue(self.formulario(self.buses[1], self.conductores[1], 0, 4).is_valid())
+        # Editar el mismo viaje no choca consigo mismo
+        self.assertTrue(self.formulario(self.buses[0], self.conductores[0], 1, 5, instance=self.viaje).is_valid())
+        # Los viajes cancelados no ocupan al bus
+        self.viaje.estado = 'cancelado'
+        self.viaje.save()
+        self.assertTrue(self.formulario(self.buses[0], self.conductores[0], 1, 3).is_valid())
+
+    def test_formulario_llegada_posterior_a_salida(self):
+        form = self.formulario(self.buses[1], self.conductores[1], 4, 4)
+        self.assertFalse(form.is_valid())
+        self.assertIn('fecha_llegada_estimada', form.errors)
+
+    def test_agenda_con_superposiciones_previas(self):
+        # Cargados por el admin o por altas concurrentes antes de la validación
+        largo = self.crear_viaje(self.buses[1], self.conductores[1], 8, 20)
+        self.crear_viaje(self.buses[1], self.conductores[1], 9, 10)
+        form = self.formulario(self.buses[1], self.conductores[0], 12, 13)
+        self.assertFalse(form.is_valid())
+        self.assertIn(f'#{largo.pk}', form.errors['bus'][0])
+        self.assertEqual(
+            [viaje.pk for _, viaje in conflictos_de_horario(
+                self.inicio + timedelta(hours=12), self.inicio + timedelta(hours=13), bus_id=self.buses[1].pk
+            )],
+            [largo.pk],
+        )
+
+    def test_formulario_duracion_maxima(self):
+        horas = int(DURACION_MAXIMA.total_seconds() // 3600)
+        form = self.formulario(self.buses[1], self.conductores[1], 10, 10 + horas + 1)
+        self.assertFalse(form.is_valid())
+        self.assertIn('fecha_llegada_estimada', form.errors)
+        self.assertTrue(self.formulario(self.buses[1], self.conductores[1], 10, 10 + horas).is_valid())
+
+    def test_barrido_igual_a_comparar_todos_los_pares(self):
+        aleatorio = random.Random(7)
+        for _ in range(60):
+            desde = aleatorio.randrange(0, 200)
+            self.crear_viaje(
+                aleatorio.choice(self.buses), aleatorio.choice(self.conductores),
+                desde, desde + aleatorio.randrange(1, 12),
+                estado=aleatorio.choice(['programado', 'completado', 'cancelado']),
+            )
+        viajes = list(Viaje.objects.exclude(estado='cancelado'))
+        esperados = {
+            (recurso, *sorted((a.pk, b.pk)))
+            for recurso in ('bus', 'conductor')
+            for i, a in enumerate(viajes)
+            for b in viajes[i + 1:]
+            if getattr(a, f'{recurso}_id') == getattr(b, f'{recurso}_id')
+            and a.fecha_salida < b.fecha_llegada_estimada and b.fecha_salida < a.fecha_llegada_estimada
+        }
+        conflictos = detectar_conflictos()
+        self.assertEqual(len(conflictos), len(esperados))
+        self.assertEqual({(c.recurso, *sorted((c.viaje_a, c.viaje_b))) for c in conflictos}, esperados)
+
+        desde = self.inicio + timedelta(hours=100)
+        filtrados = detectar_conflictos(desde=desde)
+        self.assertTrue(filtrados)
+        self.assertTrue(all(conflicto.fin > desde for conflicto in filtrados))
+
+    def test_reporte(self):
+        otro = self.crear_viaje(self.buses[0], self.conductores[1], 2, 6)
+        response = self.client.get(reverse('viajes:conflictos'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['total'], 1)
+        fila = response.context['filas'][0]
+        self.assertEqual(fila['recurso'], self.buses[0])
+        self.assertEqual((fila['viaje_a'], fila['viaje_b']), (self.viaje, otro))
+
+        response = self.client.get(reverse('viajes:conflictos'), {'recurso': 'conductor'})
+        self.assertEqual(response.context['total'], 0)
+
+        out = StringIO()
+        call_command('detectar_conflictos', stdout=out)
+        self.assertIn('1 de buses y 0 de conductores', out.getvalue())
+
+
+@skipUnless(numpy_disponible(), 'NumPy no está instalado')
+class AsignacionTestCase(TestCase):
+    def setUp(self):
+        self.conductores = [
+            Conductor.objects.create(
+                nombre=f'Conductor {i}', apellido='Pérez', cedula=f'22345678{i:02d}', activo=i < 2,
+                email=f'a{i}@example.com', telefono='0987654321', fecha_contratacion='2024-01-01'
+            )
+            for i in range(3)
+        ]
+        self.bus_chico, self.bus_grande, self.bus_inactivo = [
+            Bus.objects.create(
+                placa=f'ASG{i}', modelo='Mercedes Benz', año_fabricacion=2020, capacidad_pasajeros=capacidad,
+                numero_chasis=f'ACH{i}', numero_motor=f'AMO{i}', fecha_adquisicion='2020-05-15', estado=estado
+            )
+            for i, (capacidad, estado) in enumerate([(10, 'activo'), (50, 'activo'), (100, 'inactivo')])
+        ]
+        self.quito = Lugar.objects.create(nombre='Quito', ciudad='Quito', latitud=Decimal('-0.180653'), longitud=Decimal('-78.467834'))
+        self.cuenca = Lugar.objects.create(nombre='Cuenca', ciudad='Cuenca', latitud=Decimal('-2.900128'), longitud=Decimal('-79.005896'))
+        self.dia = timezone.localdate() + timedelta(days=1)
+        self.inicio = timezone.make_aware(datetime.combine(self.dia, datetime.min.time()))
+
+    def crear_viaje(self, origen, destino, desde_hora, hasta_hora, pasajeros=0, bus=None, conductor=None, estado='programado'):
+        return Viaje.objects.create(
+            bus=bus, conductor=conductor or self.conductores[1], lugar_origen=origen, lugar_destino=destino,
+            fecha_salida=self.inicio + timedelta(hours=desde_hora),
+            fecha_llegada_estimada=self.inicio + timedelta(hours=hasta_hora),
+            pasajeros_confirmados=pasajeros, estado=estado,
+        )
+
+    def planificar(self, **kwargs):
+        return planificar(self.inicio, self.inicio + timedelta(days=1), **kwargs)
+
+    def test_respeta_restricciones_y_encadena(self):
+        ida = self.crear_viaje(self.quito, self.cuenca, 8, 12, pasajeros=30)
+        vuelta = self.crear_viaje(self.cuenca, self.quito, 13, 17, pasajeros=5)
+        simultaneo = self.crear_viaje(self.quito, self.cuenca, 9, 11, pasajeros=5)
+        imposible = self.crear_viaje(self.quito, self.cuenca, 9, 11, pasajeros=80, conductor=self.conductores[2])
+
+        plan = self.planificar(reasignar=True)
+        asignado = {a.viaje_id: a for a in plan.asignaciones}
+        self.assertEqual(asignado[ida.pk].bus_id, self.bus_grande.pk)
+        # La vuelta sigue con el bus y el conductor que ya están en Cuenca
+        self.assertEqual(asignado[vuelta.pk].bus_id, self.bus_grande.pk)
+        self.assertEqual(asignado[vuelta.pk].conductor_id, asignado[ida.pk].conductor_id)
+        self.assertEqual(asignado[vuelta.pk].vacio_km, 0)
+        self.assertEqual(asignado[simultaneo.pk].bus_id, self.bus_chico.pk)
+        self.assertNotEqual(asignado[simultaneo.pk].conductor_id, asignado[ida.pk].conductor_id)
+        self.assertEqual([viaje_id for viaje_id, _ in plan.sin_asignar], [imposible.pk])
+        self.assertIn('80 pasajeros', plan.sin_asignar[0][1])
+        self.assertFalse({a.conductor_id for a in plan.asignaciones} & {self.conductores[2].pk})
+
+        # Vista previa: nada cambia hasta aplicar
+        self.assertIsNone(Viaje.objects.get(pk=ida.pk).bus_id)
+        self.assertEqual(aplicar(plan), 3)
+        self.assertEqual(Viaje.objects.get(pk=vuelta.pk).bus_id, self.bus_grande.pk)
+        self.assertEqual(detectar_conflictos(), [])
+        self.assertEqual(self.planificar().asignaciones, [])
+
+    def test_sin_reasignar_conserva_el_conductor(self):
+        ida = self.crear_viaje(self.quito, self.cuenca, 8, 12, conductor=self.conductores[1])
+        vuelta = self.crear_viaje(self.cuenca, self.quito, 13, 17, conductor=self.conductores[1])
+        plan = self.planificar()
+        self.assertEqual(
+            {a.viaje_id: a.conductor_id for a in plan.asignaciones},
+            {ida.pk: self.conductores[1].pk, vuelta.pk: self.conductores[1].pk},
+        )
+        aplicar(plan)
+        self.assertEqual(
+            set(Viaje.objects.values_list('conductor_id', flat=True)), {self.conductores[1].pk}
+        )
+
+    def test_sin_reasignar_conductor_inactivo(self):
+        viaje = self.crear_viaje(self.quito, self.cuenca, 8, 12, conductor=self.conductores[2])
+        plan = self.planificar()
+        self.assertEqual(plan.asignaciones, [])
+        self.assertEqual(plan.sin_asignar, [(viaje.pk, 'El conductor del viaje no está activo.')])
+
+    def test_sin_reasignar_conductor_ocupado(self):
+        self.crear_viaje(self.quito, self.cuenca, 8, 12, bus=self.bus_chico, conductor=self.conductores[0], estado='en_curso')
+        ocupado = self.crear_viaje(self.quito, self.cuenca, 9, 11, conductor=self.conductores[0])
+        libre = self.crear_viaje(self.quito, self.cuenca, 9, 11)
+        # Dos viajes planificados a la vez con el mismo conductor
+        primero = self.crear_viaje(self.quito, self.cuenca, 17, 20)
+        segundo = self.crear_viaje(self.quito, self.cuenca, 18, 21)
+
+        plan = self.planificar()
+        self.assertEqual({a.viaje_id for a in plan.asignaciones}, {libre.pk, primero.pk})
+        motivo = 'El conductor del viaje tiene otro viaje en ese horario.'
+        self.assertEqual(plan.sin_asignar, [(ocupado.pk, motivo), (segundo.pk, motivo)])
+
+    def test_viajes_fijos_ocupan_bus_y_conductor(self):
+        self.crear_viaje(self.quito, self.cuenca, 8, 12, bus=self.bus_grande, conductor=self.conductores[0], estado='en_curso')
+        # Para volver a Quito a tiempo al viaje fijo no alcanza el tiempo en vacío
+        antes = self.crear_viaje(self.quito, self.cuenca, 2, 6, pasajeros=20)
+        plan = self.planificar()
+        self.assertEqual(plan.asignaciones, [])
+        self.assertIn('horario', plan.sin_asignar[0][1])
+
+        antes.fecha_llegada_estimada = self.inicio + timedelta(hours=3)
+        antes.lugar_destino = self.quito
+        antes.save()
+        asignacion, = self.planificar().asignaciones
+        self.assertEqual(asignacion.bus_id, self.bus_grande.pk)
+
+    def test_plan_desactualizado(self):
+        viaje = self.crear_viaje(self.quito, self.cuenca, 8, 12)
+        plan = self.planificar()
+        Viaje.objects.filter(pk=viaje.pk).update(bus=self.bus_chico)
+        with self.assertRaises(PlanDesactualizado):
+            aplicar(plan)
+        # Con reasignar se planifican también los viajes con bus
+        self.assertEqual(len(self.planificar(reasignar=True).asignaciones), 1)
+
+    def test_vista_y_comando(self):
+        viaje = self.crear_viaje(self.quito, self.cuenca, 8, 12, pasajeros=30)
+        parametros = {'desde': self.dia.isoformat(), 'hasta': self.dia.isoformat()}
+        response = self.client.get(reverse('viajes:asignacion'), parametros)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['cambios'], 1)
+        self.assertIsNone(Viaje.objects.get(pk=viaje.pk).bus_id)
+
+        out = StringIO()
+        call_command('asignar_viajes', '--desde', parametros['desde'], '--hasta', parametros['hasta'], stdout=out)
+        self.assertIn('1 cambios por aplicar', out.getvalue())
+
+        # Se aplica solo el plan de la vista previa
+        huella = response.context['huella']
+        self.assertContains(response, f'name="huella" value="{huella}"')
+        self.crear_viaje(self.quito, self.cuenca, 14, 18, conductor=self.conductores[0])
+        response = self.client.post(reverse('viajes:asignacion'), dict(parametros, huella=huella))
+        self.assertIsNone(Viaje.objects.get(pk=viaje.pk).bus_id)
+        self.assertIn('cambió desde la vista previa', str(list(get_messages(response.wsgi_request))[0]))
+
+        huella = self.client.get(reverse('viajes:asignacion'), parametros).context['huella']
+        response = self.client.post(reverse('viajes:asignacion'), dict(parametros, huella=huella))
+        self.assertRedirects(response, f"{reverse('viajes:asignacion')}?desde={parametros['desde']}&hasta={parametros['hasta']}")
+        self.assertEqual(Viaje.objects.get(pk=viaje.pk).bus_id, self.bus_grande.pk)
+
+    def test_comando_benchmark_revierte_los_datos(self):
+        viajes = Viaje.objects.count()
+        out = StringIO()
+        call_command(
+            'benchmark_asignacion', '--viajes', '40', '--buses', '4', '--conductores', '4', '--lugares', '5',
+            stdout=out,
+        )
+        self.assertIn('datos revertidos', out.getvalue())
+        self.assertEqual(Viaje.objects.count(), viajes)
+        self.assertFalse(Bus.objects.filter(placa__startswith='BENCH').exists())
+
+
+class ReservaTestCase(DatosViajeMixin, TestCase):
+    def setUp(self):
+        self.crear_datos(capacidad=2)
+        self.crear_viaje_con_pasajeros(3)
+
+    def test_capacidad_y_contador(self):
+        reservar_asiento(self.viaje, self.pasajeros[0], asiento='1')
+        reservar_asiento(self.viaje, self.pasajeros[1], asiento='')
+        with self.assertRaises(CapacidadExcedida):
+            reservar_asiento(self.viaje, self.pasajeros[2])
+        self.viaje.refresh_from_db()
+        self.assertEqual(self.viaje.pasajeros_confirmados, 2)
+
+        self.assertTrue(liberar_asiento(self.viaje, self.pasajeros[0]))
+        self.assertFalse(liberar_asiento(self.viaje, self.pasajeros[0]))
+        self.viaje.refresh_from_db()
+        self.assertEqual(self.viaje.pasajeros_confirmados, 1)
+
+    def test_reconciliar_contador(self):
+        reservar_asiento(self.viaje, self.pasajeros[0])
+        # Un alta directa (admin, cargas) no pasa por reservar_asiento
+        ViajePasajero.objects.create(viaje=self.viaje, pasajero=self.pasajeros[1])
+        self.assertEqual(reconciliar_pasajeros_confirmados(), 1)
+        self.viaje.refresh_from_db()
+        self.assertEqual(self.viaje.pasajeros_confirmados, 2)
+        self.assertEqual(reconciliar_pasajeros_confirmados(), 0)
+
+    def test_editar_viaje_no_pisa_contador(self):
+        # El formulario de edición se carga antes de una reserva y se guarda después
+        cargado = Viaje.objects.get(pk=self.viaje.pk)
+        reservar_asiento(self.viaje, self.pasajeros[0])
+        cargado.observaciones = 'Cambio de andén'
+        cargado.save()
+        self.viaje.refresh_from_db()
+        self.assertEqual(self.viaje.pasajeros_confirmados, 1)
+        self.assertEqual(self.viaje.observaciones, 'Cambio de andén')
+
+    def test_duplicados_no_alteran_contador(self):
+        reservar_asiento(self.viaje, self.pasajeros[0], asiento='1')
+        with self.assertRaises(PasajeroDuplicado):
+            reservar_asiento(self.viaje, self.pasajeros[0], asiento='2')
+        with self.assertRaises(AsientoOcupado):
+            reservar_asiento(self.viaje, self.pasajeros[1], asiento='1')
+        self.viaje.refresh_from_db()
+        self.assertEqual(self.viaje.pasajeros_confirmados, 1)
+
+    def test_vista_agregar(self):
+        url = reverse('viajes:agregar_pasajero_viaje', args=[self.viaje.pk])
+        for pasajero in self.pasajeros:
+            self.client.post(url, {'pasajero_id': pasajero.pk, 'asiento': ''})
+        self.viaje.refresh_from_db()
+        self.assertEqual(self.viaje.pasajeros_confirmados, 2)
+        self.assertEqual(self.viaje.pasajeros.count(), 2)
+
+    def test_grupo_todo_o_nada(self):
+        reservar_asiento(self.viaje, self.pasajeros[0], asiento='1')
+        with self.assertRaises(CapacidadExcedida):
+            reservar_grupo(self.viaje, [(self.pasajeros[1], None), (self.pasajeros[2], None)])
+        with self.assertRaises(AsientoOcupado):
+            reservar_grupo(self.viaje, [(self.pasajeros[1], '1')])
+        self.viaje.refresh_from_db()
+        self.assertEqual(self.viaje.pasajeros_confirmados, 1)
+        self.assertEqual(len(reservar_grupo(self.viaje, [(self.pasajeros[1], '2')])), 1)
+        self.viaje.refresh_from_db()
+        self.assertEqual(self.viaje.pasajeros_confirmados, 2)
+
+    def test_vista_grupo(self):
+        self.viaje.bus.capacidad_pasajeros = 50
+        self.viaje.bus.save()
+        url = reverse('viajes:agregar_grupo_viaje', args=[self.viaje.pk])
+        texto = f"{self.pasajeros[0].rut}, 1\n{self.pasajeros[1].pk};2\n\n"
+        self.client.post(url, {'pasajeros': texto})
+        self.assertEqual(
+            set(self.viaje.viajepasajero_set.values_list('asiento', flat=True)), {'1', '2'}
+        )
+
+        response = self.client.post(
+            url,
+            json.dumps({'pasajeros': [{'pasajero': 'no-existe'}]}),
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 400)
+
+        # Viaje, búsqueda de pasajeros, UPDATE del contador e INSERT masivo
+        # (más el savepoint de la transacción)
+        nuevos = [
+            Pasajero(nombre_completo=f'Grupo {i}', rut=f'G{i}', telefono='0', correo='g@example.com')
+            for i in range(40)
+        ]
+        Pasajero.objects.bulk_create(nuevos)
+        with self.assertNumQueries(6):
+            response = self.client.post(
+                url,
+                json.dumps({'pasajeros': [f'G{i}' for i in range(40)]}),
+                content_type='application/json'
+            )
+        self.assertEqual(response.json(), {'inscritos': 40})
+        self.viaje.refresh_from_db()
+        self.assertEqual(self.viaje.pasajeros_confirmados, 42)
+
+    def test_vista_grupo_datos_invalidos(self):
+        self.viaje.bus.capacidad_pasajeros = 50
+        self.viaje.bus.save()
+        url = reverse('viajes:agregar_grupo_viaje', args=[self.viaje.pk])
+        rut = self.pasajeros[0].rut
+        for cuerpo in (
+            '["no", "es", "un", "objeto"]',
+            'null',
+            '{"pasajeros": "%s"}' % rut,
+            '{"pasajeros": [{"pasajero": "%s", "asiento": {"fila": 1}}]}' % rut,
+            '{"pasajeros": [{"pasajero": "%s", "asiento": "12345678901"}]}' % rut,
+            '{no es json',
+        ):
+            with self.subTest(cuerpo=cuerpo):
+                response = self.client.post(url, cuerpo, content_type='application/json')
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('error', response.json())
+        self.assertFalse(self.viaje.viajepasajero_set.exists())
+
+        # Los asientos numéricos se guardan como texto
+        response = self.client.post(
+            url,
+            json.dumps({'pasajeros': [{'pasajero': str(self.pasajeros[0].pk), 'asiento': 5}]}),
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.viaje.viajepasajero_set.get().asiento, '5')
+
+    def test_asiento_demasiado_largo(self):
+        with self.assertRaises(AsientoInvalido):
+            reservar_asiento(self.viaje, self.pasajeros[0], asiento='X' * 11)
+        self.viaje.refresh_from_db()
+        self.assertEqual(self.viaje.pasajeros_confirmados, 0)
+
+    def test_buscar_pasajeros(self):
+        reservar_asiento(self.viaje, self.pasajeros[0])
+        url = reverse('viajes:buscar_pasajeros_viaje', args=[self.viaje.pk])
+        data = self.client.get(url, {'q': 'pasa'}).json()
+        self.assertEqual([p['id'] for p in data['results']], [self.pasajeros[1].pk, self.pasajeros[2].pk])
+        self.assertFalse(data['more'])
+        data = self.client.get(url, {'q': '2-'}).json()
+        self.assertEqual([p['id'] for p in data['results']], [self.pasajeros[2].pk])
+        self.assertEqual(self.client.get(url).json()['results'], [])
+
+    def test_pagina_pasajeros_no_carga_disponibles(self):
+        response = self.client.get(reverse('viajes:viaje_pasajeros', args=[self.viaje.pk]))
+        self.assertNotContains(response, self.pasajeros[0].nombre_completo)
+
+
+@skipUnlessDBFeature('test_db_allows_multiple_connections')
+class ReservaConcurrenteTestCase(DatosViajeMixin, TransactionTestCase):
+    CAPACIDAD = 10
+    HILOS = 40
+
+    def setUp(self):
+        self.crear_datos(capacidad=self.CAPACIDAD)
+        self.crear_viaje_con_pasajeros(self.HILOS)
+
+    def test_sin_sobreventa(self):
+        viaje = Viaje.objects.select_related('bus').get(pk=self.viaje.pk)
+        barrera = threading.Barrier(self.HILOS)
+        resultados = []
+        errores = []
+
+        def reservar(pasajero, asiento):
+            try:
+                barrera.wait()
+                reservar_asiento(viaje, pasajero, asiento=asiento)
+                resultados.append('ok')
+            except ReservaError:
+                resultados.append('rechazada')
+            except Exception as e:
+                errores.append(e)
+            finally:
+                connection.close()
+
+        # La mitad de los hilos compite además por el mismo asiento
+        hilos = [
+            threading.Thread(target=reservar, args=(pasajero, '1' if i % 2 else None))
+            for i, pasajero in enumerate(self.pasajeros)
+        ]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+
+        self.assertEqual(errores, [])
+        self.assertEqual(len(resultados), self.HILOS)
+        viaje.refresh_from_db()
+        inscritos = ViajePasajero.objects.filter(viaje=viaje).count()
+        self.assertEqual(resultados.count('ok'), inscritos)
+        # Hay más pedidos sin asiento que lugares: el bus se llena sin pasarse
+        self.assertEqual(inscritos, self.CAPACIDAD)
+        self.assertEqual(viaje.pasajeros_confirmados, inscritos)
+        self.assertEqual(ViajePasajero.objects.filter(viaje=viaje, asiento='1').count(), 1)
@@ -6,6 +6,10 @@ app_name = 'viajes'
 urlpatterns = [
     # Viajes
     path('', views.ViajeListView.as_view(), name='viaje_list'),
+    path('json/', views.viaje_list_json, name='viaje_list_json'),
+    path('filtros/buscar/', views.buscar_filtro_viajes, name='buscar_filtro_viajes'),
+    path('conflictos/', views.conflictos_view, name='conflictos'),
+    path('asignacion/', views.asignacion_view, name='asignacion'),
     path('nuevo/', views.ViajeCreateView.as_view(), name='viaje_create'),
     path('<int:pk>/', views.ViajeDetailView.as_view(), name='viaje_detail'),
     path('<int:pk>/editar/', views.ViajeUpdateView.as_view(), name='viaje_update'),
@@ -13,7 +17,9 @@ urlpatterns = [
     
     # Gestión de pasajeros en viajes
     path('<int:pk>/pasajeros/', views.viaje_pasajeros_view, name='viaje_pasajeros'),
+    path('<int:pk>/pasajeros/buscar/', views.buscar_pasajeros_viaje, name='buscar_pasajeros_viaje'),
     path('<int:pk>/pasajeros/agregar/', views.agregar_pasajero_viaje, name='agregar_pasajero_viaje'),
+    path('<int:pk>/pasajeros/agregar-grupo/', views.agregar_grupo_viaje, name='agregar_grupo_viaje'),
     path('<int:pk>/pasajeros/<int:pasajero_pk>/quitar/', views.quitar_pasajero_viaje, name='quitar_pasajero_viaje'),
     path('<int:pk>/pasajeros/<int:pasajero_pk>/editar/', views.editar_pasajero_viaje, name='editar_pasajero_viaje'),
     
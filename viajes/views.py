@@ -1,16 +1,45 @@
+import json
+from itertools import groupby
+from operator import attrgetter
 from django.shortcuts import render, get_object_or_404, redirect
 from django.views.generic import ListView, DetailView, CreateView, UpdateView, DeleteView
-from django.urls import reverse_lazy
+from django.urls import reverse, reverse_lazy
 from django.contrib import messages
 from django.forms import ModelForm
 from django import forms
+from django.core.paginator import Paginator
 from django.utils import timezone
+from django.utils.http import urlencode
+from datetime import datetime, time, timedelta
 from django.http import JsonResponse
-from django.db import transaction
+from django.views.decorators.http import require_safe
+from django.db import transaction, IntegrityError
+from django.db.models import Count, Exists, OuterRef, Q
 from .models import Viaje, ViajePasajero
+from .asignacion import PlanDesactualizado, aplicar, cambios, huella_plan, planificar
+from .conflictos import DURACION_MAXIMA, ESTADOS_SIN_CONFLICTO, conflictos_de_horario, detectar_conflictos
+from .paginacion import paginar_por_cursor, CursorInvalido
+from .reservas import (
+    reservar_asiento, reservar_grupo, resolver_pasajeros, liberar_asiento, normalizar_asiento, ReservaError
+)
+from core.cache import CacheModelosMixin, cache_por_modelos
 from core.models import Conductor, Lugar, Pasajero
 from flota.models import Bus
 from costos.models import CostosViaje, Peaje
+from flota.pronostico import NumpyNoDisponible
+
+# Resultados por página del buscador de pasajeros
+PASAJEROS_POR_BUSQUEDA = 10
+# Resultados del buscador de los filtros del listado
+RESULTADOS_POR_BUSQUEDA = 10
+# Viajes en conflicto que se nombran en el error del formulario
+CONFLICTOS_EN_MENSAJE = 3
+# Filas por página del reporte de conflictos
+CONFLICTOS_POR_PAGINA = 50
+# Filas de la vista previa de asignación
+ASIGNACIONES_EN_PANTALLA = 200
+# Modelos que se muestran en el listado de viajes (invalidan su caché)
+MODELOS_LISTADO = (Viaje, ViajePasajero, Bus, Conductor, Lugar)
 
 
 class ViajeForm(ModelForm):
@@ -19,7 +48,7 @@ class ViajeForm(ModelForm):
         fields = [
             'bus', 'conductor', 'lugar_origen', 'lugar_destino',
             'fecha_salida', 'fecha_llegada_estimada', 'fecha_llegada_real',
-            'estado', 'observaciones'
+            'kilometraje_llegada', 'estado', 'observaciones'
         ]
         widgets = {
             'bus': forms.Select(attrs={'class': 'form-control'}),
@@ -41,6 +70,11 @@ class ViajeForm(ModelForm):
                 'type': 'datetime-local',
                 'placeholder': 'Fecha y hora real de llegada (opcional)'
             }),
+            'kilometraje_llegada': forms.NumberInput(attrs={
+                'class': 'form-control',
+                'min': 0,
+                'placeholder': 'Odómetro al llegar (opcional)'
+            }),
             'estado': forms.Select(attrs={'class': 'form-control'}),
             'observaciones': forms.Textarea(attrs={
                 'class': 'form-control',
@@ -49,6 +83,49 @@ class ViajeForm(ModelForm):
             }),
         }
     
+    def clean(self):
+        cleaned_data = super().clean()
+        salida = cleaned_data.get('fecha_salida')
+        llegada = cleaned_data.get('fecha_llegada_estimada')
+        if not salida or not llegada:
+            return cleaned_data
+        if llegada <= salida:
+            self.add_error('fecha_llegada_estimada', 'La llegada estimada debe ser posterior a la salida.')
+            return cleaned_data
+        if llegada - salida > DURACION_MAXIMA:
+            horas = int(DURACION_MAXIMA.total_seconds() // 3600)
+            self.add_error('fecha_llegada_estimada', f'Un viaje no puede durar más de {horas} horas.')
+            return cleaned_data
+        if cleaned_data.get('estado') in ESTADOS_SIN_CONFLICTO:
+            return cleaned_data
+
+        bus = cleaned_data.get('bus')
+        conductor = cleaned_data.get('conductor')
+        conflictos = conflictos_de_horario(
+            salida, llegada,
+            bus_id=bus.pk if bus else None,
+            conductor_id=conductor.pk if conductor else None,
+            excluir=self.instance.pk,
+        )
+        for recurso, sujeto in (('bus', 'El bus'), ('conductor', 'El conductor')):
+            viajes = [viaje for campo, viaje in conflictos if campo == recurso]
+            if viajes:
+                self.add_error(recurso, self._mensaje_conflicto(sujeto, viajes))
+        return cleaned_data
+
+    @staticmethod
+    def _mensaje_conflicto(sujeto, viajes):
+        detalle = '; '.join(
+            f'#{viaje.pk} {viaje.lugar_origen.nombre} → {viaje.lugar_destino.nombre}, '
+            f'{timezone.localtime(viaje.fecha_salida):%d/%m/%Y %H:%M} a '
+            f'{timezone.localtime(viaje.fecha_llegada_estimada):%d/%m/%Y %H:%M}'
+            for viaje in viajes[:CONFLICTOS_EN_MENSAJE]
+        )
+        restantes = len(viajes) - CONFLICTOS_EN_MENSAJE
+        if restantes > 0:
+            detalle += f' y {restantes} más'
+        return f'{sujeto} ya tiene asignado un viaje en ese horario ({detalle}).'
+
     def save(self, commit=True):
         instance = super().save(commit=False)
         # Capturar coordenadas del lugar de origen
@@ -64,19 +141,199 @@ class ViajeForm(ModelForm):
         return instance
 
 
+class ViajeFiltroForm(forms.Form):
+    """
+    Filtros del listado de viajes. Cada combinación se apoya en un índice
+    compuesto (campo, fecha_salida) de Viaje.
+    """
+    estado = forms.ChoiceField(
+        required=False,
+        choices=[('', 'Todos los estados')] + Viaje.ESTADO_VIAJE,
+        widget=forms.Select(attrs={'class': 'form-select form-select-sm'})
+    )
+    desde = forms.DateField(
+        required=False,
+        widget=forms.DateInput(attrs={'class': 'form-control form-control-sm', 'type': 'date'})
+    )
+    hasta = forms.DateField(
+        required=False,
+        widget=forms.DateInput(attrs={'class': 'form-control form-control-sm', 'type': 'date'})
+    )
+    # Ids elegidos con el buscador (buscar_filtro_viajes): la página no
+    # carga la lista completa de buses, conductores ni lugares
+    bus = forms.ModelChoiceField(required=False, queryset=Bus.objects.only('id', 'placa', 'modelo'), widget=forms.HiddenInput)
+    conductor = forms.ModelChoiceField(
+        required=False, queryset=Conductor.objects.only('id', 'nombre', 'apellido'), widget=forms.HiddenInput
+    )
+    origen = forms.ModelChoiceField(required=False, queryset=Lugar.objects.only('id', 'nombre', 'ciudad'), widget=forms.HiddenInput)
+    destino = forms.ModelChoiceField(required=False, queryset=Lugar.objects.only('id', 'nombre', 'ciudad'), widget=forms.HiddenInput)
+    placa = forms.CharField(
+        required=False,
+        max_length=20,
+        widget=forms.TextInput(attrs={'class': 'form-control form-control-sm', 'placeholder': 'Buscar placa'})
+    )
+
+
+def filtrar_viajes(queryset, filtros):
+    """
+    Aplica en la base de datos los filtros validados por ViajeFiltroForm.
+
+    Las fechas se convierten en rangos sobre fecha_salida (sin funciones sobre
+    la columna) para que los índices compuestos sigan siendo utilizables.
+    """
+    if filtros.get('estado'):
+        queryset = queryset.filter(estado=filtros['estado'])
+    if filtros.get('desde'):
+        inicio = timezone.make_aware(datetime.combine(filtros['desde'], time.min))
+        queryset = queryset.filter(fecha_salida__gte=inicio)
+    if filtros.get('hasta'):
+        fin = timezone.make_aware(datetime.combine(filtros['hasta'] + timedelta(days=1), time.min))
+        queryset = queryset.filter(fecha_salida__lt=fin)
+    if filtros.get('bus'):
+        queryset = queryset.filter(bus_id=filtros['bus'].pk)
+    if filtros.get('conductor'):
+        queryset = queryset.filter(conductor_id=filtros['conductor'].pk)
+    if filtros.get('origen'):
+        queryset = queryset.filter(lugar_origen_id=filtros['origen'].pk)
+    if filtros.get('destino'):
+        queryset = queryset.filter(lugar_destino_id=filtros['destino'].pk)
+    if filtros.get('placa'):
+        # Búsqueda por prefijo: usa el índice único de Bus.placa
+        queryset = queryset.filter(bus__placa__istartswith=filtros['placa'])
+    return queryset
+
+
+# Búsqueda por prefijo de cada filtro, sobre columnas indexadas
+BUSQUEDAS_FILTRO = {
+    'bus': (Bus.objects.only('id', 'placa', 'modelo'), ('placa',), ('placa', 'id')),
+    'conductor': (Conductor.objects.only('id', 'nombre', 'apellido'), ('apellido', 'cedula'), ('apellido', 'nombre', 'id')),
+    'lugar': (Lugar.objects.only('id', 'nombre', 'ciudad'), ('nombre',), ('nombre', 'id')),
+}
+
+
+@require_safe
+def buscar_filtro_viajes(request):
+    """
+    Buscador (typeahead) de los filtros de bus, conductor y lugar del listado
+    de viajes.
+    """
+    busqueda = BUSQUEDAS_FILTRO.get(request.GET.get('tipo'))
+    if busqueda is None:
+        return JsonResponse({'error': 'Tipo de filtro inválido.'}, status=400)
+    q = request.GET.get('q', '').strip()
+    if not q:
+        return JsonResponse({'results': [], 'more': False})
+
+    queryset, campos, orden = busqueda
+    condicion = Q()
+    for campo in campos:
+        condicion |= Q(**{f'{campo}__istartswith': q})
+    filas = list(queryset.filter(condicion).order_by(*orden)[:RESULTADOS_POR_BUSQUEDA + 1])
+    return JsonResponse({
+        'results': [{'id': fila.pk, 'texto': str(fila)} for fila in filas[:RESULTADOS_POR_BUSQUEDA]],
+        'more': len(filas) > RESULTADOS_POR_BUSQUEDA,
+    })
+
+
 # Vistas para Viajes
-class ViajeListView(ListView):
+def viajes_para_listado():
+    """
+    Queryset del listado de viajes: una sola consulta con JOIN para bus,
+    conductor y lugares, y el conteo de pasajeros como anotación (evita un
+    COUNT por fila en la plantilla).
+    """
+    return (
+        Viaje.objects
+        .select_related('bus', 'conductor', 'lugar_origen', 'lugar_destino')
+        .annotate(num_pasajeros=Count('viajepasajero'))
+        .only(
+            'id', 'fecha_salida', 'estado', 'distancia_km',
+            'bus__placa', 'bus__capacidad_pasajeros',
+            'conductor__nombre', 'conductor__apellido',
+            'lugar_origen__nombre', 'lugar_destino__nombre',
+        )
+        .order_by('-fecha_salida')
+    )
+
+
+class ViajeListView(CacheModelosMixin, ListView):
     model = Viaje
+    modelos_cache = MODELOS_LISTADO
     template_name = 'viajes/viaje_list.html'
     context_object_name = 'viajes'
     paginate_by = 20
 
     def get_queryset(self):
-        return Viaje.objects.all().order_by('-fecha_salida')
+        self.filtro_form = ViajeFiltroForm(self.request.GET or None)
+        queryset = viajes_para_listado()
+        if self.filtro_form.is_valid():
+            queryset = filtrar_viajes(queryset, self.filtro_form.cleaned_data)
+        return queryset
 
+    def get_paginate_by(self, queryset):
+        # En modo cursor (?cursor=) no se usa la paginación por OFFSET
+        if 'cursor' in self.request.GET:
+            return None
+        return super().get_paginate_by(queryset)
 
-class ViajeDetailView(DetailView):
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['filtro_form'] = self.filtro_form
+        if 'cursor' in self.request.GET:
+            try:
+                viajes, siguiente, anterior = paginar_por_cursor(
+                    self.object_list, self.request.GET['cursor'], self.paginate_by
+                )
+            except CursorInvalido:
+                viajes, siguiente, anterior = paginar_por_cursor(
+                    self.object_list, None, self.paginate_by
+                )
+            context['viajes'] = context['object_list'] = viajes
+            context['modo_cursor'] = True
+            context['cursor_siguiente'] = siguiente
+            context['cursor_anterior'] = anterior
+        return context
+
+
+def _viaje_a_dict(viaje):
+    return {
+        'id': viaje.pk,
+        'bus': viaje.bus.placa if viaje.bus else None,
+        'capacidad': viaje.bus.capacidad_pasajeros if viaje.bus else None,
+        'conductor': f"{viaje.conductor.apellido}, {viaje.conductor.nombre}",
+        'origen': viaje.lugar_origen.nombre,
+        'destino': viaje.lugar_destino.nombre,
+        'fecha_salida': viaje.fecha_salida.isoformat(),
+        'estado': viaje.estado,
+        'pasajeros': viaje.num_pasajeros,
+    }
+
+
+@cache_por_modelos(*MODELOS_LISTADO)
+def viaje_list_json(request):
+    """
+    Variante JSON del listado de viajes con filtros y paginación por cursor.
+    """
+    filtro_form = ViajeFiltroForm(request.GET)
+    if not filtro_form.is_valid():
+        return JsonResponse({'errors': filtro_form.errors}, status=400)
+    queryset = filtrar_viajes(viajes_para_listado(), filtro_form.cleaned_data)
+    try:
+        viajes, siguiente, anterior = paginar_por_cursor(
+            queryset, request.GET.get('cursor'), ViajeListView.paginate_by
+        )
+    except CursorInvalido:
+        return JsonResponse({'error': 'Cursor inválido.'}, status=400)
+    return JsonResponse({
+        'results': [_viaje_a_dict(viaje) for viaje in viajes],
+        'next': siguiente,
+        'previous': anterior,
+    })
+
+
+class ViajeDetailView(CacheModelosMixin, DetailView):
     model = Viaje
+    modelos_cache = (Viaje,)
     template_name = 'viajes/viaje_detail.html'
     context_object_name = 'viaje'
 
@@ -105,9 +362,6 @@ class ViajeUpdateView(UpdateView):
         # Procesar costos dinámicos si existen en el POST
         if 'costos' in self.request.POST:
             try:
-                # Obtener o crear costos del viaje
-                costos_viaje, created = CostosViaje.objects.get_or_create(viaje=form.instance)
-                
                 # Procesar costos del formulario JavaScript
                 costos_data = self.request.POST.getlist('costos')
                 total_combustible = 0
@@ -122,8 +376,12 @@ class ViajeUpdateView(UpdateView):
                         total_otros += float(costo_str) if costo_str else 0
                 
                 # Actualizar costos (esto es temporal - Barbara debe definir la lógica)
-                costos_viaje.otros_costos = total_otros
-                costos_viaje.save()
+                # Se obtiene la fila bloqueada para no pisar el total de peajes,
+                # que se actualiza con deltas en la base de datos
+                with transaction.atomic():
+                    costos_viaje, created = CostosViaje.objects.select_for_update().get_or_create(viaje=form.instance)
+                    costos_viaje.otros_costos = total_otros
+                    costos_viaje.save()
                 
             except Exception as e:
                 messages.warning(self.request, f'Error al procesar costos: {str(e)}')
@@ -149,62 +407,292 @@ class ViajeDeleteView(DeleteView):
         return super().delete(request, *args, **kwargs)
 
 
+class ConflictosFiltroForm(forms.Form):
+    RECURSOS = [
+        ('', 'Bus y conductor'),
+        ('bus', 'Solo buses'),
+        ('conductor', 'Solo conductores'),
+    ]
+
+    desde = forms.DateField(
+        required=False,
+        widget=forms.DateInput(attrs={'class': 'form-control form-control-sm', 'type': 'date'})
+    )
+    hasta = forms.DateField(
+        required=False,
+        widget=forms.DateInput(attrs={'class': 'form-control form-control-sm', 'type': 'date'})
+    )
+    recurso = forms.ChoiceField(
+        required=False,
+        choices=RECURSOS,
+        widget=forms.Select(attrs={'class': 'form-select form-select-sm'})
+    )
+
+
+@cache_por_modelos(Viaje, Bus, Conductor, Lugar)
+def conflictos_view(request):
+    """
+    Reporte de buses y conductores con viajes superpuestos en toda la flota.
+    El barrido (viajes/conflictos.py) trae solo ids y fechas; bus, conductor
+    y lugares se cargan únicamente para la página que se muestra.
+    """
+    form = ConflictosFiltroForm(request.GET or None)
+    filtros = form.cleaned_data if form.is_valid() else {}
+    if not filtros.get('desde') and not filtros.get('hasta'):
+        # Por defecto, desde hoy: los conflictos que aún se pueden corregir
+        filtros = dict(filtros, desde=timezone.localdate())
+    desde = filtros.get('desde')
+    hasta = filtros.get('hasta')
+    conflictos = detectar_conflictos(
+        timezone.make_aware(datetime.combine(desde, time.min)) if desde else None,
+        timezone.make_aware(datetime.combine(hasta + timedelta(days=1), time.min)) if hasta else None,
+    )
+    if filtros.get('recurso'):
+        conflictos = [conflicto for conflicto in conflictos if conflicto.recurso == filtros['recurso']]
+
+    pagina = Paginator(conflictos, CONFLICTOS_POR_PAGINA).get_page(request.GET.get('page'))
+    viajes = Viaje.objects.select_related('bus', 'conductor', 'lugar_origen', 'lugar_destino').in_bulk(
+        {viaje for conflicto in pagina for viaje in (conflicto.viaje_a, conflicto.viaje_b)}
+    )
+    filas = []
+    for conflicto in pagina:
+        viaje_a, viaje_b = viajes[conflicto.viaje_a], viajes[conflicto.viaje_b]
+        filas.append({
+            'conflicto': conflicto,
+            'recurso': viaje_a.bus if conflicto.recurso == 'bus' else viaje_a.conductor,
+            'viaje_a': viaje_a,
+            'viaje_b': viaje_b,
+        })
+
+    context = {
+        'form': form,
+        'filas': filas,
+        'page_obj': pagina,
+        'total': len(conflictos),
+    }
+    return render(request, 'viajes/conflictos.html', context)
+
+
+class AsignacionForm(forms.Form):
+    desde = forms.DateField(widget=forms.DateInput(attrs={'class': 'form-control form-control-sm', 'type': 'date'}))
+    hasta = forms.DateField(widget=forms.DateInput(attrs={'class': 'form-control form-control-sm', 'type': 'date'}))
+    reasignar = forms.BooleanField(
+        required=False,
+        label='Reasignar también los viajes que ya tienen bus',
+        widget=forms.CheckboxInput(attrs={'class': 'form-check-input'})
+    )
+
+    def clean(self):
+        cleaned_data = super().clean()
+        desde, hasta = cleaned_data.get('desde'), cleaned_data.get('hasta')
+        if desde and hasta and hasta < desde:
+            self.add_error('hasta', 'La fecha final debe ser igual o posterior a la inicial.')
+        return cleaned_data
+
+    def rango(self):
+        # Días completos, con la fecha final incluida
+        return (
+            timezone.make_aware(datetime.combine(self.cleaned_data['desde'], time.min)),
+            timezone.make_aware(datetime.combine(self.cleaned_data['hasta'] + timedelta(days=1), time.min)),
+        )
+
+
+def _filas_asignacion(asignaciones, sin_asignar):
+    """
+    Datos para mostrar las primeras filas del plan: viajes, buses y
+    conductores se cargan con una consulta cada uno.
+    """
+    asignaciones = asignaciones[:ASIGNACIONES_EN_PANTALLA]
+    sin_asignar = sin_asignar[:ASIGNACIONES_EN_PANTALLA]
+    viajes = Viaje.objects.select_related('bus', 'conductor', 'lugar_origen', 'lugar_destino').in_bulk(
+        [a.viaje_id for a in asignaciones] + [viaje_id for viaje_id, _ in sin_asignar]
+    )
+    buses = Bus.objects.only('placa').in_bulk({a.bus_id for a in asignaciones})
+    conductores = Conductor.objects.only('nombre', 'apellido').in_bulk({a.conductor_id for a in asignaciones})
+    return (
+        [(a, viajes[a.viaje_id], buses[a.bus_id], conductores[a.conductor_id]) for a in asignaciones],
+        [(viajes[viaje_id], motivo) for viaje_id, motivo in sin_asignar],
+    )
+
+
+def asignacion_view(request):
+    """
+    Asignación automática de bus y conductor (viajes/asignacion.py). Con GET
+    muestra la vista previa del plan; con POST lo vuelve a calcular y lo
+    aplica solo si coincide con la huella de la vista previa enviada.
+    """
+    if request.method == 'POST':
+        form = AsignacionForm(request.POST)
+        if form.is_valid():
+            try:
+                with transaction.atomic():
+                    plan = planificar(*form.rango(), reasignar=form.cleaned_data['reasignar'])
+                    actualizados = aplicar(plan, huella=request.POST.get('huella', ''))
+            except (NumpyNoDisponible, PlanDesactualizado) as e:
+                messages.error(request, str(e))
+            else:
+                messages.success(
+                    request,
+                    f'Asignación aplicada: {actualizados} viaje(s) actualizados, '
+                    f'{len(plan.sin_asignar)} sin asignar.'
+                )
+            parametros = {campo: request.POST[campo] for campo in ('desde', 'hasta', 'reasignar') if campo in request.POST}
+            return redirect(f"{reverse('viajes:asignacion')}?{urlencode(parametros)}")
+    else:
+        hoy = timezone.localdate()
+        form = AsignacionForm(request.GET or None, initial={'desde': hoy, 'hasta': hoy + timedelta(days=6)})
+
+    context = {'form': form}
+    if form.is_bound and form.is_valid():
+        try:
+            plan = planificar(*form.rango(), reasignar=form.cleaned_data['reasignar'])
+        except NumpyNoDisponible as e:
+            messages.error(request, str(e))
+        else:
+            por_aplicar = cambios(plan)
+            filas, sin_asignar = _filas_asignacion(por_aplicar, plan.sin_asignar)
+            context.update({
+                'plan': plan,
+                'huella': huella_plan(plan),
+                'cambios': len(por_aplicar),
+                'filas': filas,
+                'sin_asignar': sin_asignar,
+                'limite': ASIGNACIONES_EN_PANTALLA,
+            })
+    return render(request, 'viajes/asignacion.html', context)
+
+
 # Vistas para manejar pasajeros en viajes
 def viaje_pasajeros_view(request, pk):
     """
     Vista para mostrar y manejar pasajeros de un viaje específico.
+    Los pasajeros disponibles se buscan bajo demanda con buscar_pasajeros_viaje.
     """
-    viaje = get_object_or_404(Viaje, pk=pk)
+    viaje = get_object_or_404(
+        Viaje.objects.select_related('bus', 'conductor', 'lugar_origen', 'lugar_destino'), pk=pk
+    )
     pasajeros_en_viaje = ViajePasajero.objects.filter(viaje=viaje).select_related('pasajero')
-    pasajeros_disponibles = Pasajero.objects.exclude(id__in=viaje.pasajeros.values_list('id', flat=True))
     
     context = {
         'viaje': viaje,
         'pasajeros_en_viaje': pasajeros_en_viaje,
-        'pasajeros_disponibles': pasajeros_disponibles,
     }
     return render(request, 'viajes/viaje_pasajeros.html', context)
 
 
+def buscar_pasajeros_viaje(request, pk):
+    """
+    Buscador (typeahead) de pasajeros que aún no están en el viaje.
+
+    Busca por prefijo de nombre_completo o RUT, ambos indexados, y excluye a los
+    inscritos con un NOT EXISTS (anti-join) en lugar de cargar sus ids.
+    """
+    viaje = get_object_or_404(Viaje.objects.only('id'), pk=pk)
+    q = request.GET.get('q', '').strip()
+    if not q:
+        return JsonResponse({'results': [], 'more': False})
+
+    inscritos = ViajePasajero.objects.filter(viaje=viaje, pasajero=OuterRef('pk'))
+    filas = list(
+        Pasajero.objects
+        .filter(Q(nombre_completo__istartswith=q) | Q(rut__istartswith=q))
+        .filter(~Exists(inscritos))
+        .order_by('nombre_completo', 'id')
+        .values('id', 'nombre_completo', 'rut')[:PASAJEROS_POR_BUSQUEDA + 1]
+    )
+    return JsonResponse({
+        'results': filas[:PASAJEROS_POR_BUSQUEDA],
+        'more': len(filas) > PASAJEROS_POR_BUSQUEDA,
+    })
+
+
 def agregar_pasajero_viaje(request, pk):
     """
     Vista para agregar un pasajero a un viaje.
     """
     if request.method == 'POST':
-        viaje = get_object_or_404(Viaje, pk=pk)
-        pasajero_id = request.POST.get('pasajero_id')
-        asiento = request.POST.get('asiento')
-        observaciones = request.POST.get('observaciones', '')
-        
+        viaje = get_object_or_404(Viaje.objects.select_related('bus'), pk=pk)
+        pasajero = get_object_or_404(Pasajero, pk=request.POST.get('pasajero_id'))
+
         try:
-            pasajero = get_object_or_404(Pasajero, pk=pasajero_id)
-            
-            # Verificar si el pasajero ya está en el viaje
-            if ViajePasajero.objects.filter(viaje=viaje, pasajero=pasajero).exists():
-                messages.error(request, f'El pasajero {pasajero.nombre_completo} ya está registrado en este viaje.')
+            reservar_asiento(
+                viaje,
+                pasajero,
+                asiento=request.POST.get('asiento'),
+                observaciones=request.POST.get('observaciones', '')
+            )
+            messages.success(request, f'Pasajero {pasajero.nombre_completo} agregado al viaje exitosamente.')
+        except ReservaError as e:
+            messages.error(request, str(e))
+
+    return redirect('viajes:viaje_pasajeros', pk=pk)
+
+
+def _leer_grupo(request):
+    """
+    Lee la lista (identificador, asiento) del grupo a inscribir, ya sea desde un
+    cuerpo JSON {"pasajeros": [{"pasajero": "...", "asiento": "..."}]} o desde
+    el textarea del formulario (una línea "RUT o id[, asiento]" por pasajero).
+    """
+    if request.content_type == 'application/json':
+        data = json.loads(request.body or '{}')
+        if not isinstance(data, dict):
+            raise ValueError('El cuerpo debe ser un objeto JSON.')
+        items = data.get('pasajeros', [])
+        observaciones = data.get('observaciones', '')
+        if not isinstance(items, list) or not isinstance(observaciones, str):
+            raise ValueError('Formato de pasajeros inválido.')
+        filas = []
+        for item in items:
+            if isinstance(item, dict):
+                asiento = item.get('asiento')
+                if not isinstance(asiento, (str, int, type(None))):
+                    raise ValueError('Formato de asiento inválido.')
+                filas.append((str(item.get('pasajero', '')).strip(), asiento))
             else:
-                # Verificar capacidad del bus
-                if viaje.get_pasajeros_count() >= viaje.bus.capacidad_pasajeros:
-                    messages.error(request, 'El bus ha alcanzado su capacidad máxima de pasajeros.')
-                else:
-                    ViajePasajero.objects.create(
-                        viaje=viaje,
-                        pasajero=pasajero,
-                        asiento=asiento,
-                        observaciones=observaciones
-                    )
-                    
-                    # Actualizar el contador de pasajeros confirmados
-                    viaje.pasajeros_confirmados = viaje.get_pasajeros_count()
-                    viaje.save()
-                    
-                    messages.success(request, f'Pasajero {pasajero.nombre_completo} agregado al viaje exitosamente.')
-                    
-        except Pasajero.DoesNotExist:
-            messages.error(request, 'Pasajero no encontrado.')
-        except Exception as e:
-            messages.error(request, f'Error al agregar pasajero: {str(e)}')
-    
+                filas.append((str(item).strip(), None))
+        return filas, observaciones
+
+    filas = []
+    for linea in request.POST.get('pasajeros', '').splitlines():
+        partes = [parte.strip() for parte in linea.replace(';', ',').replace('\t', ',').split(',')]
+        if partes[0]:
+            filas.append((partes[0], partes[1] if len(partes) > 1 else None))
+    return filas, request.POST.get('observaciones', '')
+
+
+def agregar_grupo_viaje(request, pk):
+    """
+    Vista para inscribir un grupo de pasajeros (curso, tour) en un viaje con
+    una sola validación de capacidad y una sola inserción masiva.
+    Responde JSON si la petición es JSON; si no, redirige con un mensaje.
+    """
+    es_json = request.content_type == 'application/json'
+    if request.method != 'POST':
+        return redirect('viajes:viaje_pasajeros', pk=pk)
+
+    viaje = get_object_or_404(Viaje.objects.select_related('bus'), pk=pk)
+    try:
+        filas, observaciones = _leer_grupo(request)
+        identificadores = [identificador for identificador, _ in filas]
+        pasajeros, no_encontrados = resolver_pasajeros(identificadores)
+        if no_encontrados:
+            raise ReservaError(f'Pasajeros no encontrados: {", ".join(no_encontrados)}.')
+        creados = reservar_grupo(
+            viaje,
+            [(pasajero, asiento) for pasajero, (_, asiento) in zip(pasajeros, filas)],
+            observaciones=observaciones
+        )
+    except (ReservaError, ValueError) as e:
+        mensaje = str(e) if isinstance(e, ReservaError) else 'Formato de datos inválido.'
+        if es_json:
+            return JsonResponse({'error': mensaje}, status=400)
+        messages.error(request, mensaje)
+        return redirect('viajes:viaje_pasajeros', pk=pk)
+
+    if es_json:
+        return JsonResponse({'inscritos': len(creados)}, status=201)
+    messages.success(request, f'{len(creados)} pasajeros agregados al viaje exitosamente.')
     return redirect('viajes:viaje_pasajeros', pk=pk)
 
 
@@ -215,22 +703,12 @@ def quitar_pasajero_viaje(request, pk, pasajero_pk):
     if request.method == 'POST':
         viaje = get_object_or_404(Viaje, pk=pk)
         pasajero = get_object_or_404(Pasajero, pk=pasajero_pk)
-        
-        try:
-            viaje_pasajero = ViajePasajero.objects.get(viaje=viaje, pasajero=pasajero)
-            viaje_pasajero.delete()
-            
-            # Actualizar el contador de pasajeros confirmados
-            viaje.pasajeros_confirmados = viaje.get_pasajeros_count()
-            viaje.save()
-            
+
+        if liberar_asiento(viaje, pasajero):
             messages.success(request, f'Pasajero {pasajero.nombre_completo} removido del viaje exitosamente.')
-            
-        except ViajePasajero.DoesNotExist:
+        else:
             messages.error(request, 'El pasajero no está registrado en este viaje.')
-        except Exception as e:
-            messages.error(request, f'Error al remover pasajero: {str(e)}')
-    
+
     return redirect('viajes:viaje_pasajeros', pk=pk)
 
 
@@ -246,9 +724,18 @@ def editar_pasajero_viaje(request, pk, pasajero_pk):
         asiento = request.POST.get('asiento')
         observaciones = request.POST.get('observaciones', '')
         
-        viaje_pasajero.asiento = asiento
+        try:
+            viaje_pasajero.asiento = normalizar_asiento(asiento)
+        except ReservaError as e:
+            messages.error(request, str(e))
+            return redirect('viajes:editar_pasajero_viaje', pk=pk, pasajero_pk=pasajero_pk)
         viaje_pasajero.observaciones = observaciones
-        viaje_pasajero.save()
+        try:
+            with transaction.atomic():
+                viaje_pasajero.save()
+        except IntegrityError:
+            messages.error(request, f'El asiento {viaje_pasajero.asiento} ya está asignado en este viaje.')
+            return redirect('viajes:editar_pasajero_viaje', pk=pk, pasajero_pk=pasajero_pk)
         
         messages.success(request, f'Información del pasajero {pasajero.nombre_completo} actualizada exitosamente.')
         return redirect('viajes:viaje_pasajeros', pk=pk)
@@ -266,7 +753,9 @@ def gestion_viaje_view(request, pk):
     """
     Vista para la gestión completa del viaje (Mockup 3)
     """
-    viaje = get_object_or_404(Viaje, pk=pk)
+    viaje = get_object_or_404(
+        Viaje.objects.select_related('bus', 'conductor', 'lugar_origen', 'lugar_destino'), pk=pk
+    )
     
     # Obtener o crear costos del viaje
     costos_viaje, created = CostosViaje.objects.get_or_create(viaje=viaje)
@@ -274,13 +763,17 @@ def gestion_viaje_view(request, pk):
     if request.method == 'POST':
         # Actualizar costos principales
         if 'combustible' in request.POST:
-            costos_viaje.combustible = request.POST.get('combustible', 0) or 0
-            costos_viaje.mantenimiento = request.POST.get('mantenimiento', 0) or 0
-            costos_viaje.otros_costos = request.POST.get('otros_costos', 0) or 0
-            costos_viaje.save()
+            # Se relee la fila bloqueada para no pisar el total de peajes,
+            # que se actualiza con deltas en la base de datos
+            with transaction.atomic():
+                costos_viaje = CostosViaje.objects.select_for_update().get(pk=costos_viaje.pk)
+                costos_viaje.combustible = request.POST.get('combustible', 0) or 0
+                costos_viaje.mantenimiento = request.POST.get('mantenimiento', 0) or 0
+                costos_viaje.otros_costos = request.POST.get('otros_costos', 0) or 0
+                costos_viaje.save()
             messages.success(request, 'Costos actualizados exitosamente.')
         
-        # Agregar peaje
+        # Agregar peaje (Peaje.save actualiza los totales de CostosViaje)
         elif request.POST.get('accion') == 'agregar_peaje':
             lugar = request.POST.get('lugar_peaje')
             monto = request.POST.get('monto_peaje')
@@ -291,31 +784,36 @@ def gestion_viaje_view(request, pk):
                     monto=monto,
                     fecha_pago=timezone.now()
                 )
-                # Actualizar total de peajes en costos
-                total_peajes = sum(peaje.monto for peaje in viaje.peajes.all())
-                costos_viaje.peajes = total_peajes
-                costos_viaje.save()
                 messages.success(request, f'Peaje en {lugar} agregado exitosamente.')
         
-        # Eliminar peaje
+        # Eliminar peaje (costos.signals descuenta el monto de los totales)
         elif request.POST.get('accion') == 'eliminar_peaje':
             peaje_id = request.POST.get('peaje_id')
             try:
                 peaje = Peaje.objects.get(id=peaje_id, viaje=viaje)
                 peaje.delete()
-                # Actualizar total de peajes en costos
-                total_peajes = sum(peaje.monto for peaje in viaje.peajes.all())
-                costos_viaje.peajes = total_peajes
-                costos_viaje.save()
                 messages.success(request, 'Peaje eliminado exitosamente.')
             except Peaje.DoesNotExist:
                 messages.error(request, 'Peaje no encontrado.')
         
         return redirect('viajes:gestion_viaje', pk=pk)
     
+    # Una sola consulta para la lista de peajes; la agrupación por lugar se hace en memoria
+    peajes = list(viaje.peajes.order_by('lugar', '-fecha_pago'))
+    peajes_por_zona = []
+    for lugar, grupo in groupby(peajes, key=attrgetter('lugar')):
+        grupo = list(grupo)
+        peajes_por_zona.append({
+            'grouper': lugar,
+            'list': grupo,
+            'subtotal': sum(peaje.monto for peaje in grupo),
+        })
+    
     context = {
         'viaje': viaje,
         'costos_viaje': costos_viaje,
+        'peajes': peajes,
+        'peajes_por_zona': peajes_por_zona,
         'titulo': f'Gestión de Viaje - {viaje.lugar_origen} -> {viaje.lugar_destino}'
     }
     return render(request, 'viajes/gestion_viaje.html', context)